@@ -0,0 +1,206 @@
+import hashlib
+import json
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .tasks import run_in_background
+
+# -------------------------------
+# Stale-while-revalidate cache with stampede protection
+# -------------------------------
+
+_MISSING = object()
+
+
+def _lock_key(key):
+    return f"{key}:lock"
+
+
+def _acquire_lock(key, timeout):
+    """Try to take the recompute lock for ``key``; returns a token or None."""
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(key), token, timeout):
+        return token
+    return None
+
+
+def _release_lock(key, token):
+    # Only drop the lock if it's still ours (it may have expired and been re-taken).
+    if cache.get(_lock_key(key)) == token:
+        cache.delete(_lock_key(key))
+
+
+def content_version(value):
+    """Short stable hash of a JSON-able value (changes only when the content does)."""
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _store(key, value, soft_ttl, hard_ttl, empty_ttl, short_lived):
+    if short_lived(value):
+        # Negative caching: remember empty/partial results, but not for long.
+        soft_ttl = hard_ttl = empty_ttl
+    # The version is hashed once per (re)compute so readers can build ETags
+    # without touching the value (get_or_refresh(with_version=True)).
+    entry = {"value": value, "fresh_until": time.time() + soft_ttl, "version": content_version(value)}
+    cache.set(key, entry, hard_ttl)
+    return entry
+
+
+def _refresh(key, token, compute, store_args):
+    try:
+        _store(key, compute(), *store_args)
+    finally:
+        _release_lock(key, token)
+
+
+def get_or_refresh(
+    key,
+    compute,
+    soft_ttl,
+    hard_ttl,
+    empty_ttl=60 * 5,
+    short_lived=None,
+    lock_timeout=30,
+    wait_timeout=10,
+    deadline=None,
+    on_timeout=None,
+    with_version=False,
+):
+    """
+    Return the cached value for ``key``, computing it with ``compute()`` if needed.
+
+    * Fresh (younger than ``soft_ttl``): returned as is.
+    * Stale (older than ``soft_ttl`` but within ``hard_ttl``): returned at once
+      while a single worker refreshes it in the background.
+    * Missing: one worker computes it under a lock; concurrent callers wait up
+      to ``wait_timeout`` seconds (never past ``deadline``, a time.monotonic()
+      value) for that result instead of recomputing. A caller whose wait runs
+      out returns ``on_timeout()`` if given, else computes the value itself.
+
+    Values for which ``short_lived(value)`` is true (empty results by default)
+    are cached too, but only for ``empty_ttl`` seconds.
+
+    With ``with_version`` the result is ``(value, version)``: the content
+    version stored alongside that very value (None for on_timeout()), so an
+    ETag built from it always matches the body.
+    """
+    short_lived = short_lived or (lambda value: not value)
+    store_args = (soft_ttl, hard_ttl, empty_ttl, short_lived)
+
+    def result(entry):
+        return (entry["value"], entry.get("version")) if with_version else entry["value"]
+
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() >= entry["fresh_until"]:
+            token = _acquire_lock(key, lock_timeout)
+            if token:
+                # Runs on the background pool, not the upstream pool: the values
+                # rebuilt here often fan out on the upstream pool themselves.
+                if not run_in_background(_refresh, key, token, compute, store_args):
+                    _release_lock(key, token)  # dropped: let a later read retry
+        return result(entry)
+
+    token = _acquire_lock(key, lock_timeout)
+    if token is None:
+        # Someone else is computing it: wait for their result.
+        if deadline is not None:
+            wait_timeout = min(wait_timeout, deadline - time.monotonic())
+        entry = _wait_for(key, wait_timeout)
+        if entry is not _MISSING:
+            return result(entry)
+        if on_timeout is not None:
+            return (on_timeout(), None) if with_version else on_timeout()
+        token = _acquire_lock(key, lock_timeout)
+
+    try:
+        return result(_store(key, compute(), *store_args))
+    finally:
+        if token:
+            _release_lock(key, token)
+
+
+def _wait_for(key, wait_timeout, interval=0.05):
+    give_up_at = time.monotonic() + wait_timeout
+    while time.monotonic() < give_up_at:
+        time.sleep(interval)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(_lock_key(key)) is None:
+            break  # the holder gave up without storing anything
+    return _MISSING
+
+
+# -------------------------------
+# Single-flight (request coalescing)
+# -------------------------------
+
+def single_flight(key, compute, wait_timeout=15, lock_timeout=60, result_ttl=30, on_timeout=None):
+    """
+    Make sure only one caller at a time runs ``compute()`` for ``key``.
+
+    The first caller takes a lock in the shared cache (so this holds across
+    worker processes when CACHES points at a shared backend), runs the work
+    and publishes the result for ``result_ttl`` seconds. Concurrent callers
+    wait up to ``wait_timeout`` seconds for that result; if it does not
+    arrive they call ``on_timeout()``, or run ``compute()`` themselves when
+    no ``on_timeout`` is given.
+    """
+    result_key = f"singleflight:{key}"
+    entry = cache.get(result_key)
+    if entry is not None:
+        return entry["value"]
+
+    token = _acquire_lock(result_key, lock_timeout)
+    if token is None:
+        entry = _wait_for(result_key, wait_timeout)
+        if entry is not _MISSING:
+            return entry["value"]
+        if on_timeout is not None:
+            return on_timeout()
+        return compute()
+
+    try:
+        value = compute()
+        cache.set(result_key, {"value": value}, result_ttl)
+        return value
+    finally:
+        _release_lock(result_key, token)
+
+
+# -------------------------------
+# Per-user library versions
+# -------------------------------
+# An opaque token that changes whenever a user's library changes. It is part
+# of the library ETag and of every cached library page key, so bumping it
+# invalidates both at once. Tokens are random rather than counters so a
+# version lost to cache eviction can never collide with one still in use.
+
+def _library_version_key(user_id):
+    return f"library_version:{user_id}"
+
+
+def library_version(user_id):
+    key = _library_version_key(user_id)
+    cache.add(key, uuid.uuid4().hex, None)
+    return cache.get(key)
+
+
+def bump_library_version(user_id):
+    cache.set(_library_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def bump_library_versions(user_ids):
+    """Invalidate the libraries of many users at once."""
+    if user_ids:
+        cache.set_many({_library_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+def library_page_key(user_id, version, url):
+    """Cache key for one rendered library/favorites page at a given version."""
+    url_hash = hashlib.blake2b(url.encode("utf-8"), digest_size=12).hexdigest()
+    return f"library_page:{user_id}:{version}:{url_hash}"
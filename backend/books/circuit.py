@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+
+# -------------------------------
+# Circuit breakers for upstream services
+# -------------------------------
+# One breaker per service (google_books, nyt, gemini) per process. It watches
+# a rolling window of call outcomes and opens once the error rate crosses a
+# threshold; while open, calls fail immediately with CircuitOpenError instead
+# of tying up a worker for the full timeout, and callers fall back to cached
+# or local data. After CIRCUIT_OPEN_SECONDS a single half-open probe is let
+# through: success closes the circuit, failure re-opens it.
+#
+# Each breaker also keeps recent latencies and derives the read timeout from
+# their p99, so a healthy upstream gets a tight timeout and a slow call is cut
+# off long before the static UPSTREAM_READ_TIMEOUT. Timed-out calls count as
+# a sample at the time they were given (the true latency is at least that),
+# so when the upstream slows down the timeout grows with it instead of
+# failing every call; the half-open probe always gets the full timeout.
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# What a timed-out call raises, unless a breaker is given its own types.
+TIMEOUT_ERRORS = (requests.Timeout, TimeoutError)
+
+
+class CircuitBreaker:
+    def __init__(self, name, max_timeout, timeout_errors=TIMEOUT_ERRORS):
+        self.name = name
+        self.max_timeout = max_timeout
+        # Exceptions meaning "gave up waiting": they record a latency sample.
+        self.timeout_errors = timeout_errors
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.outcomes = deque(maxlen=_setting("CIRCUIT_WINDOW", 50))
+        self.latencies = deque(maxlen=_setting("CIRCUIT_LATENCY_WINDOW", 200))
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now. A True in half-open state is the probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < _setting("CIRCUIT_OPEN_SECONDS", 30):
+                    return False
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, success, latency=None):
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            if self.state == HALF_OPEN:
+                self.probing = False
+                if success:
+                    self._transition(CLOSED)
+                    self.outcomes.clear()
+                else:
+                    self._open()
+                return
+            self.outcomes.append(success)
+            if not success and self.state == CLOSED and self._tripped():
+                self._open()
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def _tripped(self):
+        return (
+            len(self.outcomes) >= _setting("CIRCUIT_MIN_CALLS", 10)
+            and self.error_rate() >= _setting("CIRCUIT_FAILURE_RATE", 0.5)
+        )
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        if self.state == CLOSED:
+            print(f"Circuit '{self.name}' opened: error rate {self.error_rate():.0%}")
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        if state != self.state:
+            print(f"Circuit '{self.name}': {self.state} -> {state}")
+        self.state = state
+
+    def timeout(self):
+        """Read timeout: p99 of recent latencies times a margin, within bounds."""
+        with self._lock:
+            if self.state != CLOSED:
+                # Probing a recovering upstream: don't fail it on a stale p99.
+                return self.max_timeout
+            samples = sorted(self.latencies)
+        if len(samples) < _setting("CIRCUIT_MIN_LATENCY_SAMPLES", 20):
+            return self.max_timeout
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        adaptive = p99 * _setting("CIRCUIT_TIMEOUT_MULTIPLIER", 2.0)
+        return max(_setting("CIRCUIT_MIN_TIMEOUT", 1.0), min(adaptive, self.max_timeout))
+
+    def call(self, fn, *args, is_failure=None, **kwargs):
+        """
+        Run ``fn`` through the breaker. Exceptions count as failures; a result
+        for which ``is_failure(result)`` is true does too, but is still returned.
+        A timeout (one of ``timeout_errors``) also records how long the call
+        waited, as a lower bound on the upstream's latency.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except self.timeout_errors:
+            self.record(False, time.monotonic() - start)
+            raise
+        except Exception:
+            self.record(False)
+            raise
+        failed = bool(is_failure and is_failure(result))
+        # Quick error responses say nothing about how long a good answer takes.
+        self.record(not failed, None if failed else time.monotonic() - start)
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, max_timeout=None, timeout_errors=TIMEOUT_ERRORS):
+    """The process-wide breaker for ``name``, created on first use."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                if max_timeout is None:
+                    max_timeout = _setting("UPSTREAM_READ_TIMEOUT", 10)
+                breaker = _breakers[name] = CircuitBreaker(name, max_timeout, timeout_errors)
+    return breaker
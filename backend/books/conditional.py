@@ -0,0 +1,65 @@
+import hashlib
+
+from django.utils.cache import parse_etags, patch_cache_control, patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+# -------------------------------
+# ETag / conditional GET helpers
+# -------------------------------
+
+
+def make_etag(*parts):
+    """Strong ETag from cheap inputs (row fields, cache versions), not the rendered body."""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so W/"x" matches "x".
+    candidates = parse_etags(header)
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def add_validators(response, etag, vary=None, **cache_control):
+    response["ETag"] = etag
+    patch_cache_control(response, **cache_control)
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
+
+
+def conditional_response(request, etag, build, vary=None, **cache_control):
+    """
+    Answer 304 Not Modified when the client already has ``etag``; otherwise
+    call ``build()`` for the full Response. Either way the ETag and
+    Cache-Control headers are set, so unchanged resources skip both
+    serialization and the response body.
+    """
+    if etag is None:
+        return build()
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response  # errors carry no validators
+    return add_validators(response, etag, vary=vary, **cache_control)
+
+
+def content_conditional_response(request, build, vary=None, **cache_control):
+    """
+    conditional_response for when there is no cheap validator: the Response
+    is always built and the ETag is derived from its data, so a match saves
+    the body (and its serialization) but not the queries.
+    """
+    response = build()
+    if response.status_code != status.HTTP_200_OK:
+        return response
+    etag = make_etag("content", response.data)
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    return add_validators(response, etag, vary=vary, **cache_control)
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+
+from .models import Review, UserBookInteraction
+
+# -------------------------------
+# Streaming export of a user's data
+# -------------------------------
+# Rows come from a server-side cursor (QuerySet.iterator), are encoded a few
+# hundred at a time and handed to a StreamingHttpResponse, optionally through
+# an incremental gzip compressor. Nothing holds more than one chunk, so memory
+# stays flat however many rows the user has.
+
+LIBRARY_COLUMNS = ("google_id", "title", "authors", "status", "is_favorite")
+REVIEW_COLUMNS = ("google_id", "title", "authors", "rating", "comment", "created_at")
+
+# Multi-valued fields (authors) in CSV cells; same separator as import_catalog.
+LIST_SEPARATOR = "; "
+
+
+def _chunk_size():
+    return getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
+
+def library_rows(user):
+    """The user's shelf, oldest first, as dicts keyed by LIBRARY_COLUMNS."""
+    labels = dict(UserBookInteraction.Status.choices)
+    rows = (
+        UserBookInteraction.objects.filter(user=user)
+        .order_by("id")
+        .values_list("book_id", "book__title", "book__authors", "status", "is_favorite")
+    )
+    for google_id, title, authors, status, is_favorite in rows.iterator(chunk_size=_chunk_size()):
+        yield {
+            "google_id": google_id,
+            "title": title,
+            "authors": authors or [],
+            "status": labels.get(status),
+            "is_favorite": is_favorite,
+        }
+
+
+def review_rows(user):
+    """The user's reviews, oldest first, as dicts keyed by REVIEW_COLUMNS."""
+    rows = (
+        Review.objects.filter(user=user)
+        .order_by("id")
+        .values_list("book_id", "book__title", "book__authors", "rating", "comment", "created_at")
+    )
+    for google_id, title, authors, rating, comment, created_at in rows.iterator(chunk_size=_chunk_size()):
+        yield {
+            "google_id": google_id,
+            "title": title,
+            "authors": authors or [],
+            "rating": rating,
+            "comment": comment or "",
+            "created_at": created_at.isoformat(),
+        }
+
+
+EXPORTS = {
+    "library": (LIBRARY_COLUMNS, library_rows),
+    "reviews": (REVIEW_COLUMNS, review_rows),
+}
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(value)
+    if value is None:
+        return ""
+    return value
+
+
+def encode_csv(columns, rows, rows_per_chunk=500):
+    """UTF-8 CSV (header first) in chunks of ``rows_per_chunk`` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(row[column]) for column in columns])
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def encode_jsonl(columns, rows, rows_per_chunk=500):
+    """One JSON object per line, in chunks of ``rows_per_chunk`` rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        if len(lines) == rows_per_chunk:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines.clear()
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+ENCODERS = {
+    "csv": (encode_csv, "text/csv; charset=utf-8"),
+    "jsonl": (encode_jsonl, "application/x-ndjson"),
+}
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a byte stream incrementally into a single gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(user, kind, fmt, compress=False):
+    """(chunks, content_type) for one export; ``kind`` in EXPORTS, ``fmt`` in ENCODERS."""
+    columns, rows = EXPORTS[kind]
+    encode, content_type = ENCODERS[fmt]
+    chunks = encode(columns, rows(user))
+    if compress:
+        return gzip_stream(chunks), "application/gzip"
+    return chunks, content_type
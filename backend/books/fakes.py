@@ -0,0 +1,235 @@
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from requests.adapters import BaseAdapter
+
+from . import services, upstream
+from .models import Book, Review, UserBookInteraction
+
+# -------------------------------
+# Offline stand-ins for Google Books, NYT and Gemini
+# -------------------------------
+# Used by the bench_endpoints command and the query-budget tests so neither
+# touches the network. The HTTP fakes are mounted as a transport adapter on
+# the shared upstream session, so calls still go through upstream.get (circuit
+# breakers, metrics, response cache) exactly as in production; only the wire
+# is replaced. Latency and payload size are configurable.
+
+WORDS = (
+    "shadow river empire garden winter silent glass crown memory ocean "
+    "stone fire letter island secret north machine forest daughter city "
+    "night mirror storm light kingdom echo paper summer bridge star"
+).split()
+CATEGORIES = ["Fiction", "Fantasy", "Science Fiction", "History", "Romance", "Biography", "Science"]
+
+
+def fake_google_id(seed):
+    return f"fk{zlib.crc32(str(seed).encode('utf-8')):010d}"
+
+
+def fake_isbn13(google_id):
+    """A valid ISBN-13, stable per volume id."""
+    digits = f"978{zlib.crc32(google_id.encode('utf-8')) % 10**9:09d}"
+    return digits + services.isbn13_check_digit(digits)
+
+
+def fake_volume(google_id, description_words=120, isbn13=None):
+    """A Google Books volume resource shaped like the real API's."""
+    rng = random.Random(google_id)
+    return {
+        "kind": "books#volume",
+        "id": google_id,
+        "volumeInfo": {
+            "title": " ".join(rng.sample(WORDS, 3)).title(),
+            "authors": [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"],
+            "industryIdentifiers": [{"type": "ISBN_13", "identifier": isbn13 or fake_isbn13(google_id)}],
+            "publishedDate": str(rng.randint(1950, 2024)),
+            "categories": [rng.choice(CATEGORIES)],
+            "description": " ".join(rng.choice(WORDS) for _ in range(description_words)),
+            "imageLinks": {"thumbnail": f"http://books.google.com/books/content?id={google_id}&img=1"},
+            "averageRating": rng.choice([3.5, 4.0, 4.5]),
+        },
+    }
+
+
+def fake_nyt_book(rank):
+    return {
+        "rank": rank,
+        "title": f"BESTSELLER {rank}",
+        "author": "Famous Writer",
+        "book_image": f"https://storage.googleapis.com/du-prd/books/images/{rank}.jpg",
+        "description": "A short NYT blurb about the book.",
+        "amazon_product_url": f"https://www.amazon.com/dp/{rank:010d}",
+    }
+
+
+class FakeUpstreamAdapter(BaseAdapter):
+    """
+    Answers Google Books and NYT requests in-process after ``latency`` seconds.
+    Volume IDs starting with "missing" return 404 and "isbn:" searches for
+    ISBNs starting 979 find nothing; ``error_rate`` of calls return 503.
+    ``calls`` counts requests per service.
+    """
+
+    def __init__(self, latency=0.05, results=20, description_words=120, error_rate=0.0):
+        super().__init__()
+        self.latency = latency
+        self.results = results
+        self.description_words = description_words
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        service = upstream.service_for(request.url)
+        with self._lock:
+            self.calls[service] += 1
+        time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return self._response(request, 503, {"error": "fake outage"})
+
+        if url.path == "/books/v1/volumes":
+            query = parse_qs(url.query)
+            q = query.get("q", [""])[0]
+            limit = min(int(query.get("maxResults", [self.results])[0]), self.results)
+            if q.startswith("isbn:"):
+                isbn13 = q[len("isbn:"):]
+                items = [] if isbn13.startswith("979") else [
+                    fake_volume(fake_google_id(q), self.description_words, isbn13=isbn13)
+                ]
+                return self._response(request, 200, {"totalItems": len(items), "items": items})
+            items = [fake_volume(fake_google_id(f"{q}:{i}"), self.description_words) for i in range(limit)]
+            return self._response(request, 200, {"totalItems": len(items), "items": items})
+        if url.path.startswith("/books/v1/volumes/"):
+            google_id = url.path.rsplit("/", 1)[-1]
+            if google_id.startswith("missing"):
+                return self._response(request, 404, {"error": {"code": 404}})
+            return self._response(request, 200, fake_volume(google_id, self.description_words))
+        if url.path.startswith("/svc/books/v3/lists/"):
+            books = [fake_nyt_book(rank) for rank in range(1, 16)]
+            return self._response(request, 200, {"results": {"books": books}})
+        return self._response(request, 404, {"error": "unknown fake endpoint"})
+
+    def _response(self, request, status, payload):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(payload).encode("utf-8")
+        response.headers["Content-Type"] = "application/json; charset=UTF-8"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def fake_generative_model(latency=0.5, summary_words=150, calls=None):
+    """A stand-in for genai.GenerativeModel that sleeps, then returns lorem text."""
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name, **kwargs):
+            self.model_name = model_name
+
+        def generate_content(self, prompt, **kwargs):
+            if calls is not None:
+                calls["gemini"] += 1
+            time.sleep(latency)
+            text = " ".join(random.choice(WORDS) for _ in range(summary_words))
+            return mock.Mock(text=text.capitalize() + ".")
+
+    return FakeGenerativeModel
+
+
+@contextmanager
+def offline_upstreams(latency=0.05, gemini_latency=0.5, results=20, description_words=120,
+                      summary_words=150, error_rate=0.0):
+    """Route every Google Books, NYT and Gemini call to local fakes; yields the adapter."""
+    adapter = FakeUpstreamAdapter(latency, results, description_words, error_rate)
+    session = upstream.get_session()
+    original = session.adapters.copy()
+    for base_url in (upstream.GOOGLE_BOOKS_BASE_URL, upstream.NYT_BASE_URL):
+        session.mount(base_url, adapter)
+    model = fake_generative_model(gemini_latency, summary_words, adapter.calls)
+    try:
+        with mock.patch.object(services.genai, "GenerativeModel", model):
+            yield adapter
+    finally:
+        session.adapters = original
+
+
+# -------------------------------
+# Seed data
+# -------------------------------
+
+def seed_catalog(books=2000, users=50, library_size=200, reviews_per_book=3,
+                 password="bench-password", seed=0, batch_size=1000):
+    """
+    Bulk-create a catalogue, users with libraries and reviews. Returns
+    ``(book_ids, users)``; every user's password is ``password``.
+    """
+    rng = random.Random(seed)
+    book_ids = []
+    batch = []
+    for i in range(books):
+        google_id = fake_google_id(f"seed:{seed}:{i}")
+        info = fake_volume(google_id)["volumeInfo"]
+        book = Book(
+            google_id=google_id,
+            title=info["title"],
+            authors=info["authors"],
+            isbn13=info["industryIdentifiers"][0]["identifier"],
+            published_date=info["publishedDate"],
+            categories=info["categories"],
+            thumbnail_url=info["imageLinks"]["thumbnail"],
+            short_description=info["description"][:500],
+            view_count=rng.randint(0, 500),
+        )
+        # bulk_create bypasses Book.save(), which normally fills this in.
+        book.search_document = book.build_search_document()
+        batch.append(book)
+        book_ids.append(book.google_id)
+    Book.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+
+    User = get_user_model()
+    password_hash = make_password(password)  # hashed once: hashing per user dominates otherwise
+    User.objects.bulk_create(
+        [User(username=f"reader{seed}_{i}", email=f"reader{seed}_{i}@example.com", password=password_hash)
+         for i in range(users)],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    user_list = list(User.objects.filter(username__startswith=f"reader{seed}_").order_by("pk"))
+
+    statuses = [choice for choice, _ in UserBookInteraction.Status.choices]
+    interactions = [
+        UserBookInteraction(
+            user=user,
+            book_id=book_id,
+            status=rng.choice(statuses),
+            is_favorite=rng.random() < 0.2,
+        )
+        for user in user_list
+        for book_id in rng.sample(book_ids, min(library_size, len(book_ids)))
+    ]
+    UserBookInteraction.objects.bulk_create(interactions, batch_size=batch_size, ignore_conflicts=True)
+
+    reviews = [
+        Review(user=user, book_id=book_id, rating=rng.randint(1, 5), comment="Seeded review.")
+        for book_id in book_ids
+        for user in rng.sample(user_list, min(reviews_per_book, len(user_list)))
+    ]
+    Review.objects.bulk_create(reviews, batch_size=batch_size, ignore_conflicts=True)
+    services.recompute_rating_aggregates(book_ids)
+    return book_ids, user_list
@@ -0,0 +1,237 @@
+import csv
+import html
+import io
+import math
+import re
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .caching import bump_library_version
+from .models import LibraryImportJob, Review, UserBookInteraction
+from .services import normalize_isbn, recompute_rating_aggregates, resolve_books
+from .tasks import run_job
+
+# -------------------------------
+# Goodreads / StoryGraph shelf import
+# -------------------------------
+# The upload is parsed in the request into small entry dicts and handed to a
+# background job, which works through them in chunks: resolve the chunk to
+# Book ids (services.resolve_books: local DB first, then Google on the
+# upstream background pool), then bulk_create its interactions and reviews in
+# one transaction. Progress is kept in a LibraryImportJob row, so the client
+# can poll it from any worker; like every in-process task, a job stops if
+# its worker process dies (its updated_at then stops moving).
+
+Status = UserBookInteraction.Status
+
+# Both services name their exclusive shelves the same way.
+SHELF_STATUS = {
+    "to-read": Status.WANT_TO_READ,
+    "currently-reading": Status.READING,
+    "read": Status.READ,
+}
+FAVORITE_SHELVES = {"favorites", "favourites", "favorite", "favourite"}
+# Goodreads appends the series to titles: "Leviathan Wakes (The Expanse, #1)".
+SERIES_SUFFIX = re.compile(r"\s*\([^()]*#\s*\d+(?:\.\d+)?\)\s*$")
+# Unresolved rows listed in the job status (the count is always complete).
+UNRESOLVED_SHOWN = 50
+
+
+class ImportFormatError(ValueError):
+    """The upload isn't a shelf export we can read."""
+
+
+def _tags(value):
+    return {tag.strip().lower() for tag in (value or "").split(",") if tag.strip()}
+
+
+def _rating(value):
+    """A 1-5 star rating (StoryGraph allows quarter stars), or None if unrated."""
+    try:
+        stars = float(value)
+    except (TypeError, ValueError):
+        return None
+    if stars <= 0:
+        return None
+    return min(5, max(1, math.floor(stars + 0.5)))
+
+
+def _review_text(value):
+    text = re.sub(r"<br\s*/?>", "\n", value or "", flags=re.IGNORECASE)
+    return html.unescape(strip_tags(text)).strip() or None
+
+
+def goodreads_entry(row):
+    return {
+        "isbn13": normalize_isbn(row.get("ISBN13")) or normalize_isbn(row.get("ISBN")),
+        "title": SERIES_SUFFIX.sub("", row.get("Title") or "").strip(),
+        "author": (row.get("Author") or "").strip(),
+        "status": SHELF_STATUS.get((row.get("Exclusive Shelf") or "").strip().lower()),
+        "is_favorite": bool(FAVORITE_SHELVES & _tags(row.get("Bookshelves"))),
+        "rating": _rating(row.get("My Rating")),
+        "review": _review_text(row.get("My Review")),
+    }
+
+
+def storygraph_entry(row):
+    return {
+        # "ISBN/UID" holds StoryGraph's own id for books without an ISBN.
+        "isbn13": normalize_isbn(row.get("ISBN/UID")),
+        "title": (row.get("Title") or "").strip(),
+        "author": (row.get("Authors") or "").split(",")[0].strip(),
+        "status": SHELF_STATUS.get((row.get("Read Status") or "").strip().lower()),
+        "is_favorite": bool(FAVORITE_SHELVES & _tags(row.get("Tags"))),
+        "rating": _rating(row.get("Star Rating")),
+        "review": _review_text(row.get("Review")),
+    }
+
+
+def parse_shelf(upload, max_rows):
+    """
+    Read a Goodreads or StoryGraph CSV export (told apart by their columns).
+    Returns (source, entries); raises ImportFormatError for anything else.
+    """
+    text = io.TextIOWrapper(getattr(upload, "file", upload), encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        columns = set(reader.fieldnames or [])
+        if "Exclusive Shelf" in columns:
+            source, parse_row = "goodreads", goodreads_entry
+        elif "Read Status" in columns:
+            source, parse_row = "storygraph", storygraph_entry
+        else:
+            raise ImportFormatError("Not a Goodreads or StoryGraph library export.")
+        entries = []
+        for row in reader:
+            if len(entries) >= max_rows:
+                raise ImportFormatError(f"At most {max_rows} books per import.")
+            entries.append(parse_row(row))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFormatError(f"Could not read the file as CSV: {e}")
+    finally:
+        text.detach()  # leave the upload open for Django to clean up
+    return source, entries
+
+
+# -------------------------------
+# Jobs and progress
+# -------------------------------
+
+STATUS_FIELDS = (
+    "job_id", "source", "state", "total", "processed", "added", "already_in_library",
+    "reviews_added", "unresolved_count", "unresolved", "error",
+)
+
+
+def job_status(job):
+    """The JSON status of a LibraryImportJob, as returned by import/ and import/<job_id>/."""
+    status = {field: getattr(job, field) for field in STATUS_FIELDS}
+    status["updated_at"] = job.updated_at.isoformat()
+    return status
+
+
+def get_import_status(user_id, job_id):
+    job = LibraryImportJob.objects.filter(user_id=user_id, job_id=job_id).first()
+    return job_status(job) if job else None
+
+
+def start_import(user, source, entries):
+    """Queue the import of parsed ``entries`` for ``user``; returns the initial job status."""
+    # Status of finished imports is kept for a day; prune the user's old ones.
+    keep = getattr(settings, "LIBRARY_IMPORT_STATUS_TTL", 60 * 60 * 24)
+    LibraryImportJob.objects.filter(user=user, updated_at__lt=timezone.now() - timedelta(seconds=keep)).delete()
+    job = LibraryImportJob.objects.create(job_id=uuid.uuid4().hex, user=user, source=source, total=len(entries))
+    run_job(run_import, job.pk, entries)
+    # Inline (tests) the job has already finished by now.
+    job.refresh_from_db()
+    return job_status(job)
+
+
+def run_import(job_id, entries):
+    chunk_size = getattr(settings, "LIBRARY_IMPORT_CHUNK_SIZE", 200)
+    deadline_seconds = getattr(settings, "LIBRARY_IMPORT_RESOLVE_DEADLINE", 30)
+    job = LibraryImportJob.objects.get(pk=job_id)
+    job.state = LibraryImportJob.State.RUNNING
+    job.save()
+    seen = set()
+    try:
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start:start + chunk_size]
+            # Google lookups go to the small background pool, never the one
+            # interactive requests fan out on.
+            resolved = resolve_books(chunk, deadline=time.monotonic() + deadline_seconds, pool="background")
+            rows = []
+            for index, entry in enumerate(chunk):
+                google_id = resolved.get(index)
+                if google_id is None:
+                    job.unresolved_count += 1
+                    if len(job.unresolved) < UNRESOLVED_SHOWN:
+                        job.unresolved.append(
+                            {"row": start + index + 1, "title": entry["title"], "author": entry["author"]}
+                        )
+                elif google_id in seen:
+                    job.already_in_library += 1  # the same book twice in one export
+                else:
+                    seen.add(google_id)
+                    rows.append((google_id, entry))
+            import_chunk(job.user_id, rows, job)
+            job.processed = start + len(chunk)
+            job.save()
+        job.state = LibraryImportJob.State.DONE
+    except Exception as e:
+        print(f"Library import {job.job_id} failed: {e}")
+        job.state = LibraryImportJob.State.FAILED
+        job.error = "The import stopped unexpectedly; books added so far were kept."
+    job.save()
+
+
+def import_chunk(user_id, rows, job):
+    """Create the interactions and reviews for resolved (google_id, entry) rows."""
+    if not rows:
+        return
+    book_ids = [google_id for google_id, _ in rows]
+    with transaction.atomic():
+        # Books already on the shelf (or reviewed) keep what the user set here.
+        owned = set(
+            UserBookInteraction.objects.filter(user_id=user_id, book_id__in=book_ids)
+            .values_list("book_id", flat=True)
+        )
+        reviewed = set(
+            Review.objects.filter(user_id=user_id, book_id__in=book_ids).values_list("book_id", flat=True)
+        )
+        interactions = [
+            UserBookInteraction(
+                user_id=user_id, book_id=google_id, status=entry["status"], is_favorite=entry["is_favorite"]
+            )
+            for google_id, entry in rows
+            if google_id not in owned
+        ]
+        reviews = [
+            Review(user_id=user_id, book_id=google_id, rating=entry["rating"], comment=entry["review"])
+            for google_id, entry in rows
+            if entry["rating"] and google_id not in reviewed
+        ]
+        # ignore_conflicts: a concurrent write from the app wins over the import,
+        # so what was inserted is counted afterwards rather than assumed.
+        UserBookInteraction.objects.bulk_create(interactions, ignore_conflicts=True)
+        Review.objects.bulk_create(reviews, ignore_conflicts=True)
+        added = 0
+        if interactions:
+            added = UserBookInteraction.objects.filter(user_id=user_id, book_id__in=book_ids).count() - len(owned)
+        reviews_added = 0
+        if reviews:
+            reviews_added = Review.objects.filter(user_id=user_id, book_id__in=book_ids).count() - len(reviewed)
+        if reviews_added:
+            # Bulk inserts bypass apply_review_rating.
+            recompute_rating_aggregates({review.book_id for review in reviews})
+    if added or reviews_added:
+        bump_library_version(user_id)
+    job.added += added
+    job.already_in_library += len(rows) - added
+    job.reviews_added += reviews_added
@@ -0,0 +1,309 @@
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from books import response_cache, tasks
+from books.fakes import WORDS, offline_upstreams, seed_catalog
+
+PASSWORD = "bench-password"
+
+
+# -------------------------------
+# Scenarios: one request against a seeded, offline app
+# -------------------------------
+# Each takes (client, rng, data) and returns the response. ``data`` holds the
+# seeded book IDs, users and their access tokens.
+
+def _auth(rng, data):
+    user, token = rng.choice(data["tokens"])
+    return {"Authorization": f"Bearer {token}"}
+
+
+def search(client, rng, data):
+    # Mostly words from the seeded titles (local hits), sometimes unknown
+    # terms that fall back to the Google fake.
+    if rng.random() < 0.8:
+        q = " ".join(rng.sample(WORDS, 2))
+    else:
+        q = f"unknown{rng.randint(0, 10_000)}"
+    return client.get("/api/v1/search/", {"q": q})
+
+
+def details(client, rng, data):
+    google_id = rng.choice(data["book_ids"]) if rng.random() < 0.9 else f"new{rng.randint(0, 10_000)}"
+    return client.get(f"/api/v1/details/{google_id}/")
+
+
+def summary(client, rng, data):
+    return client.get(f"/api/v1/summary/{rng.choice(data['book_ids'])}/")
+
+
+def home(client, rng, data):
+    return client.get("/api/v1/home/")
+
+
+def library(client, rng, data):
+    return client.get("/api/v1/my-library/", headers=_auth(rng, data))
+
+
+def favorites(client, rng, data):
+    return client.get("/api/v1/favorites/", headers=_auth(rng, data))
+
+
+def reviews(client, rng, data):
+    return client.get(f"/api/v1/books/{rng.choice(data['book_ids'])}/reviews/")
+
+
+def auth_login(client, rng, data):
+    user, _ = rng.choice(data["tokens"])
+    return client.post(
+        "/api/v1/users/login/", {"username": user.username, "password": PASSWORD}, content_type="application/json"
+    )
+
+
+def auth_me(client, rng, data):
+    return client.get("/api/v1/users/me/", headers=_auth(rng, data))
+
+
+SCENARIOS = {
+    "search": search,
+    "details": details,
+    "summary": summary,
+    "home": home,
+    "library": library,
+    "favorites": favorites,
+    "reviews": reviews,
+    "auth-login": auth_login,
+    "auth-me": auth_me,
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_level(scenario, data, concurrency, total, seed):
+    """Fire ``total`` requests from ``concurrency`` threads; returns (latencies, errors, wall)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(index, count):
+        # Server errors are counted, not raised, so one failure doesn't end the run.
+        client = Client(raise_request_exception=False)
+        rng = random.Random(seed * 1000 + index)
+        mine, failed = [], 0
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                response = scenario(client, rng, data)
+                mine.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    failed += 1
+        finally:
+            connections.close_all()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    share, extra = divmod(total, concurrency)
+    threads = [
+        threading.Thread(target=worker, args=(i, share + (1 if i < extra else 0)))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), sum(errors), time.perf_counter() - start
+
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """
+    Rows that got slower (p50/p95/p99) or lost throughput beyond ``tolerance``,
+    or failed more requests than the baseline did. Latency changes under
+    ``min_delta_ms`` are noise, whatever the ratio.
+    """
+    regressions = []
+    for endpoint, levels in results.items():
+        for level, stats in levels.items():
+            base = baseline.get(endpoint, {}).get(level)
+            if not base:
+                continue
+            for metric in ("p50", "p95", "p99"):
+                slower = stats[metric] - base[metric]
+                if slower > min_delta_ms and stats[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{endpoint} @{level}: {metric} {stats[metric]:.1f} ms vs baseline {base[metric]:.1f} ms"
+                    )
+            if base["throughput"] and stats["throughput"] < base["throughput"] * (1 - tolerance):
+                regressions.append(
+                    f"{endpoint} @{level}: throughput {stats['throughput']:.1f}/s "
+                    f"vs baseline {base['throughput']:.1f}/s"
+                )
+            base_errors = base.get("errors", 0)
+            if stats["errors"] > base_errors:
+                regressions.append(f"{endpoint} @{level}: {stats['errors']} errors vs baseline {base_errors}")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API endpoints offline: a throwaway test database with seeded data, "
+        "local fakes for Google Books, NYT and Gemini, latency percentiles and throughput "
+        "per endpoint and concurrency level, and an optional regression check against a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoints", default=",".join(SCENARIOS), help="Comma-separated subset to run.")
+        parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint per level.")
+        parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per endpoint first.")
+        parser.add_argument("--books", type=int, default=5000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--library-size", type=int, default=300)
+        parser.add_argument("--reviews-per-book", type=int, default=3)
+        parser.add_argument("--upstream-latency", type=float, default=80, help="Google/NYT fake latency (ms).")
+        parser.add_argument("--gemini-latency", type=float, default=800, help="Gemini fake latency (ms).")
+        parser.add_argument("--results", type=int, default=20, help="Items per fake Google search.")
+        parser.add_argument("--description-words", type=int, default=120, help="Words per fake description.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline", help="Compare against this baseline JSON; exit non-zero on regression.")
+        parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression.")
+        parser.add_argument("--min-delta", type=float, default=1.0, help="Ignore latency changes below this (ms).")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        baseline = None
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+
+        workload = {
+            key: options[key]
+            for key in ("requests", "books", "users", "library_size", "reviews_per_book",
+                        "upstream_latency", "gemini_latency", "results", "description_words", "seed")
+        }
+        if baseline and baseline.get("workload") != workload:
+            self.stdout.write(self.style.WARNING("Baseline was recorded with a different workload."))
+
+        scratch = tempfile.TemporaryDirectory(prefix="bench-endpoints-")
+        default = connections["default"].settings_dict
+        if default["ENGINE"].endswith("sqlite3"):
+            # SQLite's shared in-memory test database locks whole tables under
+            # concurrent writers; a file database in WAL mode does not.
+            default["TEST"]["NAME"] = str(Path(scratch.name) / "bench.sqlite3")
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        if default["ENGINE"].endswith("sqlite3"):
+            with connections["default"].cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode=WAL")
+        try:
+            with override_settings(
+                UPSTREAM_CACHE_PATH=str(Path(scratch.name) / "upstream_cache.sqlite3"),
+                SIMILARITY_INDEX_DIR=str(Path(scratch.name) / "similarity"),
+                METRICS_SERVER_TIMING=False,
+            ):
+                response_cache._backend = None
+                cache.clear()
+                results = self.benchmark(names, levels, options)
+        finally:
+            tasks.wait_for_background(timeout=30)
+            connections.close_all()
+            response_cache._backend = None
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            scratch.cleanup()
+
+        if options["save_baseline"]:
+            Path(options["save_baseline"]).write_text(
+                json.dumps({"workload": workload, "results": results}, indent=2, sort_keys=True) + "\n"
+            )
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        if baseline:
+            regressions = compare(
+                results, baseline.get("results", {}), options["tolerance"], options["min_delta"]
+            )
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.ERROR(f"REGRESSION {line}"))
+                raise CommandError(f"{len(regressions)} regression(s) beyond {options['tolerance']:.0%}.")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def benchmark(self, names, levels, options):
+        started = time.perf_counter()
+        book_ids, users = seed_catalog(
+            books=options["books"],
+            users=options["users"],
+            library_size=options["library_size"],
+            reviews_per_book=options["reviews_per_book"],
+            password=PASSWORD,
+            seed=options["seed"],
+        )
+        data = {
+            "book_ids": book_ids,
+            "tokens": [(user, str(RefreshToken.for_user(user).access_token)) for user in users],
+        }
+        self.stdout.write(
+            f"Seeded {len(book_ids)} books, {len(users)} users in {time.perf_counter() - started:.1f}s "
+            f"({connections['default'].vendor})"
+        )
+
+        results = {}
+        with offline_upstreams(
+            latency=options["upstream_latency"] / 1000,
+            gemini_latency=options["gemini_latency"] / 1000,
+            results=options["results"],
+            description_words=options["description_words"],
+        ) as fake:
+            self.stdout.write(
+                f"{'endpoint':<12} {'conc':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'errors':>6}"
+            )
+            for name in names:
+                scenario = SCENARIOS[name]
+                if options["warmup"]:
+                    run_level(scenario, data, 1, options["warmup"], options["seed"])
+                results[name] = {}
+                for level in levels:
+                    latencies, errors, wall = run_level(
+                        scenario, data, level, options["requests"], options["seed"] + level
+                    )
+                    stats = {
+                        "p50": percentile(latencies, 50) * 1000,
+                        "p95": percentile(latencies, 95) * 1000,
+                        "p99": percentile(latencies, 99) * 1000,
+                        "throughput": len(latencies) / wall if wall else 0.0,
+                        "errors": errors,
+                    }
+                    results[name][str(level)] = stats
+                    self.stdout.write(
+                        f"{name:<12} {level:>4} {stats['p50']:>9.1f} {stats['p95']:>9.1f} "
+                        f"{stats['p99']:>9.1f} {stats['throughput']:>8.1f} {errors:>6}"
+                    )
+            self.stdout.write(f"Upstream calls: {dict(fake.calls)}")
+        return results
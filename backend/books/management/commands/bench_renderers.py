@@ -0,0 +1,103 @@
+import datetime
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from books.renderers import ORJSONRenderer, orjson
+
+
+def google_book(i, description_words=120):
+    return {
+        "google_id": f"vol{i:06d}",
+        "title": f"A Reasonably Long Book Title Number {i}",
+        "authors": ["First Author", "Second Author"],
+        "published_date": "2021-06-15",
+        "categories": ["Fiction", "Science Fiction"],
+        "thumbnail": f"http://books.google.com/books/content?id=vol{i:06d}&printsec=frontcover&img=1&zoom=1",
+        "description": " ".join(["Lorem ipsum dolor sit amet, consectetur adipiscing elit."] * (description_words // 8)),
+        "average_rating": 4.5,
+    }
+
+
+def nyt_book(i):
+    return {
+        "google_id": None,
+        "title": f"BESTSELLER {i}",
+        "authors": ["Famous Writer"],
+        "thumbnail": f"https://storage.googleapis.com/du-prd/books/images/{i}.jpg",
+        "description": "A short NYT blurb about the book.",
+        "amazon_url": f"https://www.amazon.com/dp/{i:010d}",
+        "rank": i + 1,
+    }
+
+
+def payloads():
+    """Payload shapes our endpoints actually return."""
+    now = datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    return {
+        "home": {
+            "carousel": [google_book(i) for i in range(6)],
+            "recent": [google_book(i) for i in range(10)],
+            "bestsellers": [nyt_book(i) for i in range(10)],
+        },
+        "search (20 long descriptions)": {"books": [google_book(i, 400) for i in range(20)]},
+        "library (1k rows)": {
+            "next": None,
+            "library": [
+                {
+                    "user": "reader",
+                    "book": {
+                        "google_id": f"vol{i:06d}",
+                        "title": f"Library Book {i}",
+                        "authors": ["Author"],
+                        "published_date": "2019",
+                        "thumbnail_url": None,
+                        "short_description": "Description " * 20,
+                    },
+                    "status": "RD",
+                    "is_favorite": i % 5 == 0,
+                }
+                for i in range(1000)
+            ],
+        },
+        "reviews (datetimes, Decimals)": {
+            "next": None,
+            "results": [
+                {"id": i, "rating": Decimal("4.0"), "comment": "Loved it.", "created_at": now}
+                for i in range(100)
+            ],
+        },
+    }
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare ORJSONRenderer with DRF's stock JSONRenderer on our payload shapes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; ORJSONRenderer falls back to stdlib json."))
+        stock, fast = JSONRenderer(), ORJSONRenderer()
+        for name, data in payloads().items():
+            if json.loads(stock.render(data)) != json.loads(fast.render(data)):
+                raise CommandError(f"Renderers disagree on the {name} payload.")
+            stock_time = best_of(options["repeat"], lambda: stock.render(data))
+            fast_time = best_of(options["repeat"], lambda: fast.render(data))
+            self.stdout.write(
+                f"{name:<32} stock {stock_time * 1e6:9.1f} us  orjson {fast_time * 1e6:8.1f} us  "
+                f"speedup {stock_time / fast_time:5.1f}x"
+            )
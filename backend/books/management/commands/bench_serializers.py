@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from books.models import Book, UserBookInteraction
+from books.serializers import (
+    BOOK_FIELDS,
+    UserBookInteractionSerializer,
+    interaction_rows_to_data,
+)
+
+
+def make_rows(count):
+    """In-memory library rows: model instances for DRF, .values()-style dicts for the fast path."""
+    user = get_user_model()(id=1, username="bench-user")
+    instances, rows = [], []
+    for i in range(count):
+        book = Book(
+            google_id=f"bench{i:06d}",
+            title=f"Benchmark Book {i}",
+            authors=["Author One", "Author Two"],
+            published_date="2020-01-01",
+            thumbnail_url=f"https://books.example.com/{i}.jpg",
+            short_description="A fairly typical description of a book. " * 8,
+        )
+        status = UserBookInteraction.Status.values[i % 3]
+        instances.append(
+            UserBookInteraction(id=i + 1, user=user, book=book, status=status, is_favorite=i % 4 == 0)
+        )
+        row = {"id": i + 1, "status": status, "is_favorite": i % 4 == 0}
+        row.update({f"book__{field}": getattr(book, field) for field in BOOK_FIELDS})
+        rows.append(row)
+    return user, instances, rows
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare UserBookInteractionSerializer with the fast .values() read path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        for count in options["rows"]:
+            user, instances, rows = make_rows(count)
+
+            drf_data = UserBookInteractionSerializer(instances, many=True).data
+            fast_data = interaction_rows_to_data(rows, user.username)
+            if json.dumps(drf_data) != json.dumps(fast_data):
+                raise CommandError(f"Fast path output differs from the serializer at {count} rows.")
+
+            drf = best_of(options["repeat"], lambda: UserBookInteractionSerializer(instances, many=True).data)
+            fast = best_of(options["repeat"], lambda: interaction_rows_to_data(rows, user.username))
+            self.stdout.write(
+                f"{count:>7} rows  serializer {drf * 1000:9.2f} ms  "
+                f"fast path {fast * 1000:8.2f} ms  speedup {drf / fast:6.1f}x"
+            )
+        self.stdout.write(self.style.SUCCESS("Outputs are identical."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from books.recommendations import build_neighbors
+
+
+class Command(BaseCommand):
+    help = "Rebuild item-item collaborative-filtering neighbours (BookNeighbor). Needs NumPy and SciPy."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=20, help="Neighbours kept per book.")
+        parser.add_argument(
+            "--block-size", type=int, default=1024,
+            help="Books per similarity block; bounds peak memory.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10_000, help="Rows per DB read/write batch.")
+        parser.add_argument("--min-score", type=float, default=0.01, help="Drop weaker neighbours.")
+
+    def handle(self, *args, **options):
+        written = build_neighbors(
+            top_k=options["top_k"],
+            block_size=options["block_size"],
+            chunk_size=options["chunk_size"],
+            min_score=options["min_score"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored {written} neighbour rows."))
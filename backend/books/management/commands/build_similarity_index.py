@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from books.similarity import build_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the content-based similar-books index (hashed TF-IDF, memory-mapped). Needs NumPy."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Books read per DB round trip.")
+
+    def handle(self, *args, **options):
+        count = build_index(chunk_size=options["chunk_size"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Similarity index built for {count} books."))
@@ -0,0 +1,69 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from books.models import Book
+from books.services import save_ai_summary
+
+
+class RateLimiter:
+    """Spaces calls evenly so no more than ``per_minute`` start in any minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+
+class Command(BaseCommand):
+    help = "Precompute Gemini summaries for the most-viewed books that don't have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Max books to summarize in this run.")
+        parser.add_argument("--workers", type=int, default=4, help="Concurrent Gemini requests.")
+        parser.add_argument("--rate", type=int, default=60, help="Max Gemini requests per minute.")
+
+    def handle(self, *args, **options):
+        books = list(
+            Book.objects.filter(ai_summary__isnull=True)
+            .order_by("-view_count", "google_id")
+            .only("google_id", "title", "authors")[: options["limit"]]
+        )
+        if not books:
+            self.stdout.write("No books need a summary.")
+            return
+
+        limiter = RateLimiter(options["rate"])
+
+        def summarize(book):
+            limiter.wait()
+            try:
+                return save_ai_summary(book)
+            finally:
+                connections.close_all()
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {executor.submit(summarize, book): book for book in books}
+            for future in as_completed(futures):
+                book = futures[future]
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Failed to summarize {book.google_id}: {e}")
+                if (done + failed) % 10 == 0:
+                    self.stdout.write(f"{done + failed}/{len(books)} processed")
+
+        self.stdout.write(self.style.SUCCESS(f"Summarized {done} books ({failed} failed)."))
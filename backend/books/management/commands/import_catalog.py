@@ -0,0 +1,316 @@
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries, transaction
+
+from books.models import Book
+from books.services import normalize_google_book, normalize_isbn, normalize_openlibrary_book, upsert_books
+
+FORMATS = ("jsonl", "csv", "ol-dump")
+SOURCES = ("auto", "google", "openlibrary", "flat")
+# Column separator for multi-valued fields (authors, categories) in flat CSVs.
+LIST_SEPARATOR = ";"
+# Open Library dump lines are "type \t key \t revision \t last_modified \t JSON".
+# Works and editions become books; authors are read for their names (books
+# only reference them by key); redirects, deletions, lists etc. are ignored.
+OL_BOOK_TYPES = (b"/type/work", b"/type/edition")
+OL_AUTHOR_TYPE = b"/type/author"
+
+TITLE_MAX = Book._meta.get_field("title").max_length
+ID_MAX = Book._meta.get_field("google_id").max_length
+DATE_MAX = Book._meta.get_field("published_date").max_length
+THUMBNAIL_MAX = Book._meta.get_field("thumbnail_url").max_length
+
+
+def guess_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".txt", ".tsv")):
+        return "ol-dump"
+    raise CommandError(f"Can't tell the format of {path}; pass --format.")
+
+
+class LineSource:
+    """Iterates lines of a binary stream, tracking the offset just past the last one read."""
+
+    def __init__(self, stream, offset=0):
+        self.stream = stream
+        self.offset = offset
+
+    def __iter__(self):
+        for line in self.stream:
+            self.offset += len(line)
+            yield line
+
+
+def remember_author(data, author_names):
+    try:
+        author = json.loads(data)
+    except ValueError:
+        return
+    if isinstance(author, dict) and author.get("key") and author.get("name"):
+        author_names[author["key"]] = author["name"]
+
+
+def scan_authors(stream, author_names, stop_at=None):
+    """Collect author names from an Open Library dump, up to byte ``stop_at``."""
+    offset = 0
+    for line in stream:
+        offset += len(line)
+        if line.startswith(OL_AUTHOR_TYPE + b"\t"):
+            remember_author(line.split(b"\t", 4)[-1], author_names)
+        if stop_at is not None and offset >= stop_at:
+            break
+
+
+def read_records(source, fmt, fieldnames=None, author_names=None):
+    """
+    Yield (record, offset) pairs; ``offset`` is where reading must resume to
+    continue after this record. Undecodable lines and JSON that isn't an
+    object yield (None, offset). In Open Library dumps only works and
+    editions are yielded; author records fill ``author_names`` on the way.
+    """
+    if fmt == "csv":
+        reader = csv.reader(line.decode("utf-8") for line in source)
+        for row in reader:
+            yield dict(zip(fieldnames, row)), source.offset
+        return
+    for line in source:
+        if fmt == "ol-dump":
+            parts = line.split(b"\t", 4)
+            if len(parts) < 5:
+                yield None, source.offset
+                continue
+            kind, line = parts[0], parts[4]
+            if kind == OL_AUTHOR_TYPE:
+                if author_names is not None:
+                    remember_author(line, author_names)
+                continue
+            if kind not in OL_BOOK_TYPES:
+                continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield (record if isinstance(record, dict) else None), source.offset
+
+
+def author_keys(record):
+    """Author keys of an Open Library work ({"author": {"key"}}) or edition ({"key"})."""
+    keys = []
+    for entry in record.get("authors") or []:
+        ref = entry.get("author", entry) if isinstance(entry, dict) else None
+        if isinstance(ref, dict) and ref.get("key"):
+            keys.append(ref["key"])
+    return keys
+
+
+def normalize_flat_row(row):
+    """A CSV row whose columns are the normalized fields (lists joined by ';')."""
+
+    def split(value):
+        return [part.strip() for part in (value or "").split(LIST_SEPARATOR) if part.strip()]
+
+    return {
+        "google_id": row.get("google_id") or row.get("id"),
+        "title": row.get("title") or "Unknown Title",
+        "authors": split(row.get("authors")),
+        "isbn13": normalize_isbn(row.get("isbn13") or row.get("isbn")),
+        "published_date": row.get("published_date") or row.get("publishedDate") or None,
+        "categories": split(row.get("categories")),
+        "thumbnail": row.get("thumbnail") or None,
+        "description": row.get("description") or None,
+    }
+
+
+def normalize_record(record, source, author_names=None):
+    """Normalized books in ``record`` (a Google search response holds several)."""
+    if source == "auto":
+        if "items" in record or "volumeInfo" in record:
+            source = "google"
+        elif str(record.get("key", "")).startswith("/"):
+            source = "openlibrary"
+        else:
+            source = "flat"
+    if source == "google":
+        items = record.get("items") if "items" in record else [record]
+        return [normalize_google_book(item) for item in items or []]
+    if source == "openlibrary":
+        if author_names and not record.get("author_name"):
+            names = [author_names[key] for key in author_keys(record) if key in author_names]
+            record = {**record, "author_name": names}
+        return [normalize_openlibrary_book(record)]
+    return [normalize_flat_row(record)]
+
+
+def clean(normalized):
+    """Fit a normalized book to the Book columns; None if it can't be stored."""
+    google_id = normalized.get("google_id")
+    if not google_id or len(google_id) > ID_MAX or not normalized.get("title"):
+        return None
+    normalized["title"] = normalized["title"][:TITLE_MAX]
+    if normalized.get("published_date"):
+        normalized["published_date"] = normalized["published_date"][:DATE_MAX]
+    if normalized.get("thumbnail") and len(normalized["thumbnail"]) > THUMBNAIL_MAX:
+        normalized["thumbnail"] = None
+    return normalized
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a catalog dump (Google Books volumes or Open Library records, as JSONL, CSV "
+        "or an Open Library .txt dump, optionally gzipped) into Book with batched upserts. "
+        "Progress is checkpointed after every batch, so an interrupted import resumes where it stopped. "
+        "Open Library books name their authors by key only: names come from author records earlier in "
+        "the same dump (the complete dump lists them first) or from --authors; otherwise authors stay empty."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Catalog file, or - for stdin (no checkpoints).")
+        parser.add_argument("--format", choices=FORMATS, help="Default: guessed from the file name.")
+        parser.add_argument("--source", choices=SOURCES, default="auto", help="Record schema (default: per record).")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Books upserted per statement.")
+        parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint).")
+        parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over.")
+        parser.add_argument("--limit", type=int, help="Stop after this many records (for trial runs).")
+        parser.add_argument("--progress-every", type=float, default=5, help="Seconds between progress lines.")
+        parser.add_argument(
+            "--authors",
+            help="Open Library authors dump (.txt[.gz]) to take author names from. Held in memory.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        from_stdin = path == "-"
+        fmt = options["format"] or ("jsonl" if from_stdin else guess_format(path))
+        checkpoint_path = None if from_stdin else (options["checkpoint"] or f"{path}.checkpoint")
+
+        state = {"offset": 0, "read": 0, "imported": 0, "skipped": 0, "fieldnames": None}
+        if not from_stdin:
+            if not os.path.isfile(path):
+                raise CommandError(f"No such file: {path}")
+            stat = os.stat(path)
+            state.update(size=stat.st_size, mtime=stat.st_mtime)
+            if checkpoint_path and os.path.exists(checkpoint_path) and not options["restart"]:
+                state = self.resume(checkpoint_path, state)
+
+        self.author_names = {}
+        if options["authors"]:
+            self.load_authors(options["authors"])
+        elif fmt == "ol-dump" and state["offset"]:
+            # Author records before the resume point were read last time.
+            self.load_authors(path, stop_at=state["offset"])
+
+        raw = sys.stdin.buffer if from_stdin else open(path, "rb")
+        try:
+            stream = gzip.GzipFile(fileobj=raw) if path.endswith(".gz") else raw
+            if state["offset"]:
+                stream.seek(state["offset"])
+            source = LineSource(stream, state["offset"])
+            if fmt == "csv" and state["fieldnames"] is None:
+                header = next(iter(source), b"")
+                state["fieldnames"] = next(csv.reader([header.decode("utf-8-sig")]), [])
+                state["offset"] = source.offset
+            finished = self.import_records(raw, source, fmt, state, checkpoint_path, options)
+        finally:
+            if raw is not sys.stdin.buffer:
+                raw.close()
+
+        summary = f"{state['read']} records read, {state['imported']} books upserted, {state['skipped']} skipped."
+        if not finished:
+            self.stdout.write(f"Stopped at --limit: {summary} Run again to continue.")
+            return
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(f"Done: {summary}"))
+        self.stdout.write("Run build_similarity_index to add the imported books to the similar-books index.")
+
+    def load_authors(self, path, stop_at=None):
+        if not os.path.isfile(path):
+            raise CommandError(f"No such file: {path}")
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as stream:
+            scan_authors(stream, self.author_names, stop_at)
+        self.stdout.write(f"{len(self.author_names)} author names loaded.")
+
+    def resume(self, checkpoint_path, state):
+        with open(checkpoint_path) as f:
+            saved = json.load(f)
+        if (saved.get("size"), saved.get("mtime")) != (state["size"], state["mtime"]):
+            raise CommandError(
+                f"{checkpoint_path} belongs to a different version of the input; pass --restart to start over."
+            )
+        self.stdout.write(f"Resuming after {saved['read']} records (byte {saved['offset']}).")
+        return saved
+
+    def import_records(self, raw, source, fmt, state, checkpoint_path, options):
+        """Upsert records batch by batch; returns False if stopped early by --limit."""
+        batch_size, limit = options["batch_size"], options["limit"]
+        started = last_report = time.monotonic()
+        read_at_start = state["read"]
+        batch = []
+        errors_shown = 0
+
+        def flush(offset):
+            if batch:
+                with transaction.atomic():
+                    state["imported"] += len(upsert_books(batch, index_similarity=False))
+                batch.clear()
+            state["offset"] = offset
+            if checkpoint_path:
+                self.save_checkpoint(checkpoint_path, state)
+            reset_queries()  # DEBUG keeps a query log per connection
+
+        offset = state["offset"]
+        for record, offset in read_records(source, fmt, state["fieldnames"], self.author_names):
+            state["read"] += 1
+            normalized = [] if record is None else normalize_record(record, options["source"], self.author_names)
+            cleaned = [book for book in map(clean, normalized) if book]
+            if not cleaned:
+                state["skipped"] += 1
+                if errors_shown < 10:
+                    errors_shown += 1
+                    self.stderr.write(f"Skipping unusable record #{state['read']}")
+            batch.extend(cleaned)
+
+            if len(batch) >= batch_size:
+                flush(offset)
+                now = time.monotonic()
+                if now - last_report >= options["progress_every"]:
+                    last_report = now
+                    self.report(raw, state, (state["read"] - read_at_start) / (now - started))
+            if limit and state["read"] - read_at_start >= limit:
+                flush(offset)
+                return False
+        flush(offset)
+        return True
+
+    def report(self, raw, state, rate):
+        progress = ""
+        if state.get("size"):
+            try:
+                progress = f" ({raw.tell() / state['size']:.1%} of input)"
+            except (OSError, ValueError):
+                pass
+        self.stdout.write(
+            f"{state['read']} read, {state['imported']} upserted, {state['skipped']} skipped"
+            f"{progress}, {rate:,.0f} records/s"
+        )
+
+    @staticmethod
+    def save_checkpoint(checkpoint_path, state):
+        tmp = f"{checkpoint_path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, checkpoint_path)
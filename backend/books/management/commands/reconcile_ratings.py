@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+from books.services import recompute_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute Book.average_rating and Book.review_count from Review rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Books updated per statement.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        book_ids = Book.objects.order_by("google_id").values_list("google_id", flat=True)
+        batch, updated = [], 0
+        for book_id in book_ids.iterator(chunk_size=batch_size):
+            batch.append(book_id)
+            if len(batch) >= batch_size:
+                updated += recompute_rating_aggregates(batch)
+                batch = []
+                self.stdout.write(f"{updated} books reconciled")
+        if batch:
+            updated += recompute_rating_aggregates(batch)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled ratings for {updated} books."))
@@ -0,0 +1,217 @@
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+# -------------------------------
+# Per-request performance instrumentation
+# -------------------------------
+# PerformanceMiddleware times every request and, through the hooks below,
+# the time it spent in the database (execute_wrapper), in each upstream
+# service (Google Books, NYT, Gemini) and in rendering the response. Totals
+# go into in-process histograms served in Prometheus text format at /metrics
+# and, optionally, into a Server-Timing header.
+#
+# Histograms are per process: scrape every worker (or run one per pod).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key))
+            sep = "," if labels else ""
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Total request latency.", ("endpoint", "method", "status")
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries", "SQL queries per request.", ("endpoint",), buckets=COUNT_BUCKETS
+)
+DB_DURATION = Histogram("http_request_db_duration_seconds", "Time in SQL per request.", ("endpoint",))
+SERIALIZATION_DURATION = Histogram(
+    "http_request_serialization_seconds", "Time rendering the response body.", ("endpoint",)
+)
+UPSTREAM_CALLS = Histogram(
+    "http_request_upstream_calls", "Upstream calls per request.", ("endpoint", "service"), buckets=COUNT_BUCKETS
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Latency of each upstream call.", ("service", "endpoint", "outcome")
+)
+HISTOGRAMS = (
+    REQUEST_DURATION,
+    DB_QUERIES,
+    DB_DURATION,
+    SERIALIZATION_DURATION,
+    UPSTREAM_CALLS,
+    UPSTREAM_DURATION,
+)
+
+
+class RequestStats:
+    """Timings accumulated while one request is handled (possibly from pool threads)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.upstream = {}  # service -> [calls, seconds]
+        self.endpoint = "unmatched"
+
+    def add_upstream(self, service, seconds):
+        with self.lock:
+            calls = self.upstream.setdefault(service, [0, 0.0])
+            calls[0] += 1
+            calls[1] += seconds
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+@contextmanager
+def track_upstream(service):
+    """Time one upstream call; recorded globally and against the current request."""
+    stats = _current.get()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        endpoint = stats.endpoint if stats else "background"
+        UPSTREAM_DURATION.observe(elapsed, service=service, endpoint=endpoint, outcome=outcome)
+        if stats is not None:
+            stats.add_upstream(service, elapsed)
+
+
+def record_serialization(seconds):
+    stats = _current.get()
+    if stats is not None:
+        with stats.lock:
+            stats.serialization_time += seconds
+
+
+class PerformanceMiddleware:
+    """Collects per-endpoint DB, upstream, serialization and total timings."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self._db_wrapper(stats)))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        endpoint = stats.endpoint
+        REQUEST_DURATION.observe(total, endpoint=endpoint, method=request.method, status=response.status_code)
+        DB_QUERIES.observe(stats.db_queries, endpoint=endpoint)
+        DB_DURATION.observe(stats.db_time, endpoint=endpoint)
+        SERIALIZATION_DURATION.observe(stats.serialization_time, endpoint=endpoint)
+        for service, (calls, _) in stats.upstream.items():
+            UPSTREAM_CALLS.observe(calls, endpoint=endpoint, service=service)
+
+        if getattr(settings, "METRICS_SERVER_TIMING", False):
+            response["Server-Timing"] = server_timing(stats, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Name the endpoint as soon as the URL is resolved so upstream calls
+        # made by the view are labelled with it too.
+        stats = _current.get()
+        if stats is not None and request.resolver_match:
+            stats.endpoint = request.resolver_match.view_name or "unmatched"
+        return None
+
+    @staticmethod
+    def _db_wrapper(stats):
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = time.perf_counter() - start
+                with stats.lock:
+                    stats.db_queries += 1
+                    stats.db_time += elapsed
+        return wrapper
+
+
+def server_timing(stats, total):
+    entries = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_queries} queries"']
+    for service, (calls, seconds) in sorted(stats.upstream.items()):
+        entries.append(f'{service};dur={seconds * 1000:.1f};desc="{calls} calls"')
+    entries.append(f"render;dur={stats.serialization_time * 1000:.1f}")
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this process's histograms. Off unless
+    METRICS_ENABLED; then scrapers need METRICS_TOKEN when one is set, or
+    else must connect from one of METRICS_ALLOWED_IPS.
+    """
+    if not getattr(settings, "METRICS_ENABLED", False):
+        raise Http404
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return HttpResponseForbidden()
+    elif request.META.get("REMOTE_ADDR") not in getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1")):
+        return HttpResponseForbidden()
+    body = "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
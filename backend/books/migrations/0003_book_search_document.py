@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:06
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+SEARCH_INDEX_NAME = "books_book_search_gin"
+
+
+def search_index():
+    # Must stay identical to the vector built in services.search_local_books,
+    # otherwise Postgres will not pick the index.
+    return GinIndex(SearchVector("search_document", config="english"), name=SEARCH_INDEX_NAME)
+
+
+def backfill_search_document(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    books = Book.objects.only("google_id", "title", "authors", "categories", "short_description")
+    batch = []
+    for book in books.iterator(chunk_size=1000):
+        parts = [book.title or ""]
+        parts.extend(book.authors or [])
+        parts.extend(book.categories or [])
+        parts.append(book.short_description or "")
+        book.search_document = " ".join(part for part in parts if part).lower()
+        batch.append(book)
+        if len(batch) >= 1000:
+            Book.objects.bulk_update(batch, ["search_document"])
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, ["search_document"])
+
+
+def create_search_index(apps, schema_editor):
+    # The GIN/tsvector index is Postgres only; other backends (SQLite in tests)
+    # fall back to a LIKE scan over search_document.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.add_index(apps.get_model("books", "Book"), search_index())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.remove_index(apps.get_model("books", "Book"), search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_book_average_rating_book_categories_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_document, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
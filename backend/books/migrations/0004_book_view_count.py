@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
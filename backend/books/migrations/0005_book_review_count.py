@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    # average_rating used to be unmaintained; rebuild it from our own reviews.
+    Book = apps.get_model("books", "Book")
+    Review = apps.get_model("books", "Review")
+    per_book = Review.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    Book.objects.update(
+        review_count=Coalesce(
+            Subquery(per_book.annotate(n=Count("id")).values("n")), Value(0)
+        ),
+        average_rating=Subquery(per_book.annotate(avg=Avg("rating")).values("avg")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_view_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
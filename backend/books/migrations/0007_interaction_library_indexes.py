@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_review_book_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookinteraction',
+            index=models.Index(fields=['user', '-id'], name='interaction_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookinteraction',
+            index=models.Index(fields=['user', 'is_favorite', '-id'], name='interaction_user_fav_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookinteraction',
+            index=models.Index(fields=['user', 'status', '-id'], name='interaction_user_status_idx'),
+        ),
+    ]
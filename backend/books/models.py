@@ -1,22 +1,73 @@
 from django.conf import settings
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import MinValueValidator, MaxValueValidator # ADDED import
 
+class BookQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """QuerySet.update that also invalidates libraries when shown fields change."""
+        if not set(kwargs) & set(Book.LIBRARY_FIELDS):
+            return super().update(**kwargs)
+        from .services import invalidate_libraries_for_books
+
+        book_ids = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        invalidate_libraries_for_books(book_ids)
+        return rows
+
+
 class Book(models.Model):
     google_id = models.CharField(max_length=100, unique=True, primary_key=True)
     title = models.CharField(max_length=255)
     authors = models.JSONField(default=list)  # store as list of strings
     published_date = models.CharField(max_length=20, null=True, blank=True)
+    # Normalized ISBN-13 (services.normalize_isbn); how imported shelves find their books.
+    isbn13 = models.CharField(max_length=13, null=True, blank=True, db_index=True)
     categories = models.JSONField(default=list, blank=True)
     thumbnail_url = models.URLField(max_length=500, null=True, blank=True)
     full_description = models.TextField(null=True, blank=True)
     short_description = models.TextField(null=True, blank=True)
     ai_summary = models.TextField(null=True, blank=True)
+    # Kept in step with our own Review rows (services.apply_review_rating);
+    # reconcile_ratings recomputes both from scratch.
     average_rating = models.FloatField(null=True, blank=True)
+    review_count = models.PositiveIntegerField(default=0)
+    # Detail page views; picks which books the summary pipeline handles first.
+    view_count = models.PositiveIntegerField(default=0)
+    # Denormalized text backing the full-text search index (see services.search_local_books).
+    search_document = models.TextField(blank=True, default="", editable=False)
+
+    SEARCH_SOURCE_FIELDS = ("title", "authors", "categories", "short_description")
+    # Shown in library/favorites payloads (BookSerializer.Meta.fields); writes
+    # to any of them invalidate the cached libraries holding the book.
+    LIBRARY_FIELDS = ("google_id", "title", "authors", "published_date", "thumbnail_url", "short_description")
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Case-insensitive title lookups when matching imported shelves.
+            models.Index(Lower("title"), name="book_title_lower_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
+    def build_search_document(self):
+        """Flatten the searchable fields into a single lowercase string."""
+        parts = [self.title or ""]
+        parts.extend(self.authors or [])
+        parts.extend(self.categories or [])
+        parts.append(self.short_description or "")
+        return " ".join(part for part in parts if part).lower()
+
+    def save(self, *args, **kwargs):
+        self.search_document = self.build_search_document()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(self.SEARCH_SOURCE_FIELDS):
+            kwargs["update_fields"] = set(update_fields) | {"search_document"}
+        super().save(*args, **kwargs)
+
 
 class UserBookInteraction(models.Model):
     class Status(models.TextChoices):
@@ -40,6 +91,13 @@ class UserBookInteraction(models.Model):
 
     class Meta:
         unique_together = ("user", "book")
+        indexes = [
+            # Keyset pagination (newest first) of a user's library, optionally
+            # filtered by favorite flag or reading status.
+            models.Index(fields=["user", "-id"], name="interaction_user_idx"),
+            models.Index(fields=["user", "is_favorite", "-id"], name="interaction_user_fav_idx"),
+            models.Index(fields=["user", "status", "-id"], name="interaction_user_status_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"
@@ -61,6 +119,61 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ("user", "book")
+        indexes = [
+            # Keyset pagination of a book's reviews, newest first.
+            models.Index(fields=["book", "-created_at", "-id"], name="review_book_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"Review for {self.book.title} by {self.user.username}"
+
+class BookNeighbor(models.Model):
+    """
+    Precomputed item-item collaborative-filtering neighbours (top-K per book by
+    cosine similarity over interactions and reviews). Rebuilt offline by the
+    build_recommendations command; read with one indexed lookup per request.
+    """
+    # Covered by the (book, rank) index below.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="neighbors", db_index=False)
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["book", "rank"], name="neighbor_book_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+class LibraryImportJob(models.Model):
+    """
+    Progress of one Goodreads/StoryGraph shelf import (books/library_import.py).
+    Kept in the database so whichever worker answers import/<job_id>/ sees it.
+    """
+    class State(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    job_id = models.CharField(max_length=32, primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="import_jobs")
+    source = models.CharField(max_length=20)
+    state = models.CharField(max_length=10, choices=State.choices, default=State.QUEUED)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    added = models.PositiveIntegerField(default=0)
+    already_in_library = models.PositiveIntegerField(default=0)
+    reviews_added = models.PositiveIntegerField(default=0)
+    unresolved_count = models.PositiveIntegerField(default=0)
+    # The first few unmatched rows: [{"row", "title", "author"}, ...].
+    unresolved = models.JSONField(default=list)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Review for {self.book.title} by {self.user.username}"
\ No newline at end of file
+        return f"{self.source} import {self.job_id} ({self.state})"
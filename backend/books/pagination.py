@@ -0,0 +1,132 @@
+import base64
+import json
+from datetime import date, datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique ordering tuple, e.g. ("-created_at", "-id").
+
+    Each page is fetched with a WHERE on the last row's key instead of an
+    OFFSET, so page N costs the same as page 1 when an index covers
+    ``ordering``. Unlike DRF's CursorPagination this compares the whole tuple,
+    so ties on the leading field never need an offset.
+    """
+
+    ordering = ("-id",)
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[: page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def after(self, position):
+        """WHERE clause selecting rows that sort strictly after ``position``."""
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal_so_far & Q(**{f"{name}__{lookup}": value})
+            equal_so_far &= Q(**{name: value})
+        return condition
+
+    def position_of(self, row):
+        values = []
+        for field in self.ordering:
+            value = row[field.lstrip("-")] if isinstance(row, dict) else getattr(row, field.lstrip("-"))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    def decode_cursor(self, request, model):
+        """
+        The position in the cursor, each value converted with its ordering
+        field's to_python. A cursor that doesn't decode to exactly that (it
+        was tampered with, or the ordering changed) is a 404, never a 500.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        values = []
+        for field, value in zip(self.ordering, position):
+            if value is None or isinstance(value, (list, dict)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                value = model._meta.get_field(field.lstrip("-")).to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            if isinstance(value, datetime) and settings.USE_TZ and value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)  # we only ever issue aware ones
+            values.append(value)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data, key="results"):
+        return Response({
+            "next": self.get_next_link(),
+            key: data,
+        })
+
+
+class ReviewCursorPagination(KeysetPagination):
+    """Newest reviews first; backed by the (book, -created_at, -id) index."""
+
+    ordering = ("-created_at", "-id")
+    page_size = getattr(settings, "REVIEWS_PAGE_SIZE", 20)
+
+
+class LibraryCursorPagination(KeysetPagination):
+    """Newest library entries first; backed by the (user, ..., -id) indexes."""
+
+    ordering = ("-id",)
+    page_size = getattr(settings, "LIBRARY_PAGE_SIZE", 50)
+    max_page_size = 200
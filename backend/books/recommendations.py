@@ -0,0 +1,173 @@
+from array import array
+
+from django.db import transaction
+
+from .models import BookNeighbor, Review, UserBookInteraction
+
+# -------------------------------
+# Item-item collaborative filtering
+# -------------------------------
+# Offline: build_neighbors() streams interactions and reviews into a sparse
+# user x book matrix, computes top-K cosine neighbours per book in column
+# blocks (so memory is bounded by the block, not the catalogue) and rewrites
+# the BookNeighbor table. Online: the views read that table with one indexed
+# query. NumPy/SciPy are only needed for the offline build.
+
+# Implicit feedback weight per interaction signal.
+STATUS_WEIGHTS = {
+    UserBookInteraction.Status.WANT_TO_READ: 0.5,
+    UserBookInteraction.Status.READING: 0.8,
+    UserBookInteraction.Status.READ: 1.0,
+}
+FAVORITE_WEIGHT = 1.0
+# A review shifts the weight by (rating - 3) * REVIEW_WEIGHT, so 1-2 stars
+# pull a book down and 4-5 stars push it up.
+REVIEW_WEIGHT = 0.5
+
+
+class _Ids:
+    """Dense integer ids for string/integer keys."""
+
+    def __init__(self):
+        self.index = {}
+        self.keys = []
+
+    def __call__(self, key):
+        idx = self.index.get(key)
+        if idx is None:
+            idx = self.index[key] = len(self.keys)
+            self.keys.append(key)
+        return idx
+
+
+def _load_matrix(chunk_size):
+    """Stream signals into COO arrays (compact typed arrays, not Python lists)."""
+    import numpy as np
+    from scipy import sparse
+
+    users, books = _Ids(), _Ids()
+    rows, cols, vals = array("i"), array("i"), array("f")
+
+    interactions = UserBookInteraction.objects.values_list("user_id", "book_id", "status", "is_favorite")
+    for user_id, book_id, status, is_favorite in interactions.iterator(chunk_size=chunk_size):
+        weight = STATUS_WEIGHTS.get(status, 0.0) + (FAVORITE_WEIGHT if is_favorite else 0.0)
+        if weight:
+            rows.append(users(user_id))
+            cols.append(books(book_id))
+            vals.append(weight)
+
+    reviews = Review.objects.values_list("user_id", "book_id", "rating")
+    for user_id, book_id, rating in reviews.iterator(chunk_size=chunk_size):
+        rows.append(users(user_id))
+        cols.append(books(book_id))
+        vals.append((rating - 3) * REVIEW_WEIGHT)
+
+    matrix = sparse.coo_matrix(
+        (
+            np.frombuffer(vals, dtype=np.float32),
+            (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32)),
+        ),
+        shape=(len(users.keys), len(books.keys)),
+    ).tocsc()  # duplicate (user, book) entries are summed here
+    matrix.data = np.maximum(matrix.data, 0)  # net-negative signals carry no similarity
+    matrix.eliminate_zeros()
+    return matrix, books.keys
+
+
+def _normalize_columns(matrix):
+    import numpy as np
+    from scipy import sparse
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    return (matrix @ sparse.diags(1.0 / norms)).tocsc()
+
+
+def iter_top_neighbors(matrix, top_k, block_size, min_score=0.0):
+    """
+    Yield (book_index, [(neighbor_index, score), ...]) with the ``top_k`` most
+    cosine-similar books, computing X^T X one block of columns at a time.
+    """
+    import numpy as np
+
+    normalized = _normalize_columns(matrix)
+    transposed = normalized.T.tocsr()
+    n_books = normalized.shape[1]
+    for start in range(0, n_books, block_size):
+        block = (transposed @ normalized[:, start:start + block_size]).tocsc()
+        for offset in range(block.shape[1]):
+            book = start + offset
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            indices, scores = block.indices[lo:hi], block.data[lo:hi]
+            keep = (indices != book) & (scores > min_score)
+            indices, scores = indices[keep], scores[keep]
+            if not len(indices):
+                continue
+            if len(indices) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                indices, scores = indices[best], scores[best]
+            order = np.argsort(-scores, kind="stable")
+            yield book, [(int(indices[i]), float(scores[i])) for i in order]
+
+
+def build_neighbors(top_k=20, block_size=1024, chunk_size=10_000, min_score=0.01, log=None):
+    """Recompute the whole BookNeighbor table. Returns the number of rows written."""
+    log = log or (lambda message: None)
+    matrix, book_ids = _load_matrix(chunk_size)
+    log(f"Loaded {matrix.nnz} signals for {matrix.shape[0]} users x {matrix.shape[1]} books")
+
+    written = 0
+    with transaction.atomic():
+        BookNeighbor.objects.all().delete()
+        batch = []
+        for book, neighbors in iter_top_neighbors(matrix, top_k, block_size, min_score):
+            for rank, (neighbor, score) in enumerate(neighbors, start=1):
+                batch.append(BookNeighbor(
+                    book_id=book_ids[book], neighbor_id=book_ids[neighbor], score=score, rank=rank
+                ))
+            if len(batch) >= chunk_size:
+                BookNeighbor.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+                log(f"{written} neighbour rows written")
+        BookNeighbor.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+# -------------------------------
+# Read side
+# -------------------------------
+
+def get_neighbors(google_id, limit=10):
+    """'Because you read X': the book's precomputed neighbours, best first."""
+    neighbors = (
+        BookNeighbor.objects.filter(book_id=google_id, rank__lte=limit)
+        .select_related("neighbor")
+        .order_by("rank")
+    )
+    return [(row.neighbor, row.score) for row in neighbors]
+
+
+def get_recommendations(user, limit=20, seeds=50):
+    """
+    Personalized feed: neighbours of the user's most recent books, scored by
+    summed similarity, excluding books already in the library.
+    """
+    owned = list(
+        UserBookInteraction.objects.filter(user=user)
+        .order_by("-id")
+        .values_list("book_id", flat=True)
+    )
+    if not owned:
+        return []
+    owned_ids = set(owned)
+    scores, books = {}, {}
+    neighbors = BookNeighbor.objects.filter(book_id__in=owned[:seeds]).select_related("neighbor")
+    for row in neighbors:
+        if row.neighbor_id in owned_ids:
+            continue
+        scores[row.neighbor_id] = scores.get(row.neighbor_id, 0.0) + row.score
+        books[row.neighbor_id] = row.neighbor
+    ranked = sorted(scores, key=lambda book_id: (-scores[book_id], book_id))[:limit]
+    return [(books[book_id], scores[book_id]) for book_id in ranked]
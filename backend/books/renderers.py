@@ -0,0 +1,74 @@
+import time
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import record_serialization
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to DRF's stdlib-json classes
+    orjson = None
+
+# -------------------------------
+# orjson-backed renderer / parser
+# -------------------------------
+# Faster versions of DRF's JSONRenderer / JSONParser. Types orjson does not
+# handle natively (Decimal, lazy translation strings, querysets, ...) and
+# datetimes go through DRF's own JSONEncoder.default, and U+2028/U+2029 are
+# escaped as DRF does, so compact output matches JSONRenderer byte for byte.
+# Payloads orjson refuses (integers wider than 64 bits, ...) are rendered by
+# JSONRenderer itself. Indented output differs in whitespace only. Without
+# orjson installed both classes behave like the stock ones.
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(obj):
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    # DRF-compatible datetime formatting ("Z" suffix, millisecond precision).
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return self._render(data, accepted_media_type, renderer_context)
+        finally:
+            record_serialization(time.perf_counter() - start)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context):
+            options |= orjson.OPT_INDENT_2
+        try:
+            ret = orjson.dumps(data, default=_default, option=options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Valid JSON but not valid JavaScript; JSONRenderer escapes them too.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson rejects NaN/Infinity, matching DRF's STRICT_JSON default.
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
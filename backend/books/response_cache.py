@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+# -------------------------------
+# Persistent upstream response cache
+# -------------------------------
+# Raw Google Books / NYT JSON responses are kept in a local SQLite file so every
+# worker process on the host shares them and they survive restarts and deploys.
+# The store is bounded: once it holds more than UPSTREAM_CACHE_MAX_ENTRIES rows,
+# the least recently used ones are evicted. Expired rows are kept for
+# UPSTREAM_CACHE_STALE_GRACE more seconds as a fallback while an upstream is
+# down (see lookup(allow_stale=True)).
+
+# Never part of the cache key: they identify us, not the response.
+SECRET_PARAMS = {"key", "api-key"}
+# Search text is case-insensitive upstream; IDs and list names are not.
+CASE_INSENSITIVE_PARAMS = {"q"}
+
+# last_access is only rewritten when older than this, so hot reads stay read-only.
+TOUCH_INTERVAL = 60
+# Run the eviction check once every this many writes.
+EVICT_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+def make_key(url, params=None):
+    """Stable key for a request: URL plus normalized, sorted query parameters."""
+    normalized = []
+    for name, value in sorted((params or {}).items()):
+        if name in SECRET_PARAMS or value is None:
+            continue
+        value = " ".join(str(value).split())
+        if name in CASE_INSENSITIVE_PARAMS:
+            value = value.lower()
+        normalized.append((name, value))
+    raw = json.dumps([url, normalized], separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed JSON cache, safe to share between processes (WAL mode)."""
+
+    def __init__(self, path, max_entries, stale_grace=0):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.stale_grace = stale_grace
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, allow_stale=False):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at, last_access FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, last_access = row
+        now = time.time()
+        if expires_at <= now:
+            if not allow_stale or expires_at + self.stale_grace <= now:
+                return None
+        if now - last_access > TOUCH_INTERVAL:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, separators=(",", ":")), now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop rows past their stale grace, then the least recently used ones beyond max_entries."""
+        conn = self._connection()
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time() - self.stale_grace,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = ResponseCache(
+                    settings.UPSTREAM_CACHE_PATH,
+                    getattr(settings, "UPSTREAM_CACHE_MAX_ENTRIES", 50_000),
+                    getattr(settings, "UPSTREAM_CACHE_STALE_GRACE", 0),
+                )
+    return _backend
+
+
+def enabled():
+    return getattr(settings, "UPSTREAM_CACHE_ENABLED", False) and getattr(
+        settings, "UPSTREAM_CACHE_PATH", None
+    )
+
+
+def lookup(url, params=None, allow_stale=False):
+    """
+    Cached JSON for this request, or None. Cache errors count as a miss.
+    ``allow_stale`` also returns expired entries still within the stale grace,
+    for use when the upstream itself has failed.
+    """
+    if not enabled():
+        return None
+    try:
+        return get_backend().get(make_key(url, params), allow_stale=allow_stale)
+    except sqlite3.Error as e:
+        print(f"Upstream cache read error: {e}")
+        return None
+
+
+def store(url, params, value, ttl):
+    """Remember ``value`` for this request for ``ttl`` seconds."""
+    if not enabled():
+        return
+    try:
+        get_backend().set(make_key(url, params), value, ttl)
+    except sqlite3.Error as e:
+        print(f"Upstream cache write error: {e}")
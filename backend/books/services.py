@@ -1,9 +1,35 @@
 import requests
 import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
 from django.core.cache import cache
-from .models import Book
+from django.db import connection
+from django.db.models import (
+    Avg,
+    Case,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Lower
+from . import response_cache, similarity, upstream
+from .caching import bump_library_versions, get_or_refresh, single_flight
+from .circuit import get_breaker
+from .metrics import track_upstream
+from .models import Book, Review, UserBookInteraction
+from .tasks import run_in_background
 
 # --- Configure Gemini ---
 try:
@@ -23,52 +49,102 @@ def search_google_books(query, max_results=20):
         "maxResults": max_results,
         "key": getattr(settings, "GOOGLE_BOOKS_API_KEY", None),
     }
+    cached = response_cache.lookup(url, params)
+    if cached is not None:
+        return cached
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except requests.RequestException as e:
         print(f"Google Books API Error: {e}")
-        return None
+        return response_cache.lookup(url, params, allow_stale=True)
+    response_cache.store(url, params, data, getattr(settings, "UPSTREAM_CACHE_TTL_SEARCH", 60 * 60 * 24))
+    return data
 
 # RENAMED and FIXED: This now correctly fetches raw API data.
 def fetch_google_book_by_id(google_id):
     """Get details for a specific book by Google ID from the API."""
     url = f"https://www.googleapis.com/books/v1/volumes/{google_id}"
     params = {"key": getattr(settings, "GOOGLE_BOOKS_API_KEY", None)}
+    cached = response_cache.lookup(url, params)
+    if cached is not None:
+        return cached
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except requests.RequestException as e:
         print(f"Google Books API Error fetching ID {google_id}: {e}")
-        return None
+        return response_cache.lookup(url, params, allow_stale=True)
+    response_cache.store(url, params, data, getattr(settings, "UPSTREAM_CACHE_TTL_VOLUME", 60 * 60 * 24 * 7))
+    return data
 
 def get_nyt_bestsellers(list_name="hardcover-fiction", limit=10):
     """Get NYT bestseller list."""
     # ... (rest of function is fine)
     url = f"https://api.nytimes.com/svc/books/v3/lists/current/{list_name}.json"
     params = {"api-key": getattr(settings, "NYT_BOOKS_API_KEY", None)}
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        print(f"NYT API Error: {e}")
-        return []
-    data = response.json()
+    data = response_cache.lookup(url, params)
+    if data is None:
+        try:
+            response = upstream.get(url, params=params)
+            response.raise_for_status()
+            data = response.json()
+        except requests.RequestException as e:
+            print(f"NYT API Error: {e}")
+            data = response_cache.lookup(url, params, allow_stale=True)
+            if data is None:
+                return []
+        else:
+            response_cache.store(url, params, data, getattr(settings, "UPSTREAM_CACHE_TTL_NYT", 60 * 60 * 6))
     return data.get("results", {}).get("books", [])[:limit]
 
 # -------------------------------
 # Normalizers (Google + NYT)
 # -------------------------------
 
+def normalize_isbn(value):
+    """
+    An ISBN-10 or ISBN-13 in any common spelling ("0-316-76917-7",
+    '="9780316769174"' from spreadsheet exports) as ISBN-13 digits, or None
+    if it isn't a valid ISBN.
+    """
+    digits = re.sub(r"[^0-9Xx]", "", str(value or "")).upper()
+    if len(digits) == 10:
+        if not digits[:9].isdigit():
+            return None
+        check = sum((10 - i) * (10 if c == "X" else int(c)) for i, c in enumerate(digits))
+        if check % 11:
+            return None
+        digits = "978" + digits[:9]
+        return digits + isbn13_check_digit(digits)
+    if len(digits) == 13 and digits.isdigit() and digits[-1] == isbn13_check_digit(digits[:12]):
+        return digits
+    return None
+
+def isbn13_check_digit(first12):
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+def _first_isbn(candidates):
+    for candidate in candidates:
+        isbn = normalize_isbn(candidate)
+        if isbn:
+            return isbn
+    return None
+
 def normalize_google_book(item):
     """Normalize Google Books API item into unified schema."""
     volume = item.get("volumeInfo", {})
+    identifiers = {
+        entry.get("type"): entry.get("identifier") for entry in volume.get("industryIdentifiers") or []
+    }
     return {
         "google_id": item.get("id"),
         "title": volume.get("title", "Unknown Title"),
         "authors": volume.get("authors", []),
+        "isbn13": _first_isbn([identifiers.get("ISBN_13"), identifiers.get("ISBN_10")]),
         "published_date": volume.get("publishedDate"),
         "categories": volume.get("categories", []),
         "thumbnail": (volume.get("imageLinks", {}) or {}).get("thumbnail"),
@@ -89,6 +165,39 @@ def normalize_nyt_book(item):
         "rank": item.get("rank"),
     }
 
+def normalize_openlibrary_book(record):
+    """
+    Normalize an Open Library record into unified schema. Accepts works and
+    editions from the bulk dumps as well as search.json docs. IDs are the
+    Open Library key prefixed with "ol:" so they never collide with Google's.
+    Dump records only reference their authors by key; callers that know the
+    names pass them in "author_name". A record without a title gets none,
+    so it is rejected rather than stored as "Unknown Title".
+    """
+    key = (record.get("key") or "").rsplit("/", 1)[-1]
+    description = record.get("description")
+    if isinstance(description, dict):
+        description = description.get("value")
+    authors = record.get("author_name") or [
+        author["name"] for author in record.get("authors", []) if isinstance(author, dict) and author.get("name")
+    ]
+    covers = [cover for cover in record.get("covers") or [record.get("cover_i")] if cover and cover > 0]
+    published = record.get("publish_date") or record.get("first_publish_date") or record.get("first_publish_year")
+    return {
+        "google_id": f"ol:{key}" if key else None,
+        "title": record.get("title"),
+        "authors": authors,
+        # Editions carry isbn_13/isbn_10; search.json docs a mixed "isbn" list.
+        "isbn13": _first_isbn(
+            (record.get("isbn_13") or []) + (record.get("isbn_10") or []) + (record.get("isbn") or [])
+        ),
+        "published_date": str(published) if published else None,
+        "categories": (record.get("subjects") or record.get("subject") or [])[:5],
+        "thumbnail": f"https://covers.openlibrary.org/b/id/{covers[0]}-M.jpg" if covers else None,
+        "description": description,
+        "average_rating": None,
+    }
+
 # -------------------------------
 # DB caching / get_or_create
 # -------------------------------
@@ -102,73 +211,416 @@ def get_or_create_book_details(google_id):
     try:
         return Book.objects.get(google_id=google_id)
     except Book.DoesNotExist:
-        data = fetch_google_book_by_id(google_id)
-        if not data:
-            return None
-
-        normalized_data = normalize_google_book(data)
-        
-        book, created = Book.objects.update_or_create(
-            google_id=google_id,
-            defaults={
-                "title": normalized_data.get("title", "Unknown Title"),
-                "authors": normalized_data.get("authors", []),
-                "published_date": normalized_data.get("published_date"),
-                "thumbnail_url": normalized_data.get("thumbnail"),
-                "short_description": normalized_data.get("description"),
-            }
+        # Concurrent requests for the same new book share one Google fetch.
+        return single_flight(
+            f"book_details:{google_id}",
+            lambda: _fetch_and_save_book(google_id),
+            wait_timeout=getattr(settings, "SINGLE_FLIGHT_WAIT_TIMEOUT", 15),
         )
+
+def _fetch_and_save_book(google_id):
+    # Another worker may have saved it while we were waiting for the lock.
+    book = Book.objects.filter(google_id=google_id).first()
+    if book:
         return book
 
+    data = fetch_google_book_by_id(google_id)
+    if not data:
+        return None
+
+    normalized_data = normalize_google_book(data)
+
+    # An update (not a create) invalidates libraries via the post_save signal.
+    book, created = Book.objects.update_or_create(
+        google_id=google_id,
+        defaults=book_defaults_from_normalized(normalized_data),
+    )
+    run_in_background(similarity.add_books, [book])
+    return book
+
+def book_defaults_from_normalized(normalized_data):
+    """Map a normalized Google book onto Book model fields."""
+    return {
+        "title": normalized_data.get("title", "Unknown Title"),
+        "authors": normalized_data.get("authors", []),
+        "isbn13": normalized_data.get("isbn13"),
+        "published_date": normalized_data.get("published_date"),
+        "categories": normalized_data.get("categories") or [],
+        "thumbnail_url": normalized_data.get("thumbnail"),
+        "short_description": normalized_data.get("description"),
+    }
+
+# Fields refreshed when a known book shows up again in Google results.
+# ai_summary and average_rating are ours and never overwritten.
+UPSERT_FIELDS = [
+    "title",
+    "authors",
+    "isbn13",
+    "published_date",
+    "categories",
+    "thumbnail_url",
+    "short_description",
+    "search_document",
+]
+
+# Book fields shown in library/favorites payloads (BookSerializer.Meta.fields).
+LIBRARY_BOOK_FIELDS = Book.LIBRARY_FIELDS
+
+def upsert_books(normalized_books, index_similarity=True):
+    """
+    Insert or refresh many normalized Google books in one statement.
+    Returns the saved Book objects keyed by google_id. Bulk imports pass
+    ``index_similarity=False`` and rebuild the similarity index afterwards.
+    """
+    books = {}
+    for normalized_data in normalized_books:
+        google_id = normalized_data.get("google_id")
+        if not google_id:
+            continue
+        book = Book(google_id=google_id, **book_defaults_from_normalized(normalized_data))
+        # bulk_create skips Book.save(), so build the search text here.
+        book.search_document = book.build_search_document()
+        books[google_id] = book  # one row per id, or ON CONFLICT would hit it twice
+    if not books:
+        return books
+
+    # Libraries render these fields; only rows where they change need invalidating.
+    existing = Book.objects.filter(google_id__in=books).values(*LIBRARY_BOOK_FIELDS)
+    changed = [
+        row["google_id"]
+        for row in existing
+        if any(row[field] != getattr(books[row["google_id"]], field) for field in LIBRARY_BOOK_FIELDS)
+    ]
+    # Rows are locked in the order given; a fixed order keeps two concurrent
+    # upserts of overlapping books from deadlocking each other on Postgres.
+    Book.objects.bulk_create(
+        [books[google_id] for google_id in sorted(books)],
+        update_conflicts=True,
+        unique_fields=["google_id"],
+        update_fields=UPSERT_FIELDS,
+    )
+    invalidate_libraries_for_books(changed)
+    if index_similarity:
+        run_in_background(similarity.add_books, list(books.values()))
+    return books
+
+def invalidate_libraries_for_books(book_ids):
+    """Bump the library version of every user who has one of these books."""
+    if not book_ids:
+        return
+    user_ids = set(
+        UserBookInteraction.objects.filter(book_id__in=book_ids).values_list("user_id", flat=True)
+    )
+    bump_library_versions(user_ids)
+
+def get_or_create_books(google_ids):
+    """
+    Batch version of get_or_create_book_details. Local hits come from one
+    query, misses are fetched from Google concurrently under a deadline and
+    saved in bulk. Returns Books in the requested order; ids that could not
+    be resolved are left out.
+    """
+    google_ids = list(dict.fromkeys(google_ids))
+    books = Book.objects.in_bulk(google_ids)
+
+    missing = [google_id for google_id in google_ids if google_id not in books]
+    if missing:
+        deadline = time.monotonic() + getattr(settings, "BOOK_BATCH_DEADLINE", 8)
+        fetched = upstream.gather(
+            {
+                google_id: (lambda google_id=google_id: fetch_google_book_by_id(google_id))
+                for google_id in missing
+            },
+            deadline,
+        )
+        normalized_books = []
+        for google_id, data in fetched.items():
+            if data:
+                normalized_data = normalize_google_book(data)
+                normalized_data["google_id"] = google_id
+                normalized_books.append(normalized_data)
+        books.update(upsert_books(normalized_books))
+
+    return [books[google_id] for google_id in google_ids if google_id in books]
+
+def _title_key(title):
+    return " ".join((title or "").lower().split())
+
+def _author_matches(author, authors):
+    """True if the author's surname appears in any of ``authors`` (or no author was given)."""
+    surname = (author or "").lower().split()[-1:]
+    return not surname or any(surname[0] in (name or "").lower() for name in authors)
+
+def _google_lookup(query):
+    data = search_google_books(query, max_results=1)
+    items = (data or {}).get("items") or []
+    return normalize_google_book(items[0]) if items else None
+
+def resolve_books(entries, deadline=None, pool="request"):
+    """
+    Match shelf entries ({"isbn13", "title", "author"}) to Book ids; returns
+    {index in entries: google_id}. Local rows are tried first, by ISBN and
+    then case-insensitive title (checked against the author), with one query
+    each for the whole batch. The rest are searched on Google concurrently on
+    the upstream ``pool`` (background jobs pass "background"), ISBN first and
+    title/author as a fallback, until ``deadline``; found volumes are
+    upserted. Entries still unmatched are left out.
+    """
+    resolved = {}
+    isbns = {entry["isbn13"] for entry in entries if entry.get("isbn13")}
+    by_isbn = dict(Book.objects.filter(isbn13__in=isbns).values_list("isbn13", "google_id")) if isbns else {}
+    for index, entry in enumerate(entries):
+        if entry.get("isbn13") in by_isbn:
+            resolved[index] = by_isbn[entry["isbn13"]]
+
+    titles = {_title_key(entry.get("title")) for i, entry in enumerate(entries) if i not in resolved} - {""}
+    if titles:
+        by_title = {}
+        rows = (
+            Book.objects.annotate(title_key=Lower("title"))
+            .filter(title_key__in=titles)
+            .values_list("title_key", "google_id", "authors")
+        )
+        for title_key, google_id, authors in rows:
+            by_title.setdefault(" ".join(title_key.split()), []).append((google_id, authors or []))
+        for index, entry in enumerate(entries):
+            if index in resolved:
+                continue
+            for google_id, authors in by_title.get(_title_key(entry.get("title")), []):
+                if _author_matches(entry.get("author"), authors):
+                    resolved[index] = google_id
+                    break
+
+    deadline = deadline or time.monotonic() + getattr(settings, "BOOK_BATCH_DEADLINE", 8)
+    found = {}
+    for field in ("isbn13", "title"):
+        queries = {}
+        for index, entry in enumerate(entries):
+            if index in resolved or index in found or not entry.get(field):
+                continue
+            if field == "isbn13":
+                queries[index] = f"isbn:{entry['isbn13']}"
+            else:
+                query = f'intitle:"{entry["title"]}"'
+                if entry.get("author"):
+                    query += f' inauthor:"{entry["author"]}"'
+                queries[index] = query
+        if not queries:
+            continue
+        # Rows repeating a query (same ISBN twice) share one call.
+        results = upstream.gather(
+            {query: (lambda query=query: _google_lookup(query)) for query in set(queries.values())},
+            deadline,
+            pool,
+        )
+        for index, query in queries.items():
+            if results.get(query) and results[query].get("google_id"):
+                found[index] = results[query]
+    if found:
+        upsert_books(found.values())
+        resolved.update((index, normalized["google_id"]) for index, normalized in found.items())
+    return resolved
+
+# -------------------------------
+# Full-text search (local index first, Google as fallback)
+# -------------------------------
+
+# Google query operators ("subject:Fantasy", "intitle:dune") mean nothing to the local index.
+GOOGLE_QUERY_OPERATORS = re.compile(r"\b(intitle|inauthor|inpublisher|subject|isbn|lccn|oclc):", re.IGNORECASE)
+
+# Columns projected with .values() for search results; no model instances
+# (or unused columns like full_description) on the hot path.
+SEARCH_RESULT_VALUES = (
+    "google_id",
+    "title",
+    "authors",
+    "published_date",
+    "categories",
+    "thumbnail_url",
+    "short_description",
+    "average_rating",
+)
+
+def book_to_search_result(row):
+    """Render a SEARCH_RESULT_VALUES row in the same shape as normalize_google_book."""
+    return {
+        "google_id": row["google_id"],
+        "title": row["title"],
+        "authors": row["authors"],
+        "published_date": row["published_date"],
+        "categories": row["categories"],
+        "thumbnail": row["thumbnail_url"],
+        "description": row["short_description"],
+        "average_rating": row["average_rating"],
+    }
+
+def search_local_books(query, limit=20):
+    """
+    Search the Book table. Uses the tsvector/GIN index on Postgres and a
+    LIKE scan over search_document elsewhere.
+    """
+    text = GOOGLE_QUERY_OPERATORS.sub(" ", query).strip()
+    if not text:
+        return []
+
+    if connection.vendor == "postgresql":
+        # Keep this expression in sync with the index in migration 0003.
+        vector = SearchVector("search_document", config="english")
+        search_query = SearchQuery(text, config="english", search_type="websearch")
+        books = (
+            Book.objects.annotate(search=vector)
+            .filter(search=search_query)
+            .annotate(rank=SearchRank(vector, search_query))
+            .order_by("-rank", "title")
+        )
+    else:
+        terms = re.findall(r"\w+", text.lower())
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            condition &= Q(search_document__contains=term)
+        books = Book.objects.filter(condition).order_by("title")
+
+    return [book_to_search_result(row) for row in books.values(*SEARCH_RESULT_VALUES)[:limit]]
+
+def search_books(query, max_results=20):
+    """
+    Answer a search from the local index, falling back to Google Books only
+    when local recall is below BOOK_SEARCH_MIN_LOCAL_RESULTS. Google results
+    are upserted into Book so the next identical search stays local.
+    """
+    books = search_local_books(query, limit=max_results)
+    min_local = getattr(settings, "BOOK_SEARCH_MIN_LOCAL_RESULTS", 5)
+    if len(books) >= min(min_local, max_results):
+        return books
+
+    data = search_google_books(query, max_results=max_results)
+    items = data.get("items", []) if data else []
+    if not items:
+        return books
+
+    remote_books = [normalize_google_book(item) for item in items]
+    # Write-through off the response path: later searches hit the local index
+    # and detail pages for these books need no upstream call.
+    run_in_background(upsert_books, remote_books)
+
+    seen = {book["google_id"] for book in books}
+    for normalized in remote_books:
+        if normalized["google_id"] not in seen:
+            seen.add(normalized["google_id"])
+            books.append(normalized)
+    return books[:max_results]
+
 # -------------------------------
 # High-level business logic (with caching)
 # -------------------------------
 
+HOME_GENRES = ["Science Fiction", "Science", "History", "Biography", "Fantasy", "Romance"]
+
+def home_feed_deadline():
+    """Absolute time.monotonic() deadline for one home feed build."""
+    return time.monotonic() + getattr(settings, "HOME_FEED_DEADLINE", 8)
+
+# Home feed caches: fresh for 6 hours, then served stale for up to a day
+# while one worker refreshes them in the background.
+HOME_FEED_SOFT_TTL = 60 * 60 * 6
+HOME_FEED_HARD_TTL = 60 * 60 * 24
+
 # ADDED: Caching for performance
-def get_genre_top_books(limit=10):
-    """Get top book from each genre (Google Books), with caching."""
-    cache_key = "genre_top_books"
-    cached_books = cache.get(cache_key)
-    if cached_books:
-        return cached_books
-
-    genres = ["Science Fiction", "Science", "History", "Biography", "Fantasy", "Romance"]
+def get_genre_top_books(limit=10, deadline=None, with_version=False):
+    """
+    Get top book from each genre (Google Books), with caching.
+    Genres are fetched concurrently; any genre that misses the deadline is left out.
+    ``with_version`` returns ``(books, content_version)`` (see get_or_refresh).
+    """
+    genres = HOME_GENRES[:limit]
+    return get_or_refresh(
+        "genre_top_books",
+        lambda: _fetch_genre_top_books(genres, deadline),
+        soft_ttl=HOME_FEED_SOFT_TTL,
+        hard_ttl=HOME_FEED_HARD_TTL,
+        # Don't pin an incomplete carousel for the full 6 hours.
+        short_lived=lambda books: len(books) < len(genres),
+        deadline=deadline,
+        on_timeout=list,
+        with_version=with_version,
+    )
+
+def _fetch_genre_top_books(genres, deadline=None):
+    if deadline is None or deadline <= time.monotonic():
+        # Background refreshes outlive the request that triggered them.
+        deadline = home_feed_deadline()
+    results = upstream.gather(
+        {
+            genre: (lambda genre=genre: search_google_books(f"subject:{genre}", max_results=1))
+            for genre in genres
+        },
+        deadline,
+    )
     books = []
-    for genre in genres[:limit]:
-        data = search_google_books(f"subject:{genre}", max_results=1)
-        if data and "items" in data:
+    for genre in genres:
+        data = results.get(genre)
+        if data and data.get("items"):
             books.append(normalize_google_book(data["items"][0]))
-    
-    cache.set(cache_key, books, 60 * 60 * 6)  # Cache for 6 hours
     return books
 
 # ADDED: Caching for performance
-def get_recent_books(limit=10):
+def get_recent_books(limit=10, deadline=None, with_version=False):
     """Get recently published books (Google Books), with caching."""
-    cache_key = "recent_books"
-    cached_books = cache.get(cache_key)
-    if cached_books:
-        return cached_books
-    
+    return get_or_refresh(
+        "recent_books",
+        lambda: _fetch_recent_books(limit),
+        soft_ttl=HOME_FEED_SOFT_TTL,
+        hard_ttl=HOME_FEED_HARD_TTL,
+        deadline=deadline,
+        on_timeout=list,
+        with_version=with_version,
+    )
+
+def _fetch_recent_books(limit):
     data = search_google_books("newest", max_results=limit)
     if not data:
         return []
-    books = [normalize_google_book(item) for item in data.get("items", [])]
-    cache.set(cache_key, books, 60 * 60 * 6)  # Cache for 6 hours
-    return books
+    return [normalize_google_book(item) for item in data.get("items", [])]
 
 # ADDED: Caching for performance
-def get_bestsellers(limit=10):
+def get_bestsellers(limit=10, deadline=None, with_version=False):
     """Get bestseller books (NYT), with caching."""
-    cache_key = "bestsellers"
-    cached_books = cache.get(cache_key)
-    if cached_books:
-        return cached_books
-
-    books_data = get_nyt_bestsellers(limit=limit)
-    books = [normalize_nyt_book(item) for item in books_data]
-    cache.set(cache_key, books, 60 * 60 * 6)  # Cache for 6 hours
-    return books
+    return get_or_refresh(
+        "bestsellers",
+        lambda: [normalize_nyt_book(item) for item in get_nyt_bestsellers(limit=limit)],
+        soft_ttl=HOME_FEED_SOFT_TTL,
+        hard_ttl=HOME_FEED_HARD_TTL,
+        deadline=deadline,
+        on_timeout=list,
+        with_version=with_version,
+    )
+
+def get_home_feed(limit=10):
+    """
+    Build the home page sections concurrently under a single deadline.
+    A section that misses the deadline comes back empty, including one still
+    being built by another request.
+
+    Returns ``(feed, versions)``: the content version of each section as it
+    was served, or None for ``versions`` if any section missed the deadline.
+    """
+    deadline = home_feed_deadline()
+    pending = upstream.submit({
+        "recent": lambda: get_recent_books(limit=limit, deadline=deadline, with_version=True),
+        "bestsellers": lambda: get_bestsellers(limit=limit, deadline=deadline, with_version=True),
+    })
+    # The genre carousel fans out on the same pool, so run its driver here
+    # rather than nesting it inside another pool task.
+    sections = {"carousel": get_genre_top_books(limit=limit, deadline=deadline, with_version=True)}
+    sections.update(upstream.collect(pending, deadline))
+    feed, versions = {}, []
+    for name in ("carousel", "recent", "bestsellers"):
+        value, version = sections.get(name, ([], None))
+        feed[name] = value
+        versions.append(version)
+    return feed, (versions if all(versions) else None)
 
 # -------------------------------
 # AI Summary (Gemini / caching)
@@ -176,31 +628,162 @@ def get_bestsellers(limit=10):
 
 def generate_and_cache_ai_summary(book_id: str):
     """
-    Generate a spoiler-free AI summary for a book using Gemini.
-    Uses cache to prevent repeated API calls.
+    Return the spoiler-free AI summary for a book, generating it with Gemini
+    on first use. Summaries are stored on Book.ai_summary, so Gemini is only
+    paid once per book (the generate_summaries command precomputes them).
     """
-    # ... (rest of function is fine, assuming 'book_id' is a google_id)
+    summary = (
+        Book.objects.filter(google_id=book_id)
+        .values_list("ai_summary", flat=True)
+        .first()
+    )
+    if summary:
+        return summary
+
+    # Recent failures are cached briefly so an outage doesn't hammer Gemini.
     cache_key = f"book_summary_gemini_{book_id}"
     summary = cache.get(cache_key)
     if summary:
         return summary
 
+    # Only one worker calls Gemini for a given book; the rest wait for it.
+    return single_flight(
+        f"ai_summary:{book_id}",
+        lambda: _generate_ai_summary(book_id, cache_key),
+        wait_timeout=getattr(settings, "SINGLE_FLIGHT_WAIT_TIMEOUT", 15),
+        on_timeout=lambda: "Summary is still being generated. Please try again shortly.",
+    )
+
+def _generate_ai_summary(book_id, cache_key):
     try:
         book = Book.objects.get(google_id=book_id)
     except Book.DoesNotExist:
         return "Summary not available because the book is not in our database."
+    if book.ai_summary:
+        return book.ai_summary
 
-    prompt = (
-        f"Write a spoiler-free, engaging, and concise summary (about 150 words) "
-        f"for the book titled '{book.title}' by {', '.join(book.authors or ['Unknown Author'])}."
-    )
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        response = model.generate_content(prompt)
-        summary = response.text.strip()
+        return save_ai_summary(book)
     except Exception as e:
         print(f"Gemini API Error: {e}")
         summary = "Summary not available due to an AI error."
-    
-    cache.set(cache_key, summary, 60 * 60 * 24)  # Cache for 24 hours
-    return summary
\ No newline at end of file
+        cache.set(cache_key, summary, 60 * 5)
+        return summary
+
+# How the Gemini client reports a request that ran out of time.
+GEMINI_TIMEOUT_ERRORS = (google_exceptions.DeadlineExceeded, TimeoutError, requests.Timeout)
+
+def request_ai_summary(book):
+    """Ask Gemini for a summary of ``book``. Raises on API errors."""
+    prompt = (
+        f"Write a spoiler-free, engaging, and concise summary (about 150 words) "
+        f"for the book titled '{book.title}' by {', '.join(book.authors or ['Unknown Author'])}."
+    )
+    model = genai.GenerativeModel('gemini-1.5-flash-latest')
+    breaker = get_breaker("gemini", getattr(settings, "GEMINI_TIMEOUT", 30), GEMINI_TIMEOUT_ERRORS)
+
+    def generate():
+        with track_upstream("gemini"):
+            return model.generate_content(prompt, request_options={"timeout": breaker.timeout()})
+
+    response = breaker.call(generate)
+    return response.text.strip()
+
+def save_ai_summary(book):
+    """Generate a summary for ``book`` and persist it on the row."""
+    summary = request_ai_summary(book)
+    Book.objects.filter(google_id=book.google_id).update(ai_summary=summary)
+    book.ai_summary = summary
+    return summary
+
+# Detail views are counted in memory and written in one batch per
+# BOOK_VIEW_FLUSH_INTERVAL seconds per worker rather than one UPDATE per GET.
+# The counts only rank books for generate_summaries, so losing the last few
+# seconds of them when a worker exits is fine.
+_pending_views = Counter()
+_pending_views_lock = threading.Lock()
+_views_flushed_at = time.monotonic()
+
+def record_book_view(google_id):
+    """Count a detail page view (used to rank books for summary precomputation)."""
+    global _views_flushed_at
+    with _pending_views_lock:
+        _pending_views[google_id] += 1
+        now = time.monotonic()
+        if now - _views_flushed_at < getattr(settings, "BOOK_VIEW_FLUSH_INTERVAL", 30):
+            return
+        views = dict(_pending_views)
+        _pending_views.clear()
+        _views_flushed_at = now
+    run_in_background(flush_book_views, views)
+
+def flush_book_views(views):
+    """Add ``{google_id: views}`` to Book.view_count, one UPDATE per distinct count."""
+    by_count = defaultdict(list)
+    for google_id, count in views.items():
+        by_count[count].append(google_id)
+    for count, google_ids in sorted(by_count.items()):
+        Book.objects.filter(google_id__in=sorted(google_ids)).update(view_count=F("view_count") + count)
+
+# -------------------------------
+# Rating aggregates (Book.average_rating / Book.review_count)
+# -------------------------------
+
+def apply_review_rating(book_id, added=None, removed=None):
+    """
+    Fold one review change into the book's aggregates in O(1).
+
+    ``added`` is the new rating (create/update), ``removed`` the old one
+    (update/delete). Runs as a single UPDATE built from F() expressions, so
+    concurrent writers never lose each other's changes; call it inside the
+    same transaction as the review write.
+    """
+    count = F("review_count")
+    total = ExpressionWrapper(
+        Coalesce(F("average_rating"), Value(0.0)) * count, output_field=FloatField()
+    )
+    if added is not None and removed is not None:
+        # Rating edited: the count is unchanged.
+        updates = {
+            "average_rating": Case(
+                When(review_count__gt=0, then=ExpressionWrapper(
+                    (total + Value(float(added - removed))) / count, output_field=FloatField()
+                )),
+                default=Value(None),
+                output_field=FloatField(),
+            ),
+        }
+    elif added is not None:
+        updates = {
+            "review_count": count + 1,
+            "average_rating": ExpressionWrapper(
+                (total + Value(float(added))) / (count + Value(1.0)), output_field=FloatField()
+            ),
+        }
+    elif removed is not None:
+        updates = {
+            "review_count": Case(When(review_count__gt=0, then=count - 1), default=Value(0)),
+            "average_rating": Case(
+                When(review_count__lte=1, then=Value(None)),
+                default=ExpressionWrapper(
+                    (total - Value(float(removed))) / (count - Value(1.0)), output_field=FloatField()
+                ),
+                output_field=FloatField(),
+            ),
+        }
+    else:
+        return
+    Book.objects.filter(google_id=book_id).update(**updates)
+
+def recompute_rating_aggregates(book_ids=None):
+    """
+    Recompute average_rating and review_count from Review rows, for the given
+    books or all of them. Fixes any drift left by writes that bypassed
+    apply_review_rating (admin edits, bulk imports, cascades).
+    """
+    per_book = Review.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    books = Book.objects.all() if book_ids is None else Book.objects.filter(google_id__in=book_ids)
+    return books.update(
+        review_count=Coalesce(Subquery(per_book.annotate(n=Count("id")).values("n")), Value(0)),
+        average_rating=Subquery(per_book.annotate(avg=Avg("rating")).values("avg")),
+    )
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Book
+from .services import invalidate_libraries_for_books
+
+# -------------------------------
+# Library cache invalidation on Book writes
+# -------------------------------
+# upsert_books and QuerySet.update (BookQuerySet) invalidate on their own;
+# this covers Book.save() from anywhere else (admin, update_or_create, shell).
+
+
+@receiver(post_save, sender=Book)
+def invalidate_libraries_on_book_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return  # nobody has it yet
+    if update_fields is not None and not set(update_fields) & set(Book.LIBRARY_FIELDS):
+        return  # e.g. ai_summary or counters only
+    invalidate_libraries_for_books([instance.pk])
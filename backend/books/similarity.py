@@ -0,0 +1,422 @@
+import fcntl
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .models import Book
+from .tasks import run_job
+
+# -------------------------------
+# Content-based "similar books" index
+# -------------------------------
+# Books are turned into hashed TF-IDF vectors over title, authors, categories
+# and descriptions (a hashing vectorizer: no vocabulary to store). The build
+# writes them column-major (one postings list per hashed feature) into .npy
+# files that are memory-mapped at query time, so a lookup only touches the
+# postings of the query book's own features. Books saved after a build are
+# appended to a small per-segment delta log and searched alongside it; only
+# books whose vector changed are appended (each row keeps a digest of its
+# terms), and once the log passes SIMILARITY_DELTA_MAX entries the index is
+# rebuilt in the background, which starts a fresh, empty log.
+#
+# Layout under SIMILARITY_INDEX_DIR:
+#   CURRENT                  name of the live segment (swapped atomically)
+#   <segment>/ids.json       row -> google_id
+#   <segment>/idf.npy        float32[N_FEATURES]
+#   <segment>/indptr.npy     int64[N_FEATURES + 1] postings offsets
+#   <segment>/rows.npy       int32[nnz] book rows, per feature
+#   <segment>/weights.npy    float32[nnz]
+#   <segment>/digests.npy    uint32[N] vector digest per row
+#   <segment>/delta.jsonl    books added since the build
+#   REBUILD.lock             held while a build runs
+#
+# Only NumPy is required.
+
+N_FEATURES = 2 ** 18
+FIELD_WEIGHTS = {"title": 2.0, "author": 2.0, "category": 3.0, "text": 1.0}
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has he her his in is it its of on or she that the "
+    "their this to was were will with who which you your book books novel".split()
+)
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+VECTOR_FIELDS = ("google_id", "title", "authors", "categories", "short_description", "full_description")
+
+
+def _words(text):
+    return [word for word in TOKEN_RE.findall((text or "").lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def book_terms(book):
+    """Weighted term counts for a Book (or a dict with VECTOR_FIELDS)."""
+    get = book.get if isinstance(book, dict) else (lambda field: getattr(book, field))
+    terms = Counter()
+    for word in _words(get("title")):
+        terms[word] += FIELD_WEIGHTS["title"]
+    for author in get("authors") or []:
+        # Whole-name tokens so "Frank Herbert" doesn't match every Frank.
+        terms["author:" + "_".join(_words(author))] += FIELD_WEIGHTS["author"]
+    for category in get("categories") or []:
+        terms["category:" + "_".join(_words(category))] += FIELD_WEIGHTS["category"]
+        for word in _words(category):
+            terms[word] += FIELD_WEIGHTS["text"]
+    for field in ("short_description", "full_description"):
+        for word in _words(get(field)):
+            terms[word] += FIELD_WEIGHTS["text"]
+    return terms
+
+
+def hashed_counts(book):
+    """{feature: sublinear term frequency} in hashed feature space."""
+    features = Counter()
+    for term, count in book_terms(book).items():
+        features[zlib.crc32(term.encode("utf-8")) % N_FEATURES] += count
+    return {feature: 1.0 + math.log(count) for feature, count in features.items()}
+
+
+def vector_digest(counts):
+    """Checksum of a book's hashed counts: equal digests mean an unchanged vector."""
+    items = sorted(counts.items())
+    features = array("i", [feature for feature, _ in items])
+    tfs = array("f", [tf for _, tf in items])
+    return zlib.crc32(features.tobytes() + tfs.tobytes())
+
+
+def weight_vector(counts, idf):
+    """Apply IDF and L2-normalize; returns (features, weights) lists."""
+    weighted = {feature: tf * float(idf[feature]) for feature, tf in counts.items()}
+    norm = math.sqrt(sum(value * value for value in weighted.values())) or 1.0
+    features = sorted(weighted)
+    return features, [weighted[feature] / norm for feature in features]
+
+
+# -------------------------------
+# Build
+# -------------------------------
+
+def index_dir():
+    return str(settings.SIMILARITY_INDEX_DIR)
+
+
+@contextmanager
+def _rebuild_lock(blocking=True):
+    """Yields whether this process got the build lock (always True when ``blocking``)."""
+    os.makedirs(index_dir(), exist_ok=True)
+    with open(os.path.join(index_dir(), "REBUILD.lock"), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_index(chunk_size=5000, log=None):
+    """Rebuild the whole index from the Book table into a new segment and switch to it."""
+    with _rebuild_lock():
+        return _build(chunk_size, log or (lambda message: None))
+
+
+def rebuild_if_delta_full():
+    """Rebuild unless another process already is, or already has, since the delta filled up."""
+    with _rebuild_lock(blocking=False) as locked:
+        segment = load_segment()
+        if locked and segment is not None and segment.delta_lines >= _delta_max():
+            _build(5000, lambda message: None)
+
+
+def _build(chunk_size, log):
+    import numpy as np
+
+    # Books saved while the table is scanned are carried over from the old delta.
+    old = _current_path()
+    carry_from = _file_size(os.path.join(old, "delta.jsonl")) if old else 0
+    ids, rows, features, tfs = [], array("i"), array("i"), array("f")
+    digests = array("I")
+    doc_freq = np.zeros(N_FEATURES, dtype=np.int32)
+
+    books = Book.objects.order_by().values(*VECTOR_FIELDS)
+    for book in books.iterator(chunk_size=chunk_size):
+        counts = hashed_counts(book)
+        if not counts:
+            continue
+        row = len(ids)
+        ids.append(book["google_id"])
+        digests.append(vector_digest(counts))
+        for feature, tf in counts.items():
+            rows.append(row)
+            features.append(feature)
+            tfs.append(tf)
+        doc_freq[list(counts)] += 1
+        if len(ids) % 50_000 == 0:
+            log(f"{len(ids)} books vectorized")
+
+    rows = np.frombuffer(rows, dtype=np.int32)
+    features = np.frombuffer(features, dtype=np.int32)
+    idf = (np.log((1 + len(ids)) / (1 + doc_freq)) + 1).astype(np.float32)
+    weights = np.frombuffer(tfs, dtype=np.float32) * idf[features]
+
+    # L2-normalize each book's vector.
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(ids)))
+    norms[norms == 0] = 1
+    weights = (weights / norms[rows]).astype(np.float32)
+
+    # Column-major postings: sort entries by feature.
+    order = np.argsort(features, kind="stable")
+    indptr = np.zeros(N_FEATURES + 1, dtype=np.int64)
+    np.cumsum(np.bincount(features, minlength=N_FEATURES), out=indptr[1:])
+
+    segment = f"segment-{time.time_ns()}-{os.getpid()}"
+    path = os.path.join(index_dir(), segment)
+    os.makedirs(path)
+    np.save(os.path.join(path, "idf.npy"), idf)
+    np.save(os.path.join(path, "indptr.npy"), indptr)
+    np.save(os.path.join(path, "rows.npy"), rows[order])
+    np.save(os.path.join(path, "weights.npy"), weights[order])
+    np.save(os.path.join(path, "digests.npy"), np.frombuffer(digests, dtype=np.uint32))
+    with open(os.path.join(path, "ids.json"), "w") as f:
+        json.dump(ids, f)
+
+    if old:
+        # Writers hold this lock while appending and re-check CURRENT once they
+        # have it, so nothing lands in the old log after the tail is copied.
+        with open(os.path.join(old, "delta.jsonl"), "ab+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(carry_from)
+            tail = f.read()
+            if tail:
+                with open(os.path.join(path, "delta.jsonl"), "wb") as new:
+                    new.write(tail)
+            _write_current(segment)
+            fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        _write_current(segment)
+    _remove_old_segments(keep=segment)
+    log(f"Indexed {len(ids)} books ({len(rows)} feature entries) into {segment}")
+    return len(ids)
+
+
+def _remove_old_segments(keep, retain=1):
+    """Delete superseded segments, keeping the newest ``retain`` besides ``keep``.
+    Workers that still have one mapped keep reading it until they reload."""
+    old = sorted(
+        (name for name in os.listdir(index_dir()) if name.startswith("segment-") and name != keep),
+        key=lambda name: os.path.getmtime(os.path.join(index_dir(), name)),
+        reverse=True,
+    )
+    for name in old[retain:]:
+        shutil.rmtree(os.path.join(index_dir(), name), ignore_errors=True)
+
+
+def _current_path():
+    try:
+        with open(os.path.join(index_dir(), "CURRENT")) as f:
+            return os.path.join(index_dir(), f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _delta_max():
+    return getattr(settings, "SIMILARITY_DELTA_MAX", 10_000)
+
+
+def _write_current(segment):
+    tmp = os.path.join(index_dir(), f"CURRENT.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(segment)
+    os.replace(tmp, os.path.join(index_dir(), "CURRENT"))
+
+
+# -------------------------------
+# Load / incremental add
+# -------------------------------
+
+class _Segment:
+    def __init__(self, path):
+        import numpy as np
+
+        self.path = path
+        self.idf = np.load(os.path.join(path, "idf.npy"), mmap_mode="r")
+        self.indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r")
+        try:
+            self.digests = np.load(os.path.join(path, "digests.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            self.digests = None  # built before digests were kept
+        with open(os.path.join(path, "ids.json")) as f:
+            self.ids = json.load(f)
+        self.row_of = {google_id: row for row, google_id in enumerate(self.ids)}
+        # google_id -> (features, weights, digest), plus an inverted view of
+        # the same vectors so a query only visits its own features.
+        self.delta = {}
+        self.delta_postings = {}
+        self.delta_offset = 0
+        self.delta_lines = 0
+        self._shadowed = None
+
+    @property
+    def delta_path(self):
+        return os.path.join(self.path, "delta.jsonl")
+
+    def refresh_delta(self):
+        """Read any delta lines appended (by any process) since the last call."""
+        try:
+            with open(self.delta_path, "rb") as f:
+                f.seek(self.delta_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partially written; pick it up next time
+                    self._add_delta(json.loads(line))
+                    self.delta_offset += len(line)
+                    self.delta_lines += 1
+        except FileNotFoundError:
+            pass
+
+    def _add_delta(self, entry):
+        google_id = entry["id"]
+        previous = self.delta.get(google_id)
+        if previous is not None:
+            for feature in previous[0]:
+                self.delta_postings[feature].pop(google_id, None)
+        elif google_id in self.row_of:
+            self._shadowed = None
+        self.delta[google_id] = (entry["f"], entry["w"], entry.get("d"))
+        for feature, weight in zip(entry["f"], entry["w"]):
+            self.delta_postings.setdefault(feature, {})[google_id] = weight
+
+    def shadowed_rows(self):
+        """Main-segment rows superseded by a delta entry."""
+        import numpy as np
+
+        if self._shadowed is None:
+            rows = [self.row_of[google_id] for google_id in self.delta if google_id in self.row_of]
+            self._shadowed = np.array(rows, dtype=np.int64)
+        return self._shadowed
+
+    def digest_of(self, google_id):
+        """The digest of the vector currently indexed for ``google_id``, or None."""
+        if google_id in self.delta:
+            return self.delta[google_id][2]
+        row = self.row_of.get(google_id)
+        if row is None or self.digests is None:
+            return None
+        return int(self.digests[row])
+
+
+_segment = None
+_segment_lock = threading.Lock()
+
+
+def load_segment():
+    """The live segment (memory-mapped), or None if no index has been built."""
+    global _segment
+    path = _current_path()
+    if path is None:
+        return None
+    with _segment_lock:
+        if _segment is None or _segment.path != path:
+            _segment = _Segment(path)
+        _segment.refresh_delta()
+        return _segment
+
+
+def add_books(books):
+    """
+    Append saved books whose vector changed (or that aren't indexed yet) to
+    the live segment's delta log; rebuild in the background once it's full.
+    """
+    for _ in range(2):  # once more if a rebuild swaps segments under us
+        segment = load_segment()
+        if segment is None:
+            return
+        lines = []
+        for book in books:
+            counts = hashed_counts(book)
+            if not counts:
+                continue
+            digest = vector_digest(counts)
+            if segment.digest_of(book.google_id) == digest:
+                continue
+            features, weights = weight_vector(counts, segment.idf)
+            lines.append(json.dumps({"id": book.google_id, "f": features, "w": weights, "d": digest}) + "\n")
+        if not lines:
+            return
+        with open(segment.delta_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # whole lines only, even with several writers
+            current = _current_path() == segment.path
+            if current:
+                f.write("".join(lines))
+            fcntl.flock(f, fcntl.LOCK_UN)
+        if current:
+            break
+    else:
+        return
+    if segment.delta_lines + len(lines) >= _delta_max():
+        run_job(rebuild_if_delta_full)
+
+
+# -------------------------------
+# Query
+# -------------------------------
+
+def similar_books(book, limit=10):
+    """Top ``limit`` (google_id, score) pairs most similar to ``book`` by cosine."""
+    import numpy as np
+
+    segment = load_segment()
+    if segment is None:
+        return []
+    counts = hashed_counts(book)
+    if not counts:
+        return []
+    features, weights = weight_vector(counts, segment.idf)
+
+    # Main segment: gather the postings of the query's features only.
+    spans = [(segment.indptr[feature], segment.indptr[feature + 1]) for feature in features]
+    if any(hi > lo for lo, hi in spans):
+        rows = np.concatenate([segment.rows[lo:hi] for lo, hi in spans])
+        contributions = np.concatenate(
+            [segment.weights[lo:hi] * weight for (lo, hi), weight in zip(spans, weights)]
+        )
+        scores = np.bincount(rows, weights=contributions, minlength=len(segment.ids))
+    else:
+        scores = np.zeros(len(segment.ids))
+
+    # Books re-added through the delta log are scored from their newer vector.
+    candidates = {}
+    for feature, weight in zip(features, weights):
+        for google_id, delta_weight in segment.delta_postings.get(feature, {}).items():
+            candidates[google_id] = candidates.get(google_id, 0.0) + weight * delta_weight
+    scores[segment.shadowed_rows()] = 0
+
+    own_row = segment.row_of.get(book.google_id)
+    if own_row is not None:
+        scores[own_row] = 0
+    candidates.pop(book.google_id, None)
+
+    take = min(limit, int(np.count_nonzero(scores)))
+    if take:
+        best = np.argpartition(-scores, take - 1)[:take]
+        candidates.update({segment.ids[row]: float(scores[row]) for row in best if scores[row] > 0})
+    ranked = sorted(candidates.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
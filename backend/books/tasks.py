@@ -0,0 +1,76 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+
+# -------------------------------
+# Fire-and-forget background work
+# -------------------------------
+# Small in-process pool for work that should not hold up the response
+# (cache refreshes, write-through upserts). Not a job queue: anything queued
+# here is lost if the worker process dies, and once
+# BOOKS_BACKGROUND_MAX_PENDING tasks are waiting new ones are dropped rather
+# than piling up behind a slow upstream.
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="books-background")
+# Long user-started jobs (shelf imports) get their own pool so they can't
+# starve the short tasks above.
+_job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="books-jobs")
+_pending = set()
+_backlog = Counter()  # queued or running tasks per executor
+_pending_lock = threading.Lock()
+
+
+def _run(executor, fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception as e:
+        print(f"Background task {fn.__name__} failed: {e}")
+    finally:
+        # Threads outside the request cycle must close their own DB connections.
+        connections.close_all()
+        with _pending_lock:
+            _backlog[executor] -= 1
+
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Run ``fn`` off the response path (inline when BOOKS_RUN_TASKS_INLINE is
+    set, e.g. in tests). Returns False if the task was dropped because the
+    pool is saturated.
+    """
+    return _submit(_executor, fn, args, kwargs, getattr(settings, "BOOKS_BACKGROUND_MAX_PENDING", 500))
+
+
+def run_job(fn, *args, **kwargs):
+    """Like run_in_background, for minutes-long jobs that report their own progress (never dropped)."""
+    return _submit(_job_executor, fn, args, kwargs)
+
+
+def _submit(executor, fn, args, kwargs, max_pending=None):
+    if getattr(settings, "BOOKS_RUN_TASKS_INLINE", False):
+        fn(*args, **kwargs)
+        return True
+    with _pending_lock:
+        if max_pending is not None and _backlog[executor] >= max_pending:
+            print(f"Background pool saturated; dropping {fn.__name__}.")
+            return False
+        _backlog[executor] += 1
+        future = executor.submit(_run, executor, fn, args, kwargs)
+        _pending.add(future)
+    future.add_done_callback(_forget)
+    return True
+
+
+def _forget(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def wait_for_background(timeout=None):
+    """Block until the tasks queued so far have finished (benchmarks, test teardown)."""
+    with _pending_lock:
+        pending = list(_pending)
+    wait(pending, timeout=timeout)
@@ -0,0 +1,112 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# -------------------------------
+# Query budgets for tests
+# -------------------------------
+# QueryLog records every SQL statement run inside a block, how long it took
+# and how many rows were fetched from it. QueryBudgetMixin.assertQueryBudget
+# fails a test when an endpoint exceeds its query or row budget, printing
+# the statements grouped by shape (repeated shapes are the usual N+1 culprit)
+# followed by the full list with the over-budget ones marked "+".
+
+_IN_LIST = re.compile(r"\((?:%s, )+%s\)")
+# Inside a TestCase every atomic() block becomes a savepoint, while in
+# production BEGIN/COMMIT never go through execute(); leave them out so
+# budgets match what a real request sends.
+_TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class RecordedQuery:
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.rows = 0
+        self.time = 0.0
+
+    @property
+    def shape(self):
+        """The statement with IN-lists collapsed, so batched lookups compare equal."""
+        return _IN_LIST.sub("(...)", self.sql)
+
+
+class QueryLog:
+    """Context manager recording the queries run on one connection (this thread only)."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.queries = []
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(_TRANSACTION_CONTROL):
+            return execute(sql, params, many, context)
+        query = RecordedQuery(sql, params)
+        self.queries.append(query)
+        cursor = context["cursor"]
+        if not hasattr(cursor, "recorded_query"):
+            # Wrap once per cursor; rows go to the statement it ran last.
+            for name in ("fetchone", "fetchmany", "fetchall"):
+                setattr(cursor, name, self._counting(cursor, getattr(cursor, name), single=name == "fetchone"))
+        cursor.recorded_query = query
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            query.time = time.perf_counter() - start
+
+    @staticmethod
+    def _counting(cursor, fetch, single):
+        def counted(*args):
+            result = fetch(*args)
+            if single:
+                cursor.recorded_query.rows += result is not None
+            else:
+                cursor.recorded_query.rows += len(result)
+            return result
+        return counted
+
+    @property
+    def rows(self):
+        return sum(query.rows for query in self.queries)
+
+    def report(self, budget=None):
+        shapes = Counter(query.shape for query in self.queries)
+        lines = ["Statements by shape:"]
+        for shape, count in shapes.most_common():
+            marker = "  <- repeated" if count > 1 else ""
+            lines.append(f"  {count:>4}x  {shape}{marker}")
+        lines.append("All statements (+ = over the query budget):")
+        for number, query in enumerate(self.queries, start=1):
+            marker = "+" if budget is not None and number > budget else " "
+            lines.append(
+                f"{marker} {number:>3}. [{query.rows:>5} rows {query.time * 1000:7.2f} ms] {query.sql}"
+            )
+        return "\n".join(lines)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: ``with self.assertQueryBudget(queries=3, rows=60): client.get(...)``."""
+
+    @contextmanager
+    def assertQueryBudget(self, queries, rows=None, using=DEFAULT_DB_ALIAS):
+        with QueryLog(using) as log:
+            yield log
+        problems = []
+        if len(log.queries) > queries:
+            problems.append(f"{len(log.queries)} queries (budget {queries})")
+        if rows is not None and log.rows > rows:
+            problems.append(f"{log.rows} rows fetched (budget {rows})")
+        if problems:
+            self.fail("Over budget: " + ", ".join(problems) + "\n" + log.report(budget=queries))
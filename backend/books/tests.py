@@ -1,3 +1,1433 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from google.api_core.exceptions import DeadlineExceeded
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from urllib3 import HTTPResponse
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+
+from . import circuit, library_import, recommendations, response_cache, services, similarity, tasks, upstream
+from .caching import get_or_refresh, single_flight
+from .management.commands.bench_endpoints import compare, percentile
+from .fakes import fake_google_id, fake_isbn13, fake_volume, offline_upstreams, seed_catalog
+from .models import Book, LibraryImportJob, Review, UserBookInteraction
+from .serializers import INTERACTION_VALUES, UserBookInteractionSerializer, interaction_rows_to_data
+from .renderers import ORJSONParser, ORJSONRenderer
+from .testing import QueryBudgetMixin
+
+# -------------------------------
+# Query budgets per endpoint
+# -------------------------------
+# Each test runs one request against a realistically sized seeded database
+# (fake upstreams, no network) and fails if it runs more SQL statements or
+# fetches more rows than budgeted. Budgets are set at today's numbers: if a
+# change needs more, raise the budget in the same commit and say why.
+# Background tasks run inline here and are counted; work on the upstream
+# fan-out pool (home carousels) runs on other threads and is not.
+
+
+class BookEndpointBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch = tempfile.mkdtemp(prefix="books-tests-")
+        cls.addClassCleanup(shutil.rmtree, cls.scratch, True)
+        overrides = override_settings(
+            SIMILARITY_INDEX_DIR=cls.scratch,
+            BOOKS_RUN_TASKS_INLINE=True,
+            UPSTREAM_CACHE_ENABLED=False,
+            METRICS_SERVER_TIMING=False,
+            # One process: the LocMem cache is as good as shared here.
+            CACHE_IS_SHARED=True,
+            # View counts are written in periodic batches, not per request.
+            BOOK_VIEW_FLUSH_INTERVAL=60 * 60,
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book_ids, cls.users = seed_catalog(books=1500, users=30, library_size=300, reviews_per_book=4)
+        cls.reader = cls.users[0]
+        cls.book_id = cls.book_ids[0]
+        # A book with more reviews than fit on one page.
+        reviewed = set(Review.objects.filter(book_id=cls.book_id).values_list("user_id", flat=True))
+        Review.objects.bulk_create(
+            Review(user=user, book_id=cls.book_id, rating=5, comment="Again.")
+            for user in cls.users if user.pk not in reviewed
+        )
+        Book.objects.filter(pk=cls.book_ids[1]).update(ai_summary="Already summarized.")
+        recommendations.build_neighbors()
+        similarity.build_index()
+
+    def setUp(self):
+        cache.clear()
+        self.fakes = self.enterContext(offline_upstreams(latency=0, gemini_latency=0))
+        self.client = APIClient()
+
+    def login(self, user=None):
+        token = RefreshToken.for_user(user or self.reader).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def get_ok(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response
+
+    # Search / details / summary ----------------------------------------
+
+    def test_search_local(self):
+        with self.assertQueryBudget(queries=1, rows=20):
+            self.get_ok("/api/v1/search/", q="shadow river")
+        self.assertEqual(self.fakes.calls["google_books"], 0)
+
+    def test_search_google_fallback(self):
+        with self.assertQueryBudget(queries=3, rows=0):
+            self.get_ok("/api/v1/search/", q="zzznothinglocal")
+
+    def test_details_known_book(self):
+        with self.assertQueryBudget(queries=1, rows=1):
+            self.get_ok(f"/api/v1/details/{self.book_id}/")
+
+    def test_details_new_book(self):
+        with self.assertQueryBudget(queries=4, rows=0):
+            self.get_ok("/api/v1/details/newvolume01/")
+
+    def test_detail_views_flushed_in_batches(self):
+        book_id = self.book_ids[7]
+        before = Book.objects.get(pk=book_id).view_count
+        services._pending_views.clear()  # views buffered by earlier tests
+        for _ in range(3):
+            self.get_ok(f"/api/v1/details/{book_id}/")
+        self.assertEqual(Book.objects.get(pk=book_id).view_count, before)
+        with self.settings(BOOK_VIEW_FLUSH_INTERVAL=0), self.assertQueryBudget(queries=2, rows=1):
+            # The book row, then a single UPDATE for all four views.
+            self.get_ok(f"/api/v1/details/{book_id}/")
+        self.assertEqual(Book.objects.get(pk=book_id).view_count, before + 4)
+
+    def test_batch_details(self):
+        ids = ",".join(self.book_ids[:20] + ["newvolume02", "newvolume03"])
+        with self.assertQueryBudget(queries=3, rows=20):
+            self.get_ok("/api/v1/details/", ids=ids)
+
+    def test_summary_generated(self):
+        with self.assertQueryBudget(queries=3, rows=2):
+            self.get_ok(f"/api/v1/summary/{self.book_id}/")
+
+    def test_summary_stored(self):
+        with self.assertQueryBudget(queries=1, rows=1):
+            self.get_ok(f"/api/v1/summary/{self.book_ids[1]}/")
+
+    # Home -----------------------------------------------------------------
+
+    def test_home_cold(self):
+        with self.assertQueryBudget(queries=0, rows=0):
+            self.get_ok("/api/v1/home/")
+
+    def test_home_warm(self):
+        self.get_ok("/api/v1/home/")
+        with self.assertQueryBudget(queries=0, rows=0):
+            self.get_ok("/api/v1/home/")
+
+    # Conditional GET -----------------------------------------------------
+
+    def assertNotModified(self, url, if_none_match):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=if_none_match)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        return response
+
+    def test_details_etag(self):
+        url = f"/api/v1/details/{self.book_id}/"
+        etag = self.get_ok(url)["ETag"]
+        with self.assertQueryBudget(queries=1, rows=1):
+            self.assertNotModified(url, etag)
+        self.assertEqual(self.assertNotModified(url, f'W/{etag}, "something-else"')["ETag"], etag)
+
+        Book.objects.filter(pk=self.book_id).update(title="A New Edition")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "A New Edition")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_home_etag(self):
+        etag = self.get_ok("/api/v1/home/")["ETag"]
+        self.assertNotModified("/api/v1/home/", etag)
+
+        # Rebuilt with the same content: same ETag.
+        cache.delete("recent_books")
+        self.assertEqual(self.get_ok("/api/v1/home/")["ETag"], etag)
+
+        cache.delete("recent_books")
+        get_or_refresh("recent_books", lambda: [{"title": "Just Out"}], soft_ttl=60, hard_ttl=60)
+        response = self.client.get("/api/v1/home/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["recent"], [{"title": "Just Out"}])
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_home_etag_matches_the_body_served(self):
+        self.get_ok("/api/v1/home/")
+        # A stale section is served as is while it refreshes (inline here, so
+        # the cache already holds the new value before the response is built).
+        cache.delete("recent_books")
+        get_or_refresh("recent_books", lambda: [{"title": "Old"}], soft_ttl=0, hard_ttl=60)
+        stale = self.get_ok("/api/v1/home/")
+        self.assertEqual(stale.json()["recent"], [{"title": "Old"}])
+        fresh = self.client.get("/api/v1/home/", HTTP_IF_NONE_MATCH=stale["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh.json()["recent"], [{"title": "Old"}])
+        self.assertNotEqual(fresh["ETag"], stale["ETag"])
+
+    def test_home_without_etag_while_a_section_is_missing(self):
+        etag = self.get_ok("/api/v1/home/")["ETag"]
+        # Another worker is still building the bestsellers when the deadline hits.
+        cache.delete("bestsellers")
+        cache.add("bestsellers:lock", "another-worker", 30)
+        with self.settings(HOME_FEED_DEADLINE=0.2):
+            response = self.client.get("/api/v1/home/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["bestsellers"], [])
+        self.assertNotIn("ETag", response)
+
+    # Recommendations -----------------------------------------------------
+
+    def test_because_you_read(self):
+        with self.assertQueryBudget(queries=1, rows=10):
+            self.get_ok(f"/api/v1/because-you-read/{self.book_id}/")
+
+    def test_similar_books(self):
+        with self.assertQueryBudget(queries=2, rows=11):
+            self.get_ok(f"/api/v1/similar/{self.book_id}/")
+
+    def test_recommendations(self):
+        self.login()
+        with self.assertQueryBudget(queries=3, rows=1301):
+            self.get_ok("/api/v1/recommendations/")
+
+    # Interactions -----------------------------------------------------------
+
+    def test_interaction_create(self):
+        self.login()
+        owned = UserBookInteraction.objects.filter(user=self.reader).values_list("book_id", flat=True)
+        book_id = Book.objects.exclude(pk__in=owned).values_list("pk", flat=True).first()
+        with self.assertQueryBudget(queries=3, rows=3):
+            response = self.client.post(
+                "/api/v1/interactions/", {"book": book_id, "status": "WTR"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_interaction_update(self):
+        self.login()
+        book_id = UserBookInteraction.objects.filter(user=self.reader).values_list("book_id", flat=True)[0]
+        with self.assertQueryBudget(queries=5, rows=4):
+            response = self.client.put(
+                "/api/v1/interactions/", {"book_id": book_id, "is_favorite": True}, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    # Reviews --------------------------------------------------------------
+
+    def test_reviews_page(self):
+        # One query: keyset page of 20 plus one look-ahead row, users joined in.
+        with self.assertQueryBudget(queries=1, rows=21):
+            self.get_ok(f"/api/v1/books/{self.book_id}/reviews/")
+
+    def test_reviews_cursor_walk_with_tied_timestamps(self):
+        # Every review of the book shares one created_at: the id breaks ties,
+        # so walking all pages returns each review exactly once, in order.
+        reviews = Review.objects.filter(book_id=self.book_id)
+        reviews.update(created_at=reviews.first().created_at)
+        expected = list(reviews.order_by("-id").values_list("id", flat=True))
+        seen, url = [], f"/api/v1/books/{self.book_id}/reviews/?page_size=7"
+        while url:
+            page = self.get_ok(url).json()
+            seen.extend(review["id"] for review in page["results"])
+            url = page["next"]
+        self.assertEqual(seen, expected)
+
+    def assertCursorsRejected(self, url, positions):
+        for position in positions:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            with self.subTest(url=url, position=position):
+                response = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 404, response.content[:200])
+
+    def test_bad_review_cursors_are_404(self):
+        self.assertCursorsRejected(
+            f"/api/v1/books/{self.book_id}/reviews/",
+            [["garbage", 1], [{"a": 1}, 1], ["2020-01-01", "x"], [None, 1], ["2020-01-01"]],
+        )
+        response = self.client.get(f"/api/v1/books/{self.book_id}/reviews/", {"cursor": "not base64!"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_review_create(self):
+        self.login()
+        reviewed = Review.objects.filter(user=self.reader).values_list("book_id", flat=True)
+        book_id = Book.objects.exclude(pk__in=reviewed).values_list("pk", flat=True).first()
+        with self.assertQueryBudget(queries=4, rows=3):
+            response = self.client.post(
+                f"/api/v1/books/{book_id}/reviews/", {"rating": 4, "comment": "Good."}, format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_review_update(self):
+        review = Review.objects.filter(user=self.reader).first()
+        self.login()
+        with self.assertQueryBudget(queries=5, rows=3):
+            response = self.client.put(f"/api/v1/reviews/{review.pk}/", {"rating": 2}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_review_delete(self):
+        review = Review.objects.filter(user=self.reader).first()
+        self.login()
+        with self.assertQueryBudget(queries=5, rows=3):
+            response = self.client.delete(f"/api/v1/reviews/{review.pk}/")
+        self.assertEqual(response.status_code, 204, response.content)
+
+    # Library / favorites ------------------------------------------------------
+
+    def test_library_first_page(self):
+        self.login()
+        with self.assertQueryBudget(queries=2, rows=52):
+            self.get_ok("/api/v1/my-library/")
+
+    def test_library_later_page_filtered(self):
+        self.login()
+        first = self.get_ok("/api/v1/my-library/", status="RD", page_size=20).json()
+        cache.clear()
+        with self.assertQueryBudget(queries=2, rows=22):
+            self.get_ok(first["next"])
+
+    def test_library_cached(self):
+        self.login()
+        self.get_ok("/api/v1/my-library/")
+        with self.assertQueryBudget(queries=1, rows=1):
+            self.get_ok("/api/v1/my-library/")
+
+    def test_favorites(self):
+        self.login()
+        with self.assertQueryBudget(queries=2, rows=52):
+            self.get_ok("/api/v1/favorites/")
+
+    def test_bad_library_cursors_are_404(self):
+        self.login()
+        self.assertCursorsRejected("/api/v1/my-library/", [["abc"], [[1]], [None], [1, 2]])
+        self.assertCursorsRejected("/api/v1/favorites/", [["abc"], [{"id": 1}]])
+        with override_settings(CACHE_IS_SHARED=False):
+            self.assertCursorsRejected("/api/v1/my-library/", [["abc"]])
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_library_unshared_cache(self):
+        # Per-process cache: nothing is cached, the ETag comes from the content.
+        self.login()
+        etag = self.get_ok("/api/v1/my-library/")["ETag"]
+        with self.assertQueryBudget(queries=2, rows=52):
+            response = self.client.get("/api/v1/my-library/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_library_sees_book_writes(self):
+        self.login()
+        book_id = self.get_ok("/api/v1/my-library/").json()["library"][0]["book"]["google_id"]
+        book = Book.objects.get(pk=book_id)
+        book.title = "Saved Title"
+        book.save()  # the admin path
+        titles = [item["book"]["title"] for item in self.get_ok("/api/v1/my-library/").json()["library"]]
+        self.assertIn("Saved Title", titles)
+        Book.objects.filter(pk=book_id).update(title="Updated Title")
+        titles = [item["book"]["title"] for item in self.get_ok("/api/v1/my-library/").json()["library"]]
+        self.assertIn("Updated Title", titles)
+
+    # Export -------------------------------------------------------------------
+
+    def test_export_library_csv(self):
+        self.login()
+        # The auth user lookup, then one cursor read while the body streams.
+        with self.assertQueryBudget(queries=2, rows=301):
+            response = self.client.get("/api/v1/export/library.csv")
+            lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(lines), 301)
+
+    def test_export_reviews_jsonl_gz(self):
+        self.login()
+        reviews = Review.objects.filter(user=self.reader).count()
+        with self.assertQueryBudget(queries=2, rows=reviews + 1):
+            response = self.client.get("/api/v1/export/reviews.jsonl.gz")
+            body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(len(body.splitlines()), reviews)
+
+    # Import -------------------------------------------------------------------
+
+    def upload(self, name, header, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        writer.writerows(rows)
+        upload = SimpleUploadedFile(name, buffer.getvalue().encode("utf-8"), content_type="text/csv")
+        return self.client.post("/api/v1/import/", {"file": upload}, format="multipart")
+
+    def test_import_goodreads(self):
+        newcomer = get_user_model().objects.create_user("newcomer", password="x")
+        self.login(newcomer)
+        local = list(Book.objects.filter(pk__in=self.book_ids[:20]).values_list("isbn13", "title", "authors"))
+        header = ["Title", "Author", "ISBN", "ISBN13", "My Rating", "Bookshelves", "Exclusive Shelf", "My Review"]
+        rows = (
+            # Local by ISBN (spreadsheet-quoted, as Goodreads writes it), rated and reviewed.
+            [[title, authors[0], "", f'="{isbn}"', "4", "favorites", "read", "Loved it.<br/>Twice."]
+             for isbn, title, authors in local[:10]]
+            # Local by title and author; the series suffix is ignored.
+            + [[f"{title} (Saga, #2)", authors[0], "", "", "0", "", "to-read", ""]
+               for _, title, authors in local[10:]]
+            # Unknown locally: found on Google by ISBN.
+            + [[f"New Book {i}", "Someone", "", fake_isbn13(f"new{i}"), "0", "", "currently-reading", ""]
+               for i in range(10)]
+            # No match anywhere.
+            + [["", "", "", fake_isbn13("none").replace("978", "979", 1), "0", "", "read", ""]]
+        )
+        # Per chunk: ISBN and title lookups, the upsert of Google finds (existing
+        # rows + insert), owned/reviewed checks, two bulk inserts and two counts
+        # of what they inserted, the rating recompute and a progress save; plus
+        # the auth lookup, and for the job
+        # row: pruning old jobs, the insert, the job's own load, the running
+        # and final saves and the re-read for the response.
+        with self.assertQueryBudget(queries=19, rows=26):
+            response = self.upload("goodreads_library_export.csv", header, rows)
+        self.assertEqual(response.status_code, 202, response.content)
+        job = response.json()
+        self.assertEqual(job["state"], "done")
+        self.assertEqual((job["total"], job["added"], job["reviews_added"]), (31, 30, 10))
+        self.assertEqual(job["unresolved_count"], 1)
+        self.assertEqual(self.fakes.calls["google_books"], 10)
+        self.assertEqual(UserBookInteraction.objects.filter(user=newcomer, is_favorite=True).count(), 10)
+        self.assertEqual(Review.objects.get(user=newcomer, book__isbn13=local[0][0]).comment, "Loved it.\nTwice.")
+
+        with self.assertQueryBudget(queries=2, rows=2):
+            status = self.get_ok(response["Location"]).json()
+        self.assertEqual(status, job)
+
+    def test_import_storygraph_skips_owned(self):
+        self.login()
+        owned = UserBookInteraction.objects.filter(user=self.reader).values_list("book__isbn13", flat=True)[:5]
+        header = ["Title", "Authors", "ISBN/UID", "Read Status", "Star Rating", "Review", "Tags"]
+        rows = [["", "", isbn, "read", "3.75", "", ""] for isbn in owned]
+        response = self.upload("storygraph.csv", header, rows)
+        self.assertEqual(response.status_code, 202, response.content)
+        job = response.json()
+        self.assertEqual((job["source"], job["added"], job["already_in_library"]), ("storygraph", 0, 5))
+
+    def test_import_counts_only_inserted_rows(self):
+        newcomer = get_user_model().objects.create_user("racer", password="x")
+        job = LibraryImportJob.objects.create(job_id="race", user=newcomer, source="goodreads")
+        entry = {"status": UserBookInteraction.Status.READ, "is_favorite": False, "rating": 3, "review": None}
+        rows = [(book_id, entry) for book_id in self.book_ids[:3]]
+
+        def skipping(manager):
+            real_bulk_create = manager.bulk_create
+
+            def bulk_create(objs, **kwargs):
+                # The first row hits a conflict (a concurrent write) and is skipped.
+                return real_bulk_create(objs[1:], **kwargs)
+            return mock.patch.object(manager, "bulk_create", bulk_create)
+
+        with skipping(UserBookInteraction.objects), skipping(Review.objects):
+            library_import.import_chunk(newcomer.pk, rows, job)
+        self.assertEqual((job.added, job.already_in_library, job.reviews_added), (2, 1, 2))
+        # Importing them again only adds the row that was skipped.
+        library_import.import_chunk(newcomer.pk, rows, job)
+        self.assertEqual((job.added, job.already_in_library, job.reviews_added), (3, 3, 3))
+
+    def test_import_lookups_stay_off_the_request_pool(self):
+        self.login(get_user_model().objects.create_user("pooled", password="x"))
+        header = ["Title", "Authors", "ISBN/UID", "Read Status", "Star Rating", "Review", "Tags"]
+        rows = [[f"New Book {i}", "Someone", fake_isbn13(f"pool{i}"), "read", "", "", ""] for i in range(3)]
+        with mock.patch.object(upstream, "get_executor", wraps=upstream.get_executor) as get_executor:
+            response = self.upload("storygraph.csv", header, rows)
+        self.assertEqual(response.json()["added"], 3)
+        self.assertEqual({call.args for call in get_executor.call_args_list}, {("background",)})
+
+    def test_import_rejects_other_csv(self):
+        self.login()
+        response = self.upload("books.csv", ["title", "author"], [["Dune", "Frank Herbert"]])
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_import_status_from_any_worker(self):
+        self.login()
+        header = ["Title", "Authors", "ISBN/UID", "Read Status", "Star Rating", "Review", "Tags"]
+        response = self.upload("storygraph.csv", header, [["Dune", "Frank Herbert", "", "read", "", "", ""]])
+        # Another worker has its own cache; the status lives in the database.
+        cache.clear()
+        self.assertEqual(self.get_ok(response["Location"]).json()["state"], "done")
+        self.login(self.users[1])
+        self.assertEqual(self.client.get(response["Location"]).status_code, 404)
+
+
+# -------------------------------
+# Circuit breaker state machine
+# -------------------------------
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    time = monotonic
+
+
+@override_settings(
+    CIRCUIT_WINDOW=50,
+    CIRCUIT_MIN_CALLS=10,
+    CIRCUIT_FAILURE_RATE=0.5,
+    CIRCUIT_OPEN_SECONDS=30,
+    CIRCUIT_MIN_LATENCY_SAMPLES=20,
+    CIRCUIT_TIMEOUT_MULTIPLIER=2.0,
+    CIRCUIT_MIN_TIMEOUT=1.0,
+)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.enterContext(mock.patch.object(circuit, "time", self.clock))
+        self.breaker = circuit.CircuitBreaker("test", max_timeout=10)
+
+    def upstream(self, latency, timeout_error=requests.ReadTimeout):
+        """A call taking ``latency`` seconds, cut off at the breaker's timeout."""
+        timeout = self.breaker.timeout()
+
+        def send():
+            self.clock.now += min(latency, timeout)
+            if latency > timeout:
+                raise timeout_error("read timed out")
+            return "ok"
+
+        return self.breaker.call(send)
+
+    def fail_call(self):
+        def send():
+            raise requests.ConnectionError("refused")
+
+        with self.assertRaises(requests.RequestException):
+            self.breaker.call(send)
+
+    def trip(self):
+        while self.breaker.state == circuit.CLOSED:
+            self.fail_call()
+
+    def test_trips_after_failure_rate(self):
+        for _ in range(9):
+            self.fail_call()
+        self.assertEqual(self.breaker.state, circuit.CLOSED)
+        self.fail_call()
+        self.assertEqual(self.breaker.state, circuit.OPEN)
+        with self.assertRaises(circuit.CircuitOpenError):
+            self.upstream(0.1)
+
+    def test_probe_success_closes(self):
+        self.trip()
+        self.clock.now += 31
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())  # one probe at a time
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, circuit.CLOSED)
+        self.assertEqual(self.breaker.error_rate(), 0.0)
+
+    def test_probe_failure_reopens(self):
+        self.trip()
+        self.clock.now += 31
+        self.fail_call()
+        self.assertEqual(self.breaker.state, circuit.OPEN)
+        with self.assertRaises(circuit.CircuitOpenError):
+            self.upstream(0.1)
+        self.clock.now += 31
+        self.assertEqual(self.upstream(0.1), "ok")
+        self.assertEqual(self.breaker.state, circuit.CLOSED)
+
+    def test_timeout_grows_when_upstream_slows(self):
+        for _ in range(50):
+            self.upstream(0.2)
+        self.assertEqual(self.breaker.timeout(), 1.0)
+        # Now 1.5 s per call, under the static 10 s: after a timed-out call or
+        # two the timeout has grown past it and calls succeed again.
+        outcomes = []
+        for _ in range(20):
+            try:
+                outcomes.append(self.upstream(1.5))
+            except requests.RequestException:
+                outcomes.append("failed")
+        self.assertEqual(outcomes[-10:], ["ok"] * 10)
+        self.assertEqual(self.breaker.state, circuit.CLOSED)
+        self.assertGreater(self.breaker.timeout(), 1.5)
+
+    def test_gemini_timeouts_feed_the_timeout(self):
+        self.breaker = circuit.CircuitBreaker("gemini", 10, services.GEMINI_TIMEOUT_ERRORS)
+        for _ in range(50):
+            self.upstream(0.2)
+        for error in (DeadlineExceeded, TimeoutError):
+            timeout = self.breaker.timeout()
+            with self.assertRaises(error):
+                self.upstream(5, timeout_error=error)
+            self.assertEqual(self.breaker.latencies[-1], timeout)
+        self.assertEqual(self.breaker.timeout(), 4.0)
+
+    def test_probe_gets_full_timeout(self):
+        for _ in range(50):
+            self.upstream(0.2)
+        self.trip()
+        self.clock.now += 31
+        # The stale 1 s p99 timeout would fail a 1.5 s upstream forever.
+        self.assertEqual(self.breaker.timeout(), 10)
+        self.assertEqual(self.upstream(1.5), "ok")
+        self.assertEqual(self.breaker.state, circuit.CLOSED)
+
+
+# -------------------------------
+# Upstream retry policy
+# -------------------------------
+
+@override_settings(UPSTREAM_MAX_RETRIES=2, UPSTREAM_BACKOFF_MAX=5)
+class UpstreamRetryTests(SimpleTestCase):
+    def response(self, status, retry_after=None):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        return HTTPResponse(status=status, headers=headers)
+
+    def test_long_retry_after_gives_up_at_once(self):
+        retry = upstream._build_retry()
+        with self.assertRaises(MaxRetryError):
+            retry.increment("GET", "/volumes", response=self.response(429, retry_after=3600))
+
+    def test_short_retry_after_is_clamped(self):
+        retry = upstream._build_retry()
+        self.assertEqual(retry.get_retry_after(self.response(429, retry_after=3)), 3)
+        retry = retry.increment("GET", "/volumes", response=self.response(503, retry_after=4))
+        self.assertEqual(retry.get_retry_after(self.response(503, retry_after=30)), 5)
+
+    def test_read_timeout_not_retried(self):
+        retry = upstream._build_retry()
+        with self.assertRaises(ReadTimeoutError):
+            retry.increment("GET", "/volumes", error=ReadTimeoutError(None, "/volumes", "timed out"))
+
+
+# -------------------------------
+# import_catalog command
+# -------------------------------
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.dir = self.enterContext(tempfile.TemporaryDirectory())
+
+    def write(self, name, lines):
+        path = os.path.join(self.dir, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        return path
+
+    def run_import(self, path, *args):
+        out = io.StringIO()
+        call_command("import_catalog", path, *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    @staticmethod
+    def ol_line(kind, key, record):
+        return "\t".join([kind, key, "1", "2024-01-01T00:00:00", json.dumps({"key": key, **record})])
+
+    def ol_dump(self):
+        return [
+            self.ol_line("/type/author", "/authors/OL1A", {"name": "Ursula K. Le Guin"}),
+            self.ol_line("/type/redirect", "/works/OL9W", {"location": "/works/OL1W"}),
+            self.ol_line("/type/work", "/works/OL1W", {
+                "title": "The Dispossessed", "authors": [{"author": {"key": "/authors/OL1A"}}],
+            }),
+            self.ol_line("/type/edition", "/books/OL2M", {
+                "title": "A Wizard of Earthsea", "authors": [{"key": "/authors/OL1A"}], "isbn_10": ["0553383043"],
+            }),
+            self.ol_line("/type/edition", "/books/OL3M", {"authors": [{"key": "/authors/OL1A"}]}),
+            "not a dump line",
+        ]
+
+    def test_ol_dump_keeps_books_and_resolves_authors(self):
+        self.run_import(self.write("ol_dump.txt", self.ol_dump()))
+        books = {book.google_id: book for book in Book.objects.filter(google_id__startswith="ol:")}
+        # No author/redirect rows, and no "Unknown Title" for the untitled edition.
+        self.assertEqual(set(books), {"ol:OL1W", "ol:OL2M"})
+        self.assertEqual(books["ol:OL1W"].authors, ["Ursula K. Le Guin"])
+        self.assertEqual(books["ol:OL2M"].isbn13, "9780553383041")
+
+    def test_ol_dump_resume_rescans_authors(self):
+        path = self.write("ol_dump.txt.gz", self.ol_dump())
+        self.run_import(path, "--limit", "1", "--batch-size", "1")
+        self.assertTrue(os.path.exists(path + ".checkpoint"))
+        self.run_import(path)
+        self.assertEqual(Book.objects.get(google_id="ol:OL2M").authors, ["Ursula K. Le Guin"])
+
+    def test_jsonl_gz_resume_skips_unusable_lines(self):
+        lines = [json.dumps({"id": f"flat{i}", "title": f"Book {i}", "authors": "A; B"}) for i in range(25)]
+        lines[3:3] = ["123", "[1, 2]", "{not json"]
+        path = self.write("catalog.jsonl.gz", lines)
+        output = self.run_import(path, "--limit", "10", "--batch-size", "4")
+        self.assertIn("Stopped at --limit", output)
+        self.assertEqual(Book.objects.filter(google_id__startswith="flat").count(), 7)
+
+        output = self.run_import(path, "--batch-size", "4")
+        self.assertIn("Resuming after 10 records", output)
+        self.assertEqual(Book.objects.filter(google_id__startswith="flat").count(), 25)
+        self.assertEqual(Book.objects.get(google_id="flat0").authors, ["A", "B"])
+        self.assertFalse(os.path.exists(path + ".checkpoint"))
+
+    def test_csv_resume_keeps_header(self):
+        rows = [f"csv{i},Title {i},Author {i},Fiction" for i in range(10)]
+        path = self.write("catalog.csv", ["google_id,title,authors,categories"] + rows)
+        self.run_import(path, "--limit", "4", "--batch-size", "2")
+        self.run_import(path)
+        book = Book.objects.get(google_id="csv9")
+        self.assertEqual((book.title, book.authors, book.categories), ("Title 9", ["Author 9"], ["Fiction"]))
+        self.assertEqual(Book.objects.filter(google_id__startswith="csv").count(), 10)
+
+    def test_changed_input_refuses_checkpoint(self):
+        path = self.write("catalog.jsonl", [json.dumps({"id": f"chg{i}", "title": "T"}) for i in range(5)])
+        self.run_import(path, "--limit", "2")
+        self.write("catalog.jsonl", [json.dumps({"id": "other", "title": "Something longer"})])
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+
+
+# -------------------------------
+# Similar-books delta log
+# -------------------------------
+
+@override_settings(BOOKS_RUN_TASKS_INLINE=True)
+class SimilarityDeltaTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(SIMILARITY_INDEX_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        seed_catalog(books=40, users=1, library_size=0, reviews_per_book=0)
+        similarity.build_index()
+
+    def volume(self, google_id, **info):
+        item = fake_volume(google_id)
+        item["volumeInfo"].update(info)
+        return services.normalize_google_book(item)
+
+    def delta_lines(self):
+        with open(similarity.load_segment().delta_path) as f:
+            return f.read().splitlines()
+
+    def test_only_new_or_changed_books_are_appended(self):
+        similarity.add_books(Book.objects.all())
+        self.assertFalse(os.path.exists(similarity.load_segment().delta_path))
+
+        services.upsert_books([self.volume("delta-a"), self.volume("delta-b")])
+        services.upsert_books([self.volume("delta-a"), self.volume("delta-b")])
+        self.assertEqual(len(self.delta_lines()), 2)
+
+        services.upsert_books([self.volume("delta-a", description="Spaceships and dragons.")])
+        self.assertEqual(len(self.delta_lines()), 3)
+        segment = similarity.load_segment()
+        self.assertEqual(set(segment.delta), {"delta-a", "delta-b"})
+        # Re-added books are scored from their newest vector only.
+        twin = Book.objects.get(pk="delta-a")
+        twin.google_id = "query"
+        self.assertEqual(similarity.similar_books(twin, limit=1)[0][0], "delta-a")
+
+    def test_full_delta_triggers_rebuild(self):
+        first = similarity.load_segment().path
+        with self.settings(SIMILARITY_DELTA_MAX=3):
+            services.upsert_books([self.volume(f"full-{i}") for i in range(3)])
+        segment = similarity.load_segment()
+        self.assertNotEqual(segment.path, first)
+        self.assertEqual(segment.delta, {})
+        self.assertTrue({"full-0", "full-1", "full-2"} <= set(segment.row_of))
+
+
+# -------------------------------
+# Stale-while-revalidate cache and single-flight
+# -------------------------------
+
+class Holder(threading.Thread):
+    """Runs ``fn`` on another thread; ``started`` is set once ``fn`` holds the lock."""
+
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+
+    def compute(self, value=None, exc=None):
+        self.started.set()
+        self.release.wait(5)
+        if exc is not None:
+            raise exc
+        return value
+
+    def run(self):
+        try:
+            self.fn(self)
+        except Exception as e:
+            self.error = e
+
+
+@override_settings(BOOKS_RUN_TASKS_INLINE=True)
+class GetOrRefreshTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self, value):
+        def compute():
+            self.calls.append(value)
+            return value
+        return compute
+
+    def get(self, value, **kwargs):
+        options = {"soft_ttl": 60, "hard_ttl": 600, **kwargs}
+        return get_or_refresh("swr", self.compute(value), **options)
+
+    def hold(self, **kwargs):
+        """Start a holder computing "held" for the key and wait until it has the lock."""
+        holder = Holder(lambda h: get_or_refresh(
+            "swr", lambda: h.compute(**kwargs), soft_ttl=60, hard_ttl=600
+        ))
+        holder.start()
+        self.addCleanup(holder.join, 5)
+        self.addCleanup(holder.release.set)
+        self.assertTrue(holder.started.wait(5))
+        return holder
+
+    def test_fresh_value_is_not_recomputed(self):
+        self.assertEqual(self.get(["a"]), ["a"])
+        self.assertEqual(self.get(["b"]), ["a"])
+        self.assertEqual(self.calls, [["a"]])
+
+    def test_stale_value_served_while_one_refresh_runs(self):
+        self.get(["old"], soft_ttl=0)
+        # Another worker is already refreshing: no second refresh starts.
+        cache.add("swr:lock", "someone-else", 30)
+        self.assertEqual(self.get(["new"]), ["old"])
+        self.assertEqual(self.calls, [["old"]])
+        cache.delete("swr:lock")
+        # Otherwise the stale value is returned and refreshed in the background.
+        self.assertEqual(self.get(["new"]), ["old"])
+        self.assertEqual(self.calls, [["old"], ["new"]])
+        self.assertEqual(self.get(["newer"]), ["new"])
+        self.assertIsNone(cache.get("swr:lock"))
+
+    def test_empty_results_cached_briefly(self):
+        self.assertEqual(self.get([], empty_ttl=0), [])
+        self.assertEqual(self.get([], empty_ttl=60), [])
+        self.assertEqual(self.get(["late"]), [])
+        self.assertEqual(self.calls, [[], []])
+        self.assertLessEqual(cache.get("swr")["fresh_until"], time.time() + 60)
+
+    def test_waiter_receives_holders_result(self):
+        holder = self.hold(value=["held"])
+        threading.Timer(0.1, holder.release.set).start()
+        self.assertEqual(self.get(["mine"]), ["held"])
+        self.assertEqual(self.calls, [])
+
+    def test_holder_crash_lets_waiter_compute(self):
+        holder = self.hold(exc=RuntimeError("upstream down"))
+        threading.Timer(0.1, holder.release.set).start()
+        self.assertEqual(self.get(["mine"]), ["mine"])
+        holder.join(5)
+        self.assertIsInstance(holder.error, RuntimeError)
+        self.assertIsNone(cache.get("swr:lock"))
+
+    def test_wait_stops_at_deadline(self):
+        self.hold(value=["held"])
+        started = time.monotonic()
+        value = self.get(["mine"], wait_timeout=10, deadline=started + 0.2, on_timeout=list)
+        self.assertEqual(value, [])
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self.calls, [])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value="mine"):
+        self.calls += 1
+        return value
+
+    def hold(self, **kwargs):
+        holder = Holder(lambda h: single_flight("flight", lambda: h.compute(**kwargs)))
+        holder.start()
+        self.addCleanup(holder.join, 5)
+        self.addCleanup(holder.release.set)
+        self.assertTrue(holder.started.wait(5))
+        return holder
+
+    def test_waiter_receives_holders_result(self):
+        holder = self.hold(value="held")
+        threading.Timer(0.1, holder.release.set).start()
+        self.assertEqual(single_flight("flight", self.compute), "held")
+        self.assertEqual(self.calls, 0)
+        # Published for result_ttl, so a late caller doesn't recompute either.
+        self.assertEqual(single_flight("flight", self.compute), "held")
+        self.assertEqual(self.calls, 0)
+
+    def test_holder_crash_lets_waiter_compute(self):
+        holder = self.hold(exc=RuntimeError("gemini down"))
+        threading.Timer(0.1, holder.release.set).start()
+        self.assertEqual(single_flight("flight", self.compute), "mine")
+        holder.join(5)
+        self.assertIsInstance(holder.error, RuntimeError)
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get("singleflight:flight:lock"))
+
+    def test_on_timeout_when_holder_is_slow(self):
+        self.hold(value="held")
+        value = single_flight("flight", self.compute, wait_timeout=0.1, on_timeout=lambda: "try later")
+        self.assertEqual(value, "try later")
+        self.assertEqual(self.calls, 0)
+
+    def test_computes_after_timeout_without_on_timeout(self):
+        self.hold(value="held")
+        self.assertEqual(single_flight("flight", self.compute, wait_timeout=0.1), "mine")
+        self.assertEqual(self.calls, 1)
+
+
+# -------------------------------
+# Rating aggregates
+# -------------------------------
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(google_id="rated", title="Rated", authors=["A. Author"])
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice", password="x")
+        self.bob = User.objects.create_user("bob", password="x")
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client
+
+    def review(self, user, rating):
+        response = self.client_for(user).post(f"/api/v1/books/{self.book.pk}/reviews/", {"rating": rating})
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["id"]
+
+    def assertAggregates(self, count, average):
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.review_count, count)
+        if average is None:
+            self.assertIsNone(self.book.average_rating)
+        else:
+            self.assertAlmostEqual(self.book.average_rating, average)
+
+    def test_create_update_delete(self):
+        alice_review = self.review(self.alice, 4)
+        self.assertAggregates(1, 4.0)
+        bob_review = self.review(self.bob, 1)
+        self.assertAggregates(2, 2.5)
+
+        response = self.client_for(self.bob).put(f"/api/v1/reviews/{bob_review}/", {"rating": 5})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertAggregates(2, 4.5)
+        # A comment-only edit leaves the aggregates alone.
+        self.client_for(self.bob).put(f"/api/v1/reviews/{bob_review}/", {"comment": "Better on reread."})
+        self.assertAggregates(2, 4.5)
+
+        self.assertEqual(self.client_for(self.alice).delete(f"/api/v1/reviews/{alice_review}/").status_code, 204)
+        self.assertAggregates(1, 5.0)
+        self.assertEqual(self.client_for(self.bob).delete(f"/api/v1/reviews/{bob_review}/").status_code, 204)
+        self.assertAggregates(0, None)
+
+    def test_edit_after_drift_to_zero(self):
+        review = self.review(self.alice, 4)
+        Book.objects.filter(pk=self.book.pk).update(review_count=0)
+        response = self.client_for(self.alice).put(f"/api/v1/reviews/{review}/", {"rating": 2})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertAggregates(0, None)
+
+    def test_delete_of_vanished_review_leaves_aggregates(self):
+        review = self.review(self.alice, 4)
+        self.review(self.bob, 2)
+        # A concurrent DELETE removed the row after this one loaded it.
+        with mock.patch("django.db.models.query.QuerySet.delete", return_value=(0, {})):
+            response = self.client_for(self.alice).delete(f"/api/v1/reviews/{review}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertAggregates(2, 3.0)
+
+    def test_reconcile_ratings_repairs_drift(self):
+        self.review(self.alice, 4)
+        # Writes that bypass apply_review_rating: a bulk insert and a stray edit.
+        Review.objects.bulk_create([Review(user=self.bob, book=self.book, rating=2)])
+        other = Book.objects.create(google_id="unrated", title="Unrated", review_count=3, average_rating=1.0)
+        call_command("reconcile_ratings", "--batch-size", "1", stdout=io.StringIO())
+        self.assertAggregates(2, 3.0)
+        other.refresh_from_db()
+        self.assertEqual((other.review_count, other.average_rating), (0, None))
+
+
+# -------------------------------
+# Background pool
+# -------------------------------
+
+@override_settings(BOOKS_RUN_TASKS_INLINE=False, BOOKS_BACKGROUND_MAX_PENDING=2)
+class BackgroundPoolTests(SimpleTestCase):
+    def test_saturated_pool_drops_tasks(self):
+        self.enterContext(mock.patch.object(tasks, "_executor", ThreadPoolExecutor(max_workers=1)))
+        self.addCleanup(tasks._executor.shutdown)
+        release = threading.Event()
+        ran = []
+        self.assertTrue(tasks.run_in_background(release.wait, 5))
+        self.assertTrue(tasks.run_in_background(ran.append, "queued"))
+        self.assertFalse(tasks.run_in_background(ran.append, "dropped"))
+        release.set()
+        tasks.wait_for_background(timeout=5)
+        self.assertEqual(ran, ["queued"])
+        self.assertTrue(tasks.run_in_background(ran.append, "later"))
+        tasks.wait_for_background(timeout=5)
+        self.assertEqual(ran, ["queued", "later"])
+
+
+# -------------------------------
+# Upstream response cache
+# -------------------------------
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "cache.sqlite3")
+        self.cache = response_cache.ResponseCache(path, max_entries=3, stale_grace=100)
+        self.clock = FakeClock()
+        self.enterContext(mock.patch.object(response_cache, "time", self.clock))
+
+    def test_key_normalization(self):
+        key = response_cache.make_key
+        url = "https://www.googleapis.com/books/v1/volumes"
+        self.assertEqual(
+            key(url, {"q": "  Dune   Messiah ", "maxResults": 5, "key": "secret"}),
+            key(url, {"maxResults": "5", "q": "dune messiah", "key": "other", "startIndex": None}),
+        )
+        # Only the search text is case-insensitive.
+        self.assertNotEqual(key(url, {"q": "x", "id": "AbC"}), key(url, {"q": "x", "id": "abc"}))
+        self.assertNotEqual(key(url, {"q": "dune"}), key(url + "/x", {"q": "dune"}))
+
+    def test_ttl_and_stale_grace(self):
+        self.cache.set("k", {"v": 1}, ttl=60)
+        self.clock.now += 59
+        self.assertEqual(self.cache.get("k"), {"v": 1})
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get("k"))
+        self.assertEqual(self.cache.get("k", allow_stale=True), {"v": 1})
+        self.clock.now += 100
+        self.assertIsNone(self.cache.get("k", allow_stale=True))
+        self.cache.evict()
+        self.clock.now -= 100
+        self.assertIsNone(self.cache.get("k", allow_stale=True))  # dropped, not just hidden
+
+    def test_lru_eviction(self):
+        for name in "abcd":
+            self.cache.set(name, name, ttl=3600)
+            self.clock.now += response_cache.TOUCH_INTERVAL + 1
+        self.cache.get("a")  # recently used again
+        self.cache.evict()
+        kept = {name for name in "abcd" if self.cache.get(name) is not None}
+        self.assertEqual(kept, {"a", "c", "d"})
+
+
+# -------------------------------
+# Request metrics
+# -------------------------------
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN=None, METRICS_SERVER_TIMING=True, UPSTREAM_CACHE_ENABLED=False)
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fakes = self.enterContext(offline_upstreams(latency=0, gemini_latency=0))
+        Book.objects.create(google_id="metered", title="Metered", authors=["A. Author"])
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    @staticmethod
+    def sample(body, series):
+        for line in body.splitlines():
+            if line.startswith(series + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_request_recorded_in_histograms(self):
+        count = 'http_request_duration_seconds_count{endpoint="v1:book-detail",method="GET",status="200"}'
+        calls = 'http_request_upstream_calls_count{endpoint="v1:book-detail",service="google_books"}'
+        before = self.scrape()
+        self.assertEqual(self.client.get("/api/v1/details/metered/").status_code, 200)
+        self.assertEqual(self.client.get("/api/v1/details/fetched01/").status_code, 200)
+        after = self.scrape()
+        self.assertEqual(self.sample(after, count) - self.sample(before, count), 2)
+        self.assertEqual(self.sample(after, calls) - self.sample(before, calls), 1)
+        self.assertIn("# TYPE http_request_db_queries histogram", after)
+        self.assertIn('http_request_db_queries_bucket{endpoint="v1:book-detail",le="+Inf"}', after)
+
+    def test_server_timing_header(self):
+        response = self.client.get("/api/v1/details/fetched02/")
+        entries = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(entries, ["db", "google_books", "render", "total"])
+        self.assertRegex(response["Server-Timing"], r'google_books;dur=[0-9.]+;desc="1 calls"')
+        with self.settings(METRICS_SERVER_TIMING=False):
+            self.assertNotIn("Server-Timing", self.client.get("/api/v1/details/metered/"))
+
+    def test_metrics_access(self):
+        with self.settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9").status_code, 403)
+        with self.settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret", REMOTE_ADDR="203.0.113.9")
+            self.assertEqual(response.status_code, 200)
+
+
+# -------------------------------
+# orjson renderer / parser
+# -------------------------------
+
+class ORJSONRendererTests(SimpleTestCase):
+    def assertRendersLikeDRF(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_matches_json_renderer(self):
+        payloads = [
+            {"books": [{"google_id": "abc", "title": "Dune", "authors": ["Frank Herbert"], "score": 0.8125}]},
+            {"created_at": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+             "published": date(1965, 8, 1), "rating": Decimal("4.50"), "id": uuid.UUID(int=7)},
+            {"title": "Café — «Ünïcode» 日本語 😀", "empty": None, "flags": [True, False], 3: "int key"},
+            {"comment": "line\u2028separator\u2029paragraph"},
+            {"huge": 2 ** 70, "nested": {"list": [1, 2.5, "three"]}},
+            [],
+        ]
+        for data in payloads:
+            with self.subTest(data=data):
+                self.assertRendersLikeDRF(data)
+
+    def test_parser_round_trip(self):
+        body = ORJSONRenderer().render({"rating": 4, "comment": "Loved it \u2028 twice"})
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(body)), {"rating": 4, "comment": "Loved it \u2028 twice"}
+        )
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"rating": NaN}'))
+
+
+# -------------------------------
+# Library fast path
+# -------------------------------
+
+class InteractionRowsTests(TestCase):
+    def test_matches_model_serializer(self):
+        user = get_user_model().objects.create_user(username="reader", password="pw")
+        books = [
+            Book.objects.create(
+                google_id="full", title="Dune", authors=["Frank Herbert", "Brian Herbert"],
+                published_date="1965-08-01", thumbnail_url="https://books.example/dune.jpg",
+                short_description="Spice.",
+            ),
+            # Nothing but the required fields: every nullable column is None.
+            Book.objects.create(google_id="bare", title="Untitled", authors=[]),
+            Book.objects.create(google_id="year", title="Café «Ünïcode»", authors=["Anon"], published_date="1999"),
+        ]
+        UserBookInteraction.objects.create(user=user, book=books[0], status="RD", is_favorite=True)
+        UserBookInteraction.objects.create(user=user, book=books[1], status=None)
+        UserBookInteraction.objects.create(user=user, book=books[2], status="WTR")
+
+        interactions = UserBookInteraction.objects.filter(user=user).order_by("-id")
+        expected = UserBookInteractionSerializer(interactions.select_related("book", "user"), many=True).data
+        data = interaction_rows_to_data(interactions.values(*INTERACTION_VALUES), user.username)
+
+        self.assertEqual(data, [dict(item) for item in expected])
+        self.assertEqual(data[1]["book"]["published_date"], None)
+        self.assertEqual(data[1]["status"], None)
+        # Same keys in the same order, so the rendered JSON is byte-identical.
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+
+# -------------------------------
+# Recommendations
+# -------------------------------
+
+class RecommendationTests(TestCase):
+    # Read shelves (weight 1.0 each):   A  B  C  D
+    #   u1                              x  x
+    #   u2                              x  x  x
+    #   u3                                    x  x
+    #   u4                              x  x
+    # cos(A, B) = 1, cos(C, D) = 1/sqrt(2), cos(A, C) = cos(B, C) = 1/sqrt(6).
+    # E is in the catalogue but nobody has it.
+    SHELVES = {"u1": "AB", "u2": "ABC", "u3": "CD", "u4": "AB"}
+
+    @classmethod
+    def setUpTestData(cls):
+        for google_id in "ABCDE":
+            Book.objects.create(google_id=google_id, title=f"Book {google_id}", authors=["Anon"])
+        for username, shelf in cls.SHELVES.items():
+            user = get_user_model().objects.create_user(username=username, password="pw")
+            UserBookInteraction.objects.bulk_create(
+                UserBookInteraction(user=user, book_id=google_id, status="RD") for google_id in shelf
+            )
+        cls.written = recommendations.build_neighbors(top_k=5)
+
+    def neighbors(self, google_id):
+        return [(book.google_id, score) for book, score in recommendations.get_neighbors(google_id)]
+
+    def recommend(self, shelf):
+        user = get_user_model().objects.create_user(username=f"reader-{shelf or 'cold'}", password="pw")
+        UserBookInteraction.objects.bulk_create(
+            UserBookInteraction(user=user, book_id=google_id, status="RD") for google_id in shelf
+        )
+        return [(book.google_id, score) for book, score in recommendations.get_recommendations(user)]
+
+    def assertScored(self, actual, expected):
+        self.assertEqual([book for book, _ in actual], [book for book, _ in expected])
+        for (_, score), (book, wanted) in zip(actual, expected):
+            self.assertAlmostEqual(score, wanted, places=5, msg=book)
+
+    def test_item_item_neighbors(self):
+        self.assertScored(self.neighbors("A"), [("B", 1.0), ("C", 1 / math.sqrt(6))])
+        self.assertScored(self.neighbors("D"), [("C", 1 / math.sqrt(2))])
+        self.assertEqual({book for book, _ in self.neighbors("C")}, {"A", "B", "D"})
+        self.assertEqual(self.neighbors("C")[0][0], "D")
+        # Never their own neighbour; no co-readers means no neighbours at all.
+        self.assertNotIn("A", [book for book, _ in self.neighbors("A")])
+        self.assertEqual(self.neighbors("E"), [])
+        self.assertEqual(self.written, 2 + 2 + 3 + 1)  # A, B, C, D
+
+    def test_ranked_by_summed_similarity(self):
+        # C is a neighbour of both A and D, so it outranks B (neighbour of A only).
+        self.assertScored(
+            self.recommend("AD"), [("C", 1 / math.sqrt(6) + 1 / math.sqrt(2)), ("B", 1.0)]
+        )
+        self.assertScored(self.recommend("D"), [("C", 1 / math.sqrt(2))])
+
+    def test_excludes_books_already_in_library(self):
+        self.assertScored(self.recommend("AB"), [("C", 2 / math.sqrt(6))])
+        self.assertEqual(self.recommend("ABCD"), [])
+
+    def test_cold_users(self):
+        self.assertEqual(self.recommend(""), [])
+        # Only books nobody else has read: nothing to go on either.
+        self.assertEqual(self.recommend("E"), [])
+
+
+# -------------------------------
+# bench_endpoints regression check
+# -------------------------------
+
+class BenchCompareTests(SimpleTestCase):
+    BASE = {"p50": 10.0, "p95": 20.0, "p99": 40.0, "throughput": 100.0, "errors": 0}
+
+    def compare(self, tolerance=0.25, min_delta_ms=1.0, **changes):
+        return compare({"home": {"4": {**self.BASE, **changes}}}, {"home": {"4": self.BASE}}, tolerance, min_delta_ms)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([1, 2, 3], 0), 1)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_within_tolerance(self):
+        self.assertEqual(self.compare(), [])
+        self.assertEqual(self.compare(p50=12.4, p95=24.9, p99=49.9, throughput=76.0), [])
+        # Faster or fewer errors is never a regression.
+        self.assertEqual(self.compare(p50=1.0, throughput=500.0), [])
+        noisy = {**self.BASE, "errors": 3}
+        self.assertEqual(compare({"home": {"4": {**noisy, "errors": 1}}}, {"home": {"4": noisy}}, 0.25), [])
+
+    def test_latency_regressions(self):
+        self.assertEqual(self.compare(p50=13.0), ["home @4: p50 13.0 ms vs baseline 10.0 ms"])
+        self.assertEqual(self.compare(p99=60.0), ["home @4: p99 60.0 ms vs baseline 40.0 ms"])
+        # Beyond the ratio but under the absolute floor: noise.
+        self.assertEqual(self.compare(min_delta_ms=5.0, p50=14.0), [])
+
+    def test_throughput_regression(self):
+        self.assertEqual(self.compare(throughput=70.0), ["home @4: throughput 70.0/s vs baseline 100.0/s"])
+
+    def test_error_regression(self):
+        self.assertEqual(self.compare(errors=2), ["home @4: 2 errors vs baseline 0"])
+        # Baselines recorded without an error count are treated as error-free.
+        base = {key: value for key, value in self.BASE.items() if key != "errors"}
+        regressions = compare({"home": {"4": {**base, "errors": 1}}}, {"home": {"4": base}}, 0.25)
+        self.assertEqual(regressions, ["home @4: 1 errors vs baseline 0"])
+
+    def test_rows_missing_from_baseline_are_skipped(self):
+        results = {"home": {"16": {**self.BASE, "p50": 99.0}}, "search": {"4": {**self.BASE, "errors": 5}}}
+        self.assertEqual(compare(results, {"home": {"4": self.BASE}}, 0.25), [])
+
+
+# -------------------------------
+# Search: local index with Google fallback
+# -------------------------------
+
+class OfflineUpstreamsMixin:
+    """Offline fakes with a private response cache, similarity index and breakers."""
+    FAKE_RESULTS = 20
+
+    def setUp(self):
+        super().setUp()
+        scratch = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(
+            SIMILARITY_INDEX_DIR=scratch, UPSTREAM_CACHE_PATH=os.path.join(scratch, "upstream_cache.sqlite3"),
+        ))
+        response_cache._backend = None
+        self.addCleanup(setattr, response_cache, "_backend", None)
+        # Failures provoked here must not count against later tests.
+        self.enterContext(mock.patch.dict(circuit._breakers, clear=True))
+        self.fakes = self.enterContext(offline_upstreams(latency=0, gemini_latency=0, results=self.FAKE_RESULTS))
+
+
+@override_settings(BOOKS_RUN_TASKS_INLINE=True, BOOK_SEARCH_MIN_LOCAL_RESULTS=5)
+class SearchFallbackTests(OfflineUpstreamsMixin, TestCase):
+    QUERY = "zephyr"
+    FAKE_RESULTS = 4
+
+    def setUp(self):
+        super().setUp()
+        # The fake answers QUERY with volumes fake_google_id("zephyr:0") .. ":3";
+        # the first of them is already in the catalogue.
+        self.remote_ids = [fake_google_id(f"{self.QUERY}:{i}") for i in range(4)]
+        Book.objects.create(google_id=self.remote_ids[0], title="Zephyr Tales", authors=["Anon"])
+        Book.objects.create(google_id="local-only", title="Zephyr Nights", authors=["Anon"])
+
+    def ids(self, books):
+        return [book["google_id"] for book in books]
+
+    def test_enough_local_hits_skip_google(self):
+        with self.settings(BOOK_SEARCH_MIN_LOCAL_RESULTS=2):
+            books = services.search_books(self.QUERY)
+        self.assertEqual(self.ids(books), ["local-only", self.remote_ids[0]])
+        self.assertEqual(self.fakes.calls["google_books"], 0)
+
+    def test_merges_local_hits_first_without_duplicates(self):
+        books = services.search_books(self.QUERY)
+        self.assertEqual(self.fakes.calls["google_books"], 1)
+        # Local hits (by title) first, then Google's in its order, each id once.
+        self.assertEqual(self.ids(books), ["local-only", self.remote_ids[0]] + self.remote_ids[1:])
+        self.assertEqual(books[1]["title"], "Zephyr Tales")
+        capped = services.search_books(self.QUERY, max_results=3)
+        self.assertEqual(self.ids(capped), ["local-only"] + self.remote_ids[:2])
+
+    def test_google_results_written_back_to_the_index(self):
+        books = services.search_books(self.QUERY)
+        self.assertEqual(set(Book.objects.values_list("google_id", flat=True)), {"local-only", *self.remote_ids})
+        fetched = Book.objects.get(pk=self.remote_ids[2])
+        self.assertEqual(fetched.title, books[3]["title"])
+        self.assertEqual(fetched.search_document, fetched.build_search_document())
+
+        # The next search for that book is answered locally.
+        calls = self.fakes.calls["google_books"]
+        with self.settings(BOOK_SEARCH_MIN_LOCAL_RESULTS=1):
+            self.assertIn(fetched.pk, self.ids(services.search_books(fetched.title)))
+        self.assertEqual(self.fakes.calls["google_books"], calls)
+
+    def test_google_failure_keeps_local_hits(self):
+        self.fakes.error_rate = 1.0
+        self.assertEqual(self.ids(services.search_books(self.QUERY)), ["local-only", self.remote_ids[0]])
+        self.assertEqual(Book.objects.count(), 2)
+
+
+# -------------------------------
+# Batch resolution (get_or_create_books / resolve_books)
+# -------------------------------
+
+@override_settings(BOOKS_RUN_TASKS_INLINE=True)
+class BatchResolutionTests(OfflineUpstreamsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Book.objects.create(google_id="local-a", title="The Left Hand of Darkness", authors=["Ursula K. Le Guin"],
+                            isbn13="9780441478125")
+        Book.objects.create(google_id="local-b", title="Kindred", authors=["Octavia E. Butler"])
+
+    def failing(self, fn, bad):
+        """Wrap ``fn`` so calls whose argument is in ``bad`` raise."""
+        def call(arg, *args, **kwargs):
+            if arg in bad:
+                raise RuntimeError(f"lookup of {arg} blew up")
+            return fn(arg, *args, **kwargs)
+        return call
+
+    def test_get_or_create_books_keeps_input_order(self):
+        fetch = self.failing(services.fetch_google_book_by_id, {"boom"})
+        with mock.patch.object(services, "fetch_google_book_by_id", fetch):
+            books = services.get_or_create_books(
+                ["local-b", "new-1", "missing-1", "local-a", "new-1", "boom", "new-2"]
+            )
+        # Duplicates collapse to their first position; 404s and errors are left out.
+        self.assertEqual([book.pk for book in books], ["local-b", "new-1", "local-a", "new-2"])
+        self.assertEqual(self.fakes.calls["google_books"], 3)  # new-1, missing-1, new-2
+        self.assertEqual(
+            set(Book.objects.values_list("google_id", flat=True)), {"local-a", "local-b", "new-1", "new-2"}
+        )
+
+    def test_get_or_create_books_skips_calls_past_the_deadline(self):
+        fetch = services.fetch_google_book_by_id
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow(google_id):
+            if google_id == "slow":
+                release.wait(5)  # until the test is over; never touches the network
+                return None
+            return fetch(google_id)
+
+        with self.settings(BOOK_BATCH_DEADLINE=0.1), mock.patch.object(services, "fetch_google_book_by_id", slow):
+            books = services.get_or_create_books(["slow", "local-a", "new-1"])
+        self.assertEqual([book.pk for book in books], ["local-a", "new-1"])
+
+    def test_resolve_books_maps_each_entry_by_index(self):
+        found_isbn = fake_isbn13("found")
+        entries = [
+            {"isbn13": "", "title": "Nobody Has This", "author": ""},  # 0: falls back to a title search
+            {"isbn13": found_isbn, "title": "", "author": ""},  # 1: found on Google by ISBN
+            {"isbn13": "9780441478125", "title": "", "author": ""},  # 2: local ISBN
+            {"isbn13": "9790000000001", "title": "", "author": ""},  # 3: ISBN Google doesn't know
+            {"isbn13": "", "title": "  kindred ", "author": "Butler"},  # 4: local title + author
+            {"isbn13": "", "title": "Kindred", "author": "Someone Else"},  # 5: title matches, author doesn't
+            {"isbn13": found_isbn, "title": "", "author": ""},  # 6: repeats row 1
+            {"isbn13": "", "title": "", "author": ""},  # 7: nothing to go on
+            {"isbn13": "", "title": "Broken", "author": ""},  # 8: lookup raises
+        ]
+        lookup = self.failing(services._google_lookup, {'intitle:"Broken"'})
+        with mock.patch.object(services, "_google_lookup", lookup):
+            resolved = services.resolve_books(entries)
+
+        title_hit = fake_google_id('intitle:"Nobody Has This":0')
+        other_kindred = fake_google_id('intitle:"Kindred" inauthor:"Someone Else":0')
+        isbn_hit = fake_google_id(f"isbn:{found_isbn}")
+        self.assertEqual(resolved, {
+            0: title_hit, 1: isbn_hit, 2: "local-a", 4: "local-b", 5: other_kindred, 6: isbn_hit,
+        })
+        # One Google call per distinct query; the failed one is simply unresolved.
+        self.assertEqual(self.fakes.calls["google_books"], 4)
+        self.assertEqual(Book.objects.filter(pk__in=[title_hit, isbn_hit, other_kindred]).count(), 3)
@@ -0,0 +1,206 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from .circuit import get_breaker
+from .metrics import track_upstream
+
+# -------------------------------
+# Shared HTTP client for upstream APIs (Google Books, NYT)
+# -------------------------------
+
+GOOGLE_BOOKS_BASE_URL = "https://www.googleapis.com/"
+NYT_BASE_URL = "https://api.nytimes.com/"
+# Service label used in metrics, by URL prefix.
+SERVICES = ((GOOGLE_BOOKS_BASE_URL, "google_books"), (NYT_BASE_URL, "nyt"))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# Fan-out pools by name: "request" serves interactive requests, "background"
+# long jobs (shelf imports), so a big import can't starve the request path.
+POOL_SIZES = {"request": ("UPSTREAM_MAX_WORKERS", 8), "background": ("UPSTREAM_BACKGROUND_MAX_WORKERS", 2)}
+_executors = {}
+_executors_pid = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class BoundedRetry(Retry):
+    """
+    Retry that never sleeps longer than backoff_max. urllib3 honours any
+    Retry-After as given (a quota 429 may say an hour); when the server asks
+    for more than backoff_max we give up at once and hand its response back,
+    shorter waits are clamped.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.backoff_max)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and self.respect_retry_after_header:
+            retry_after = super().get_retry_after(response)
+            if retry_after is not None and retry_after > self.backoff_max:
+                # With raise_on_status off, urllib3 returns the response as-is.
+                raise MaxRetryError(_pool, url, ResponseError(f"Retry-After {retry_after:.0f}s is too long"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def _build_retry():
+    """
+    Bounded retries with jittered exponential backoff on 429 and 5xx and on
+    failed connects. Read timeouts are not retried: the caller already waited
+    the full (adaptive) timeout once, and the circuit breaker handles slowness.
+    """
+    return BoundedRetry(
+        total=_setting("UPSTREAM_MAX_RETRIES", 2),
+        connect=_setting("UPSTREAM_MAX_RETRIES", 2),
+        # False re-raises the timeout itself, so callers and the breaker see requests.ReadTimeout.
+        read=False,
+        status=_setting("UPSTREAM_MAX_RETRIES", 2),
+        backoff_factor=_setting("UPSTREAM_BACKOFF_FACTOR", 0.3),
+        backoff_jitter=_setting("UPSTREAM_BACKOFF_JITTER", 0.3),
+        backoff_max=_setting("UPSTREAM_BACKOFF_MAX", 5),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        # Let raise_for_status() surface the final error response to the caller.
+        raise_on_status=False,
+    )
+
+
+def _build_session():
+    session = requests.Session()
+    pool_size = _setting("UPSTREAM_POOL_MAXSIZE", 20)
+    # One adapter per upstream host so each keeps its own keep-alive pool.
+    for base_url in (GOOGLE_BOOKS_BASE_URL, NYT_BASE_URL):
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=_build_retry(),
+        )
+        session.mount(base_url, adapter)
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size, max_retries=_build_retry()))
+    session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip"})
+    return session
+
+
+def get_session():
+    """
+    Return the process-wide session. It is rebuilt after a fork so gunicorn
+    workers never share sockets with their parent.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def default_timeout():
+    """(connect, read) timeout tuple used when the caller gives none."""
+    return (
+        _setting("UPSTREAM_CONNECT_TIMEOUT", 3.05),
+        _setting("UPSTREAM_READ_TIMEOUT", 10),
+    )
+
+
+def service_for(url):
+    for base_url, service in SERVICES:
+        if url.startswith(base_url):
+            return service
+    return "other"
+
+
+def is_server_error(response):
+    """Responses that count against the upstream's circuit (4xx are our problem)."""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def get(url, params=None, timeout=None, **kwargs):
+    """
+    GET through the pooled session and the service's circuit breaker. Raises
+    requests.RequestException on failure, including CircuitOpenError when the
+    circuit is open. Without an explicit timeout the read timeout adapts to
+    the service's recent p99 latency.
+    """
+    service = service_for(url)
+    breaker = get_breaker(service)
+    if timeout is None:
+        timeout = (_setting("UPSTREAM_CONNECT_TIMEOUT", 3.05), breaker.timeout())
+
+    def send():
+        with track_upstream(service):
+            return get_session().get(url, params=params, timeout=timeout, **kwargs)
+
+    return breaker.call(send, is_failure=is_server_error)
+
+
+# -------------------------------
+# Concurrent fan-out
+# -------------------------------
+
+def get_executor(pool="request"):
+    """Bounded process-wide thread pool (one of POOL_SIZES) for concurrent upstream calls."""
+    global _executors, _executors_pid
+    pid = os.getpid()
+    if pool not in _executors or _executors_pid != pid:
+        with _session_lock:
+            if _executors_pid != pid:
+                _executors, _executors_pid = {}, pid
+            if pool not in _executors:
+                setting, default = POOL_SIZES[pool]
+                _executors[pool] = ThreadPoolExecutor(
+                    max_workers=_setting(setting, default),
+                    thread_name_prefix=f"upstream-{pool}",
+                )
+    return _executors[pool]
+
+
+def submit(calls, pool="request"):
+    """Start each callable in ``calls`` ({key: fn}) on ``pool``; returns {key: future}."""
+    executor = get_executor(pool)
+    # Each call runs in a copy of the caller's context so its upstream
+    # timings are attributed to the request that started it.
+    return {key: executor.submit(contextvars.copy_context().run, fn) for key, fn in calls.items()}
+
+
+def collect(futures, deadline):
+    """
+    Wait until ``deadline`` (a time.monotonic() value) for the futures and
+    return {key: result} for those that finished successfully. Calls that
+    time out or raise are left out rather than failing the whole batch.
+    """
+    wait(list(futures.values()), timeout=max(0, deadline - time.monotonic()))
+    results = {}
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            print(f"Upstream call '{key}' missed its deadline; skipping.")
+            continue
+        error = future.exception()
+        if error is not None:
+            print(f"Upstream call '{key}' failed: {error}")
+            continue
+        results[key] = future.result()
+    return results
+
+
+def gather(calls, deadline, pool="request"):
+    """Run ``calls`` concurrently and collect whatever finishes before ``deadline``."""
+    return collect(submit(calls, pool), deadline)
@@ -1,26 +1,46 @@
-from django.urls import path
+from django.urls import path, re_path
 from .views import (
     BookSearchView,
     BookDetailView,
+    BookBatchDetailView,
     BookSummaryView,
     HomeBooksView,
+    BecauseYouReadView,
+    RecommendationsView,
+    SimilarBooksView,
     UserBookInteractionView,
     UserLibraryView,
     ReviewListCreateView,
     ReviewDetailView,
     UserFavoritesView,
+    UserExportView,
+    LibraryImportView,
+    LibraryImportStatusView,
 )
 
 urlpatterns = [
     path("search/", BookSearchView.as_view(), name="book-search"),
+    path("details/", BookBatchDetailView.as_view(), name="book-detail-batch"),
     path("details/<str:google_id>/", BookDetailView.as_view(), name="book-detail"),
     path("summary/<str:google_id>/", BookSummaryView.as_view(), name="book-summary"),
     path("home/", HomeBooksView.as_view(), name="home-books"),
+
+    # Recommendation URLs
+    path("because-you-read/<str:google_id>/", BecauseYouReadView.as_view(), name="because-you-read"),
+    path("recommendations/", RecommendationsView.as_view(), name="recommendations"),
+    path("similar/<str:google_id>/", SimilarBooksView.as_view(), name="similar-books"),
     
     # Interaction & Library URLs
     path("interactions/", UserBookInteractionView.as_view(), name="user-interaction"),
     path("my-library/", UserLibraryView.as_view(), name="user-library"),
     path("favorites/", UserFavoritesView.as_view(), name="user-favorites"),
+    re_path(
+        r"^export/(?P<kind>library|reviews)\.(?P<fmt>csv|jsonl)(?P<gz>\.gz)?$",
+        UserExportView.as_view(),
+        name="user-export",
+    ),
+    path("import/", LibraryImportView.as_view(), name="library-import"),
+    path("import/<str:job_id>/", LibraryImportStatusView.as_view(), name="library-import-status"),
     
     # Review URLs
     # FIXED: The URL parameter now correctly uses 'book_id' to match the view.
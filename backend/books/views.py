@@ -1,22 +1,38 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from rest_framework.parsers import FormParser, MultiPartParser
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.shortcuts import get_object_or_404
 from .models import Book, UserBookInteraction, Review
 from .serializers import (
     BookSerializer,
     UserBookInteractionSerializer,
     ReviewSerializer,
+    BOOK_FIELDS,
+    INTERACTION_VALUES,
+    interaction_rows_to_data,
 )
 from .services import (
-    search_google_books,
-    normalize_google_book,
+    search_books,
     get_or_create_book_details,
+    get_or_create_books,
     generate_and_cache_ai_summary,
-    get_genre_top_books,
-    get_recent_books,
-    get_bestsellers,
+    record_book_view,
+    apply_review_rating,
+    get_home_feed,
 )
+from .caching import bump_library_version, library_page_key, library_version
+from .conditional import conditional_response, content_conditional_response, make_etag
+from .export import export_stream
+from .library_import import ImportFormatError, get_import_status, parse_shelf, start_import
+from .recommendations import get_neighbors, get_recommendations
+from .similarity import VECTOR_FIELDS, similar_books
+from .pagination import LibraryCursorPagination, ReviewCursorPagination
 from .permissions import IsOwnerOrReadOnly
 
 # -------------------------------
@@ -33,11 +49,8 @@ class BookSearchView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        data = search_google_books(query)
-        if not data or "items" not in data:
-            return Response({"books": []})
-
-        books = [normalize_google_book(item) for item in data.get("items", [])]
+        # Local full-text index first; Google Books only when recall is too low.
+        books = search_books(query)
         return Response({"books": books})
 
 # -------------------------------
@@ -54,9 +67,49 @@ class BookDetailView(APIView):
         if not book:
             return Response({"error": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
 
+        record_book_view(google_id)
+
+        # The ETag comes from the row's rendered fields, so a 304 skips the serializer.
+        etag = make_etag("book", *(getattr(book, field) for field in BOOK_FIELDS))
         # Pass the database object directly to the serializer.
-        serializer = BookSerializer(book)
-        return Response(serializer.data)
+        return conditional_response(
+            request,
+            etag,
+            lambda: Response(BookSerializer(book).data),
+            public=True,
+            max_age=60 * 60,
+        )
+
+class BookBatchDetailView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        # ?ids=id1,id2,... (or repeated ?ids=) -> details for all of them in one round trip.
+        google_ids = [
+            google_id.strip()
+            for value in request.query_params.getlist("ids")
+            for google_id in value.split(",")
+            if google_id.strip()
+        ]
+        if not google_ids:
+            return Response(
+                {"error": "Query parameter 'ids' is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_ids = getattr(settings, "BOOK_BATCH_MAX_IDS", 50)
+        if len(google_ids) > max_ids:
+            return Response(
+                {"error": f"At most {max_ids} ids per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        books = get_or_create_books(google_ids)
+        found = {book.google_id for book in books}
+        serializer = BookSerializer(books, many=True)
+        return Response({
+            "books": serializer.data,
+            "missing": [google_id for google_id in dict.fromkeys(google_ids) if google_id not in found],
+        })
 
 # -------------------------------
 # AI Summary
@@ -75,12 +128,56 @@ class HomeBooksView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
+        # Upstream fetches run concurrently under one overall deadline.
+        # Each section comes with the version hashed when that very value was
+        # cached; a section that missed the deadline has none, and then no
+        # ETag is sent.
+        feed, versions = get_home_feed(limit=10)
+        etag = make_etag("home", *versions) if versions else None
+        return conditional_response(
+            request,
+            etag,
+            lambda: Response(feed),
+            public=True,
+            max_age=60 * 5,
+        )
+
+# -------------------------------
+# Recommendations (precomputed item-item neighbours)
+# -------------------------------
+def scored_books(pairs):
+    return [dict(BookSerializer(book).data, score=round(score, 4)) for book, score in pairs]
+
+class BecauseYouReadView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, google_id):
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), 20))
+        except ValueError:
+            limit = 10
+        return Response({"books": scored_books(get_neighbors(google_id, limit=limit))})
+
+class SimilarBooksView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, google_id):
+        # Content-based: served from the memory-mapped TF-IDF index.
+        book = Book.objects.filter(google_id=google_id).only(*VECTOR_FIELDS).first()
+        if not book:
+            return Response({"error": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
+        ranked = similar_books(book, limit=10)
+        books = Book.objects.in_bulk([book_id for book_id, _ in ranked])
         return Response({
-            "carousel": get_genre_top_books(limit=10),
-            "recent": get_recent_books(limit=10),
-            "bestsellers": get_bestsellers(limit=10)
+            "books": scored_books((books[book_id], score) for book_id, score in ranked if book_id in books)
         })
 
+class RecommendationsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({"books": scored_books(get_recommendations(request.user))})
+
 # -------------------------------
 # UserBookInteraction
 # -------------------------------
@@ -93,6 +190,7 @@ class UserBookInteractionView(APIView):
         )
         if serializer.is_valid():
             serializer.save(user=request.user)
+            bump_library_version(request.user.pk)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -113,6 +211,7 @@ class UserBookInteractionView(APIView):
         )
         if serializer.is_valid():
             serializer.save()
+            bump_library_version(request.user.pk)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -120,7 +219,16 @@ class UserBookInteractionView(APIView):
 # Reviews
 # -------------------------------
 class ReviewListCreateView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, book_id):
+        # Keyset pagination on (created_at, id): constant cost per page however
+        # many reviews the book has. ?cursor=...&page_size=...
+        reviews = Review.objects.filter(book_id=book_id).select_related("user")
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, book_id):
         # Find the book instance first
@@ -131,7 +239,10 @@ class ReviewListCreateView(APIView):
         )
         if serializer.is_valid():
             # Pass the user and book instances directly to save
-            serializer.save(user=request.user, book=book)
+            with transaction.atomic():
+                review = serializer.save(user=request.user, book=book)
+                apply_review_rating(book.pk, added=review.rating)
+            bump_library_version(request.user.pk)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -139,52 +250,201 @@ class ReviewDetailView(APIView):
     permission_classes = [IsOwnerOrReadOnly]
 
     def get_object(self, review_id):
-        return get_object_or_404(Review, id=review_id)
+        # Locked until the transaction ends, so concurrent edits and deletes of
+        # the same review fold into the book's aggregates one at a time.
+        return get_object_or_404(Review.objects.select_for_update(), id=review_id)
 
     def put(self, request, review_id):
-        review = self.get_object(review_id)
-        self.check_object_permissions(request, review)
-        serializer = ReviewSerializer(
-            review, data=request.data, partial=True, context={"request": request}
-        )
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            review = self.get_object(review_id)
+            self.check_object_permissions(request, review)
+            old_rating = review.rating
+            serializer = ReviewSerializer(
+                review, data=request.data, partial=True, context={"request": request}
+            )
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            review = serializer.save()
+            if review.rating != old_rating:
+                apply_review_rating(review.book_id, added=review.rating, removed=old_rating)
+        bump_library_version(review.user_id)
+        return Response(serializer.data)
 
     def delete(self, request, review_id):
-        review = self.get_object(review_id)
-        self.check_object_permissions(request, review)
-        review.delete()
+        with transaction.atomic():
+            review = self.get_object(review_id)
+            self.check_object_permissions(request, review)
+            deleted, _ = Review.objects.filter(pk=review.pk).delete()
+            if deleted:
+                apply_review_rating(review.book_id, removed=review.rating)
+        bump_library_version(review.user_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 # -------------------------------
 # User Library & Favorites
 # -------------------------------
+def filter_interactions(interactions, request):
+    """
+    Apply the ?status= and ?is_favorite= filters shared by the library views.
+    Returns (queryset, error_response).
+    """
+    book_status = request.query_params.get("status")
+    if book_status:
+        if book_status not in UserBookInteraction.Status.values:
+            return None, Response(
+                {"error": f"status must be one of {', '.join(UserBookInteraction.Status.values)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        interactions = interactions.filter(status=book_status)
+
+    is_favorite = request.query_params.get("is_favorite")
+    if is_favorite:
+        if is_favorite.lower() not in ("true", "false"):
+            return None, Response(
+                {"error": "is_favorite must be true or false."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        interactions = interactions.filter(is_favorite=is_favorite.lower() == "true")
+    return interactions, None
+
+def library_response(request, build):
+    """
+    Serve a library/favorites page from the per-user cache. The user's library
+    version (bumped by interaction, review and Book writes) is part of both the
+    ETag and the cache key, so an unchanged library never touches the database:
+    a matching If-None-Match gets a 304, anything else the cached page.
+
+    Versions bumped on one worker are only seen by the others through a
+    shared cache; without one (CACHE_IS_SHARED off) every request is built
+    and the ETag comes from the page content instead.
+    """
+    if not getattr(settings, "CACHE_IS_SHARED", False):
+        return content_conditional_response(
+            request, lambda: build(request), vary=["Authorization"], private=True, no_cache=True
+        )
+    version = library_version(request.user.pk)
+    etag = make_etag("library", request.user.pk, version, request.get_full_path())
+
+    def cached_build():
+        key = library_page_key(request.user.pk, version, request.build_absolute_uri())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = build(request)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, getattr(settings, "LIBRARY_CACHE_TTL", 60 * 60 * 24))
+        return response
+
+    return conditional_response(
+        request, etag, cached_build, vary=["Authorization"], private=True, no_cache=True
+    )
+
 # FIXED: Solved the N+1 query problem and now uses the serializer.
 class UserLibraryView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # Use select_related('book') to fetch books in a single efficient query.
+        # Unchanged library (same version, same filters/cursor): no database work.
+        return library_response(request, self.build)
+
+    def build(self, request):
+        # Project only the columns we render (one JOIN to Book, no model instances).
         interactions = UserBookInteraction.objects.filter(
             user=request.user
-        ).select_related('book')
+        ).values(*INTERACTION_VALUES)
+        interactions, error = filter_interactions(interactions, request)
+        if error:
+            return error
+
+        # Keyset pagination on id keeps each page's cost flat for heavy users.
+        paginator = LibraryCursorPagination()
+        page = paginator.paginate_queryset(interactions, request, view=self)
 
-        # Use the serializer for clean, reusable data formatting.
-        serializer = UserBookInteractionSerializer(interactions, many=True)
-        return Response({"library": serializer.data})
+        # Fast path: same output as UserBookInteractionSerializer, without per-row serializers.
+        data = interaction_rows_to_data(page, request.user.username)
+        return paginator.get_paginated_response(data, key="library")
 
 # FIXED: Solved the N+1 query problem and now uses the serializer.
 class UserFavoritesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # Also apply select_related('book') here.
+        return library_response(request, self.build)
+
+    def build(self, request):
+        # Same projection as the library view.
         favorites = UserBookInteraction.objects.filter(
             user=request.user, is_favorite=True
-        ).select_related('book')
+        ).values(*INTERACTION_VALUES)
+        favorites, error = filter_interactions(favorites, request)
+        if error:
+            return error
+
+        paginator = LibraryCursorPagination()
+        page = paginator.paginate_queryset(favorites, request, view=self)
+
+        # Same fast path and response structure as the library view.
+        data = interaction_rows_to_data(page, request.user.username)
+        return paginator.get_paginated_response(data, key="favorites")
+
+# -------------------------------
+# Export (library / reviews as CSV or JSONL)
+# -------------------------------
+class UserExportView(APIView):
+    """
+    GET export/library.csv, export/reviews.jsonl, ... (append .gz for gzip).
+    Streamed from a server-side cursor, so heavy users don't tie up a
+    worker's memory.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, kind, fmt, gz=None):
+        chunks, content_type = export_stream(request.user, kind, fmt, compress=bool(gz))
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        filename = f"{request.user.username}-{kind}.{fmt}{gz or ''}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["Cache-Control"] = "private, no-store"
+        return response
+
+# -------------------------------
+# Import (Goodreads / StoryGraph CSV export)
+# -------------------------------
+class LibraryImportView(APIView):
+    """
+    POST import/ with the export CSV as multipart "file". The shelf is added
+    in the background; poll the returned status URL for progress.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"error": "Upload the CSV export as 'file'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_bytes = getattr(settings, "LIBRARY_IMPORT_MAX_BYTES", 10 * 1024 * 1024)
+        if upload.size > max_bytes:
+            return Response(
+                {"error": f"The file is larger than {max_bytes // (1024 * 1024)} MB."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        try:
+            source, entries = parse_shelf(upload, getattr(settings, "LIBRARY_IMPORT_MAX_ROWS", 20000))
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = start_import(request.user, source, entries)
+        location = reverse("v1:library-import-status", args=[job["job_id"]])
+        return Response(job, status=status.HTTP_202_ACCEPTED, headers={"Location": location})
+
+
+class LibraryImportStatusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-        # Reuse the same serializer for a consistent response structure.
-        serializer = UserBookInteractionSerializer(favorites, many=True)
-        return Response({"favorites": serializer.data})
\ No newline at end of file
+    def get(self, request, job_id):
+        job = get_import_status(request.user.pk, job_id)
+        if job is None:
+            return Response({"error": "Import not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job)
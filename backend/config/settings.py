@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 # Load environment variables from .env
 load_dotenv()
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'books.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -164,6 +166,15 @@ ACCOUNT_EMAIL_VERIFICATION = 'none'
 # Google Books API
 GOOGLE_BOOKS_API_KEY = os.getenv("GOOGLE_BOOKS_API_KEY")
 
+# Book search answers from the local index and only calls Google Books
+# when fewer than this many local matches are found.
+BOOK_SEARCH_MIN_LOCAL_RESULTS = int(os.getenv("BOOK_SEARCH_MIN_LOCAL_RESULTS", "5"))
+
+# Batch details endpoint: max ids per request and deadline (seconds) for
+# fetching the ones we don't have yet.
+BOOK_BATCH_MAX_IDS = int(os.getenv("BOOK_BATCH_MAX_IDS", "50"))
+BOOK_BATCH_DEADLINE = float(os.getenv("BOOK_BATCH_DEADLINE", "8"))
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -172,6 +183,88 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 AUTH_USER_MODEL = 'users.CustomUser'
 
 NYT_BOOKS_API_KEY = os.getenv("NYT_API_KEY")
+
+# Cache. Locks, single-flight results and per-user library versions only hold
+# across gunicorn workers with a shared backend, so use Redis when REDIS_URL
+# is set; otherwise Django's per-process LocMem. CACHE_IS_SHARED says which:
+# without a shared cache, library pages aren't cached (a bump on one worker
+# would go unseen by the others).
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+CACHE_IS_SHARED = os.getenv("CACHE_IS_SHARED", "True" if REDIS_URL else "False").lower() == "true"
+
+# Host-local state shared by the workers: the upstream response cache and the
+# similarity index. It has to outlive deploys, so it never defaults into the
+# checkout: production must set STATE_DIR (or both paths below); development
+# falls back to ~/.cache/bookdb.
+STATE_DIR = os.getenv("STATE_DIR")
+if not STATE_DIR and not DEBUG and not (os.getenv("UPSTREAM_CACHE_PATH") and os.getenv("SIMILARITY_INDEX_DIR")):
+    raise ImproperlyConfigured("Set STATE_DIR to a persistent directory outside the release.")
+STATE_DIR = Path(STATE_DIR or Path.home() / ".cache" / "bookdb")
+
+# Content-based similar-books index (books/similarity.py), rebuilt with
+# `manage.py build_similarity_index`. Lives next to the upstream cache.
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", str(STATE_DIR / "similarity"))
+# Books added since the last build are kept in a delta log that every worker
+# holds in memory; past this many entries the index is rebuilt in the background.
+SIMILARITY_DELTA_MAX = int(os.getenv("SIMILARITY_DELTA_MAX", "10000"))
+
+# Run books/tasks.py background work inline (useful in tests).
+BOOKS_RUN_TASKS_INLINE = os.getenv("BOOKS_RUN_TASKS_INLINE", "False").lower() == "true"
+# Background tasks (refreshes, write-through upserts) waiting per worker
+# before new ones are dropped.
+BOOKS_BACKGROUND_MAX_PENDING = int(os.getenv("BOOKS_BACKGROUND_MAX_PENDING", "500"))
+
+# How long (seconds) concurrent requests wait for another worker's in-flight
+# Google fetch / Gemini summary before giving up (books/caching.single_flight).
+# Coalescing spans processes only when CACHES uses a shared backend.
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", "15"))
+
+# Shared upstream HTTP client (books/upstream.py): keep-alive pools per host,
+# bounded retries with jittered backoff on 429/5xx (never waiting longer than
+# UPSTREAM_BACKOFF_MAX, whatever Retry-After says; read timeouts aren't
+# retried), separate timeouts.
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_FACTOR = float(os.getenv("UPSTREAM_BACKOFF_FACTOR", "0.3"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "20"))
+# Thread pool used to fan out upstream calls, and the overall home feed deadline (seconds).
+UPSTREAM_MAX_WORKERS = int(os.getenv("UPSTREAM_MAX_WORKERS", "8"))
+# Separate, smaller pool for upstream lookups made by background jobs (imports).
+UPSTREAM_BACKGROUND_MAX_WORKERS = int(os.getenv("UPSTREAM_BACKGROUND_MAX_WORKERS", "2"))
+HOME_FEED_DEADLINE = float(os.getenv("HOME_FEED_DEADLINE", "8"))
+
+# Persistent upstream response cache (books/response_cache.py). A SQLite file
+# shared by every worker on the host, under STATE_DIR so it survives deploys.
+# Bounded by LRU eviction.
+UPSTREAM_CACHE_ENABLED = os.getenv("UPSTREAM_CACHE_ENABLED", "True").lower() == "true"
+UPSTREAM_CACHE_PATH = os.getenv("UPSTREAM_CACHE_PATH", str(STATE_DIR / "upstream_cache.sqlite3"))
+UPSTREAM_CACHE_MAX_ENTRIES = int(os.getenv("UPSTREAM_CACHE_MAX_ENTRIES", "50000"))
+UPSTREAM_CACHE_TTL_SEARCH = 60 * 60 * 24
+UPSTREAM_CACHE_TTL_VOLUME = 60 * 60 * 24 * 7
+UPSTREAM_CACHE_TTL_NYT = 60 * 60 * 6
+# How long expired upstream responses are kept as a fallback during outages.
+UPSTREAM_CACHE_STALE_GRACE = 60 * 60 * 24 * 7
+
+# Per-upstream circuit breakers (books/circuit.py): open once at least
+# CIRCUIT_FAILURE_RATE of the last CIRCUIT_WINDOW calls failed (with at least
+# CIRCUIT_MIN_CALLS seen), probe again after CIRCUIT_OPEN_SECONDS. Read
+# timeouts adapt to CIRCUIT_TIMEOUT_MULTIPLIER x the observed p99, bounded by
+# CIRCUIT_MIN_TIMEOUT and UPSTREAM_READ_TIMEOUT (GEMINI_TIMEOUT for Gemini).
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "50"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_TIMEOUT_MULTIPLIER = float(os.getenv("CIRCUIT_TIMEOUT_MULTIPLIER", "2.0"))
+CIRCUIT_MIN_TIMEOUT = float(os.getenv("CIRCUIT_MIN_TIMEOUT", "1.0"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
  
 REST_AUTH = {
     'USE_JWT': True,
@@ -186,8 +279,46 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.AllowAny", 
     ),
+    # orjson-backed JSON (books/renderers.py); falls back to stdlib json
+    # when orjson isn't installed.
+    "DEFAULT_RENDERER_CLASSES": (
+        "books.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "books.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
+# Default page size for GET books/<book_id>/reviews/ (override with ?page_size=).
+REVIEWS_PAGE_SIZE = int(os.getenv("REVIEWS_PAGE_SIZE", "20"))
+# Default page size for my-library/ and favorites/.
+LIBRARY_PAGE_SIZE = int(os.getenv("LIBRARY_PAGE_SIZE", "50"))
+# Cached library pages are keyed by version, so this only bounds how long
+# superseded pages linger.
+LIBRARY_CACHE_TTL = 60 * 60 * 24
+# Rows fetched per server-side cursor round trip by the export/ endpoints.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+# Goodreads/StoryGraph imports (import/): upload limits, rows resolved and
+# written per chunk, and how long each chunk may wait on Google lookups.
+LIBRARY_IMPORT_MAX_BYTES = 10 * 1024 * 1024
+LIBRARY_IMPORT_MAX_ROWS = int(os.getenv("LIBRARY_IMPORT_MAX_ROWS", "20000"))
+LIBRARY_IMPORT_CHUNK_SIZE = 200
+LIBRARY_IMPORT_RESOLVE_DEADLINE = 30
+# Book detail views are buffered per worker and added to Book.view_count at
+# most once per this many seconds.
+BOOK_VIEW_FLUSH_INTERVAL = float(os.getenv("BOOK_VIEW_FLUSH_INTERVAL", "30"))
+
+# Request instrumentation: Server-Timing header on every response, and the
+# /metrics endpoint (404 unless enabled). Scrapers present METRICS_TOKEN as a
+# bearer token when it is set; otherwise only METRICS_ALLOWED_IPS may scrape.
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', str(DEBUG)).lower() == 'true'
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
 # Twilio SMS settings
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
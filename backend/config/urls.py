@@ -1,9 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from books.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
+    path('metrics', metrics_view, name='metrics'),
+
     path('api/v1/', include(('books.urls', 'books'), namespace='v1')),
 
     path('api/v1/users/', include(('users.urls', 'users'), namespace='users')),
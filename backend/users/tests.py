@@ -1,3 +1,99 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from books.fakes import seed_catalog
+from books.testing import QueryBudgetMixin
+
+# -------------------------------
+# Query budgets per endpoint
+# -------------------------------
+# Same idea as books.tests: one request against seeded data, failing on more
+# SQL statements or fetched rows than budgeted.
+
+PASSWORD = "bench-password"
+
+
+@override_settings(
+    # Hashing cost is irrelevant to query counts; keep the suite fast.
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    METRICS_SERVER_TIMING=False,
+)
+class UserEndpointBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, cls.users = seed_catalog(books=300, users=30, library_size=50, password=PASSWORD)
+        cls.user = cls.users[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_register(self):
+        payload = {
+            "username": "newreader",
+            "email": "newreader@example.com",
+            "phone": "5550001111",
+            "password": "A-strong-pass-123",
+            "password2": "A-strong-pass-123",
+        }
+        # Uniqueness checks for username and phone, then the INSERT ... RETURNING.
+        with self.assertQueryBudget(queries=3, rows=1):
+            response = self.client.post("/api/v1/users/register/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_me(self):
+        self.login()
+        with self.assertQueryBudget(queries=1, rows=1):
+            response = self.client.get("/api/v1/users/me/")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_me_update(self):
+        self.login()
+        with self.assertQueryBudget(queries=3, rows=1):
+            response = self.client.put("/api/v1/users/me/", {"first_name": "Ada", "phone": "5550002222"}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_change_password(self):
+        self.login()
+        payload = {"old_password": PASSWORD, "new_password": "Another-strong-pass-456"}
+        with self.assertQueryBudget(queries=2, rows=1):
+            response = self.client.put("/api/v1/users/me/change-password/", payload, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_my_favorites(self):
+        self.login()
+        with self.assertQueryBudget(queries=1, rows=1):
+            response = self.client.get("/api/v1/users/me/favorites/")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_send_otp(self):
+        with mock.patch("users.views.Client") as twilio:
+            twilio.return_value.messages.create.return_value.sid = "SM-test"
+            with self.assertQueryBudget(queries=0, rows=0):
+                response = self.client.post("/api/v1/users/send-otp/", {"phone": "5550003333"}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_verify_otp_existing_user(self):
+        cache.set(f"otp_{self.user.username}", "123456")
+        # User lookup, then the refresh token's blacklist bookkeeping row.
+        with self.assertQueryBudget(queries=2, rows=2):
+            response = self.client.post(
+                "/api/v1/users/verify-otp/", {"phone": self.user.username, "otp": "123456"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_verify_otp_new_user(self):
+        cache.set("otp_5550004444", "654321")
+        with self.assertQueryBudget(queries=3, rows=2):
+            response = self.client.post(
+                "/api/v1/users/verify-otp/", {"phone": "5550004444", "otp": "654321"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.content)